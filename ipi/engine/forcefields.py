@@ -179,6 +179,23 @@ class ForceField(dobject):
                 r["status"] = "Done"
                 r["t_finished"] = time.time()
 
+    def status(self):
+        """Returns a summary of the state of the force field.
+
+        Used to monitor the simulation, so it is called from a different
+        thread than the one queueing and releasing the requests.
+
+        Returns:
+           A dictionary giving the total number of requests and the number
+           of queued, running and completed requests.
+        """
+
+        nstatus = {}
+        for r in list(self.requests):
+            nstatus[r["status"]] = nstatus.get(r["status"], 0) + 1
+        return {"requests": sum(nstatus.values()), "queued": nstatus.get("Queued", 0),
+                "running": nstatus.get("Running", 0), "done": nstatus.get("Done", 0)}
+
     def _poll_loop(self):
         """Polling loop.
 
@@ -285,6 +302,13 @@ class FFSocket(ForceField):
 
         self.socket.poll()
 
+    def status(self):
+        """Returns a summary of the state of the requests and of the clients."""
+
+        rstatus = super(FFSocket, self).status()
+        rstatus.update(self.socket.status())
+        return rstatus
+
     def run(self):
         """Spawns a new thread."""
 
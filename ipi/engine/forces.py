@@ -67,6 +67,8 @@ class ForceBead(dobject):
        vir: An array containing the components of the virial tensor in upper
           triangular form, not divided by the volume. Depends on ufvx.
        request: a handle to the request that has been filed by the FF object
+       twait: The total time spent waiting for the results of the force
+          calculations.
     """
 
     def __init__(self):
@@ -78,6 +80,7 @@ class ForceBead(dobject):
         self._threadlock = threading.Lock()
         self.request = None
         self._getallcount = 0
+        self.twait = 0.0
 
     def bind(self, atoms, cell, ff):
         """Binds atoms, cell and a forcefield template to the ForceBead object.
@@ -166,6 +169,7 @@ class ForceBead(dobject):
             self.request = self.queue()
 
         # sleeps until the request has been evaluated
+        twait = -time.time()
         while self.request["status"] != "Done":
             if self.request["status"] == "Exit" or softexit.triggered:
                 # now, this is tricky. we are stuck here and we cannot return meaningful results.
@@ -177,6 +181,7 @@ class ForceBead(dobject):
                     time.sleep(self.ff.latencyt)
                 sys.exit()
             time.sleep(self.ff.latency)
+        twait += time.time()
 
         # print diagnostics about the elapsed time
         info("# forcefield %s evaluated in %f (queue) and %f (dispatched) sec." % (self.ff.name, self.request["t_finished"] - self.request["t_queued"], self.request["t_finished"] - self.request["t_dispatched"]), verbosity.debug)
@@ -188,6 +193,7 @@ class ForceBead(dobject):
         # reduce the reservation count (and wait for all calls to return)
         with self._threadlock:
             self._getallcount -= 1
+            self.twait += twait
 
         # releases just once, but wait for all requests to be complete
         if self._getallcount == 0:
@@ -693,6 +699,11 @@ class Forces(dobject):
         if len(self.mforces) != len(refforce.mforces):
             raise ValueError("Cannot copy forces between objects with different numbers of components")
 
+        # updates the (contracted) positions seen by each component first, as
+        # this would otherwise taint the copied forces again
+        for mb in self.mbeads:
+            mb.q
+
         for k in xrange(len(self.mforces)):
             mreff = refforce.mforces[k]
             mself = self.mforces[k]
@@ -702,6 +713,8 @@ class Forces(dobject):
                 dfkbref = dd(mreff._forces[b])
                 dfkbself = dd(mself._forces[b])
                 dfkbself.ufvx.set(deepcopy(dfkbref.ufvx._value), manual=False)
+                # marks the copied value as up to date, tainting the quantities depending on it
+                dfkbself.ufvx.taint(taintme=False)
 
     def run(self):
         """Makes the socket start looking for driver codes.
@@ -714,6 +727,21 @@ class Forces(dobject):
         for ff in self.mforces:
             ff.run()
 
+    def wait_time(self):
+        """Returns the total time spent waiting for the results of the force
+        calculations of all the replicas, for all the force components."""
+
+        twait = 0.0
+        done = set()
+        for fc in self.mforces:
+            fc = getattr(fc, "bf", fc)  # scaled components share the base component beads
+            if id(fc) in done:
+                continue
+            done.add(id(fc))
+            for fb in getattr(fc, "_forces", []):
+                twait += fb.twait
+        return twait
+
     def stop(self):
         """Makes the socket stop looking for driver codes.
 
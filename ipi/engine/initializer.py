@@ -20,6 +20,7 @@ from ipi.engine.ensembles import Ensemble
 from ipi.engine.motion import Motion
 from ipi.utils.io import read_file
 from ipi.utils.io.inputs.io_xml import xml_parse_file
+from ipi.utils.io.inputs.io_binary import binary_file, is_binary
 from ipi.utils.depend import dobject
 from ipi.utils.units import Constants, unit_to_internal
 from ipi.utils.nmtransform import nm_rescale
@@ -141,13 +142,18 @@ def init_chk(filename):
        checkpoint file.
     """
 
-    # reads configuration from a checkpoint file
-    rfile = open(filename, "r")
-    xmlchk = xml_parse_file(rfile)  # Parses the file.
-
     from ipi.inputs.simulation import InputSimulation
     simchk = InputSimulation()
-    simchk.parse(xmlchk.fields[0][1])
+
+    # reads configuration from a checkpoint file
+    if is_binary(filename):
+        bfile = binary_file(filename)
+        with bfile:
+            simchk.parse(bfile.xml.fields[0][1])
+    else:
+        rfile = open(filename, "r")
+        xmlchk = xml_parse_file(rfile, lowmem=True)  # Parses the file.
+        simchk.parse(xmlchk.fields[0][1])
     sim = simchk.fetch()
     if len(sim.syslist) > 1:
         warning("Restart from checkpoint with " + str(len(sim.syslist)) + " systems will fetch data from the first system.")
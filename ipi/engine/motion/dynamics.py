@@ -152,7 +152,7 @@ class Dynamics(Motion):
         dpipe(dself.deltat, dd(self.nm).dt)
 
         # depending on the kind, the thermostat might work in the normal mode or the bead representation.
-        self.thermostat.bind(beads=self.beads, nm=self.nm, prng=prng, fixdof=fixdof)
+        self.thermostat.bind(beads=self.beads, nm=self.nm, prng=prng.stream("thermostat"), fixdof=fixdof)
 
         dbarostat = dd(self.barostat)
         dpipe(dself.ntemp, dbarostat.temp)
@@ -161,7 +161,7 @@ class Dynamics(Motion):
         dpipe(dd(self.ensemble).stressext, dbarostat.stressext)
 
         #!TODO the barostat should also be connected to the bias stress
-        self.barostat.bind(beads, nm, cell, bforce, prng=prng, fixdof=fixdof, bias=ens.bias)
+        self.barostat.bind(beads, nm, cell, bforce, prng=prng.stream("barostat"), fixdof=fixdof, bias=ens.bias)
 
         self.ensemble.add_econs(dd(self.thermostat).ethermo)
         self.ensemble.add_econs(dd(self.barostat).ebaro)
@@ -212,6 +212,7 @@ class DummyIntegrator(dobject):
         self.barostat = motion.barostat
         self.fixcom = motion.fixcom
         self.fixatoms = motion.fixatoms
+        self.ptime = self.qtime = self.ttime = self.btime = 0.0
         dself = dd(self)
         dself.dt = dd(motion).dt
         if motion.enstype == "mts": self.nmts = motion.nmts
@@ -254,12 +255,51 @@ class NVEIntegrator(DummyIntegrator):
         ptime: The time taken in updating the velocities.
         qtime: The time taken in updating the positions.
         ttime: The time taken in applying the thermostat steps.
+        btime: The time taken in applying the thermostat of the barostat.
 
     Depend objects:
         econs: Conserved energy quantity. Depends on the bead kinetic and
             potential energy, and the spring potential energy.
     """
 
+    def bind(self, motion):
+        """Binds the integrator, and precomputes the quantities needed to
+        apply the constraints on the momenta.
+
+        Args:
+            motion: The motion object the integrator is bound to.
+        """
+
+        super(NVEIntegrator, self).bind(motion)
+        dself = dd(self)
+        dbeads = dd(self.beads)
+
+        # indices of the degrees of freedom of the fixed atoms
+        fixatoms = np.asarray(self.fixatoms, int)
+        self.fixdof = (3 * fixatoms[:, np.newaxis] + np.arange(3)).flatten()
+
+        dself.mtot = depend_value(name="mtot", func=self.get_mtot, dependencies=[dbeads.m])
+        dself.comweights = depend_array(name="comweights", value=np.zeros(3 * self.beads.natoms),
+                                        func=self.get_comweights, dependencies=[dbeads.m3, dself.mtot])
+        dself.fixm3 = depend_array(name="fixm3", value=np.zeros(len(self.fixdof)),
+                                   func=self.get_fixm3, dependencies=[dbeads.m3])
+
+    def get_mtot(self):
+        """Calculates the total mass of the system."""
+
+        return dstrip(self.beads.m).sum()
+
+    def get_comweights(self):
+        """Calculates the fraction of the centre of mass momentum to be removed
+        from each degree of freedom of each bead."""
+
+        return dstrip(self.beads.m3)[0] / (self.beads.nbeads * self.mtot)
+
+    def get_fixm3(self):
+        """Gets the masses of the degrees of freedom of the fixed atoms."""
+
+        return dstrip(self.beads.m3)[0][self.fixdof]
+
     def pconstraints(self):
         """This removes the centre of mass contribution to the kinetic energy.
 
@@ -271,36 +311,24 @@ class NVEIntegrator(DummyIntegrator):
 
         If there is a choice of thermostats, the thermostat
         connected to the centroid is chosen.
+
+        The momenta of all the beads are updated at once, using the weights
+        and the indices of the fixed degrees of freedom computed at bind time.
         """
 
         if (self.fixcom):
-            pcom = np.zeros(3, float)
-
-            na3 = self.beads.natoms * 3
             nb = self.beads.nbeads
-            p = dstrip(self.beads.p)
-            m = dstrip(self.beads.m3)[:, 0:na3:3]
-            M = self.beads[0].M
-
-            for i in range(3):
-                pcom[i] = p[:, i:na3:3].sum()
+            pcom = dstrip(self.beads.p).reshape((-1, 3)).sum(axis=0)
 
-            self.ensemble.eens += np.dot(pcom, pcom) / (2.0 * M * nb)
+            self.ensemble.eens += np.dot(pcom, pcom) / (2.0 * self.mtot * nb)
 
             # subtracts COM velocity
-            pcom *= 1.0 / (nb * M)
-            for i in range(3):
-                self.beads.p[:, i:na3:3] -= m * pcom[i]
-
-        if len(self.fixatoms) > 0:
-            for bp in self.beads.p:
-                m = dstrip(self.beads.m)
-                self.ensemble.eens += 0.5 * np.dot(bp[self.fixatoms * 3], bp[self.fixatoms * 3] / m[self.fixatoms])
-                self.ensemble.eens += 0.5 * np.dot(bp[self.fixatoms * 3 + 1], bp[self.fixatoms * 3 + 1] / m[self.fixatoms])
-                self.ensemble.eens += 0.5 * np.dot(bp[self.fixatoms * 3 + 2], bp[self.fixatoms * 3 + 2] / m[self.fixatoms])
-                bp[self.fixatoms * 3] = 0.0
-                bp[self.fixatoms * 3 + 1] = 0.0
-                bp[self.fixatoms * 3 + 2] = 0.0
+            self.beads.p -= dstrip(self.comweights) * np.tile(pcom, self.beads.natoms)
+
+        if len(self.fixdof) > 0:
+            pfix = dstrip(self.beads.p)[:, self.fixdof]
+            self.ensemble.eens += 0.5 * np.sum(pfix * pfix / dstrip(self.fixm3))
+            self.beads.p[:, self.fixdof] = 0.0
 
     def pstep(self):
         """Velocity Verlet momenta propagator."""
@@ -401,7 +429,11 @@ class NPTIntegrator(NVTIntegrator):
 
         self.ttime = -time.time()
         self.thermostat.step()
+        self.ttime += time.time()
+        self.btime = -time.time()
         self.barostat.thermostat.step()
+        self.btime += time.time()
+        self.ttime -= time.time()
         self.pconstraints()
         self.ttime += time.time()
 
@@ -422,7 +454,11 @@ class NPTIntegrator(NVTIntegrator):
 
         self.ttime -= time.time()
         self.thermostat.step()
+        self.ttime += time.time()
+        self.btime -= time.time()
         self.barostat.thermostat.step()
+        self.btime += time.time()
+        self.ttime -= time.time()
         self.pconstraints()
         self.ttime += time.time()
 
@@ -459,7 +495,11 @@ class NSTIntegrator(NVTIntegrator):
 
         self.ttime = -time.time()
         self.thermostat.step()
+        self.ttime += time.time()
+        self.btime = -time.time()
         self.barostat.thermostat.step()
+        self.btime += time.time()
+        self.ttime -= time.time()
         self.pconstraints()
         self.ttime += time.time()
 
@@ -478,8 +518,10 @@ class NSTIntegrator(NVTIntegrator):
         self.pconstraints()
         self.ptime += time.time()
 
-        self.ttime -= time.time()
+        self.btime -= time.time()
         self.barostat.thermostat.step()
+        self.btime += time.time()
+        self.ttime -= time.time()
         self.thermostat.step()
         self.pconstraints()
         self.ttime += time.time()
@@ -17,7 +17,7 @@ import time
 from ipi.engine.motion import Motion
 from ipi.utils.depend import dstrip, dobject
 from ipi.utils.softexit import softexit
-from ipi.utils.mintools import min_brent, BFGS, BFGSTRM, L_BFGS
+from ipi.utils.mintools import min_brent, min_parallel, BFGS, BFGSTRM, L_BFGS, FIRE, hessian_exp, hessian_lindh
 from ipi.utils.messages import verbosity, info
 
 
@@ -40,6 +40,8 @@ class GeopMotion(Motion):
         step: initial step size for steepest descent and conjugate gradient
         adaptive: T/F adaptive step size for steepest descent and conjugate
                 gradient}
+        ls_parallel: number of trial steps of the line search that are
+                evaluated at once, as concurrent force calculations
         tolerances:
         {energy: change in energy tolerance for ending minimization
         force: force/change in force tolerance foe ending minimization
@@ -48,6 +50,19 @@ class GeopMotion(Motion):
         scale_lbfgs: Scale choice for the initial hessian.
         qlist_lbfgs: list of previous positions (x_n+1 - x_n) for L-BFGS. Number of entries = corrections_lbfgs
         glist_lbfgs: list of previous gradients (g_n+1 - g_n) for L-BFGS. Number of entries = corrections_lbfgs
+        precond_lbfgs: model used to precondition L-BFGS: none, exp, lindh or hessian
+        precond_options:
+        {mu: energy scale of the exponential model
+        A: decay with distance of the exponential model
+        stab: stabilization, as a fraction of the average diagonal element of the Hessian}
+        hessian_lbfgs: Hessian used as preconditioner if precond_lbfgs is hessian
+        fire_options:
+        {dt: current time step for FIRE
+        dtmax: maximum time step
+        alpha: current mixing parameter
+        nsteps: number of steps since the last uphill move
+        maxstep: maximum displacement of an atom in one step}
+        v_fire: velocities for FIRE
     """
 
     def __init__(self, fixcom=False, fixatoms=None,
@@ -61,11 +76,17 @@ class GeopMotion(Motion):
                  hessian_trm=np.eye(0, 0, 0, float),
                  tr_trm=np.zeros(0, float),
                  ls_options={"tolerance": 1, "iter": 100, "step": 1e-3, "adaptive": 1.0},
+                 ls_parallel=1,
                  tolerances={"energy": 1e-7, "force": 1e-4, "position": 1e-4},
                  corrections_lbfgs=5,
                  scale_lbfgs=1,
                  qlist_lbfgs=np.zeros(0, float),
-                 glist_lbfgs=np.zeros(0, float)):
+                 glist_lbfgs=np.zeros(0, float),
+                 precond_lbfgs="none",
+                 precond_options={"mu": 0.1, "A": 3.0, "stab": 0.1},
+                 hessian_lbfgs=np.zeros(0, float),
+                 fire_options={"dt": 41.341373, "dtmax": 413.41373, "alpha": 0.1, "nsteps": 0, "maxstep": 0.5},
+                 v_fire=np.zeros(0, float)):
         """Initialises GeopMotion.
 
         Args:
@@ -84,6 +105,7 @@ class GeopMotion(Motion):
         self.big_step = biggest_step
         self.tolerances = tolerances
         self.ls_options = ls_options
+        self.ls_parallel = ls_parallel
 
         #
         self.old_x = old_pos
@@ -104,11 +126,18 @@ class GeopMotion(Motion):
             self.scale = scale_lbfgs
             self.qlist = qlist_lbfgs
             self.glist = glist_lbfgs
+            self.precond = precond_lbfgs
+            self.precond_options = precond_options
+            self.precond_hessian = hessian_lbfgs
             self.optimizer = LBFGSOptimizer()
         elif self.mode == "sd":
             self.optimizer = SDOptimizer()
         elif self.mode == "cg":
             self.optimizer = CGOptimizer()
+        elif self.mode == "fire":
+            self.fire_options = fire_options
+            self.v = v_fire
+            self.optimizer = FIREOptimizer()
         else:
             self.optimizer = DummyOptimizer()
 
@@ -131,43 +160,133 @@ class GeopMotion(Motion):
         self.optimizer.step(step)
 
 
-class LineMapper(object):
+class BatchMapper(object):
 
-    """Creation of the one-dimensional function that will be minimized.
-    Used in steepest descent and conjugate gradient minimizers.
+    """Base class of the functions that are minimized, which can compute
+    the energy and gradient at several points at once. Each point is computed
+    with a different copy of the beads and forces objects, so all the force
+    calculations are queued together and can be dispatched to different
+    clients. The results are cached, so that the point eventually chosen by
+    the line search can be selected without computing it again.
 
     Attributes:
-        x0: initial position
-        d: move direction
+        dbeads:   copy of the bead object, holding the last point computed or selected
+        dcell:    copy of the cell object
+        dforces:  copy of the forces object, bound to dbeads
+        fcount:   number of force evaluations
+        replicas: list of the (beads, forces) copies used to compute the points
+        cache:    list of (x, energy, gradient, beads, forces) for the points
+                  of the last batch, and for the lowest energy point of the previous ones
     """
 
     def __init__(self):
-        self.x0 = self.d = None
         self.fcount = 0
+        self.replicas = []
+        self.cache = []
 
     def bind(self, dumop):
         self.dbeads = dumop.beads.copy()
         self.dcell = dumop.cell.copy()
         self.dforces = dumop.forces.copy(self.dbeads, self.dcell)
+        self.replicas = [(self.dbeads, self.dforces)]
+        self.cache = []
+
+    def position(self, x):
+        """returns the bead positions corresponding to x"""
+
+        return x
+
+    def prepare(self, beads, forces):
+        """called after the positions have been set, before the forces are requested"""
+
+        pass
+
+    def evaluate(self, beads, forces):
+        """returns energy and gradient from the forces computed at the positions in beads"""
+
+        raise NotImplementedError("Mappers must define how energy and gradient are computed")
+
+    def __call__(self, x):
+        """computes energy and gradient for optimization step"""
+
+        for cx, e, g, beads, forces in self.cache:
+            if np.array_equal(cx, x):
+                self.dbeads, self.dforces = beads, forces
+                return e, g
+
+        # the forces held by the current copy are about to change
+        self.cache = [c for c in self.cache if c[3] is not self.dbeads]
+        self.fcount += 1
+        self.dbeads.q = self.position(x)
+        self.prepare(self.dbeads, self.dforces)
+        return self.evaluate(self.dbeads, self.dforces)
+
+    def batch(self, xs):
+        """computes energy and gradient at several points, queuing all the
+        force calculations at once. The last point is left in dbeads."""
+
+        # keeps the copy holding the lowest energy found so far
+        keep = []
+        if len(self.cache) > 0:
+            keep = [min(self.cache, key=lambda c: c[1])]
+        free = [r for r in self.replicas if len(keep) == 0 or r[0] is not keep[0][3]]
+        while len(free) < len(xs):
+            beads = self.dbeads.copy()
+            forces = self.dforces.copy(beads, self.dcell)
+            self.replicas.append((beads, forces))
+            free.append((beads, forces))
+
+        self.fcount += len(xs)
+        for x, (beads, forces) in zip(xs, free):
+            beads.q = self.position(x)
+            self.prepare(beads, forces)
+            forces.queue()
+
+        self.cache = keep
+        fdfs = []
+        for x, (beads, forces) in zip(xs, free):
+            e, g = self.evaluate(beads, forces)
+            self.cache.append((x, e, g, beads, forces))
+            fdfs.append((e, g))
+        self.dbeads, self.dforces = free[len(xs) - 1]
+        return fdfs
+
+
+class LineMapper(BatchMapper):
+
+    """Creation of the one-dimensional function that will be minimized.
+    Used in steepest descent and conjugate gradient minimizers.
+
+    Attributes:
+        x0: initial position
+        d: move direction
+    """
+
+    def __init__(self):
+        super(LineMapper, self).__init__()
+        self.x0 = self.d = None
 
     def set_dir(self, x0, mdir):
         self.x0 = x0.copy()
         self.d = mdir.copy() / np.sqrt(np.dot(mdir.flatten(), mdir.flatten()))
         if self.x0.shape != self.d.shape:
             raise ValueError("Incompatible shape of initial value and displacement direction")
+        self.cache = []
 
-    def __call__(self, x):
-        """ computes energy and gradient for optimization step
-            determines new position (x0+d*x)"""
+    def position(self, x):
+        """ determines new position (x0+d*x)"""
 
-        self.fcount += 1
-        self.dbeads.q = self.x0 + self.d * x
-        e = self.dforces.pot   # Energy
-        g = - np.dot(dstrip(self.dforces.f).flatten(), self.d.flatten())   # Gradient
+        return self.x0 + self.d * x
+
+    def evaluate(self, beads, forces):
+        """ computes energy and gradient for optimization step"""
+
+        e = forces.pot   # Energy
+        g = - np.dot(dstrip(forces.f).flatten(), self.d.flatten())   # Gradient
         return e, g
 
 
-class GradientMapper(object):
+class GradientMapper(BatchMapper):
 
     """Creation of the multi-dimensional function that will be minimized.
     Used in the BFGS and L-BFGS minimizers.
@@ -178,22 +297,11 @@ class GradientMapper(object):
         dforces: copy of the forces object
     """
 
-    def __init__(self):
-        self.fcount = 0
-        pass
-
-    def bind(self, dumop):
-        self.dbeads = dumop.beads.copy()
-        self.dcell = dumop.cell.copy()
-        self.dforces = dumop.forces.copy(self.dbeads, self.dcell)
-
-    def __call__(self, x):
+    def evaluate(self, beads, forces):
         """computes energy and gradient for optimization step"""
 
-        self.fcount += 1
-        self.dbeads.q = x
-        e = self.dforces.pot   # Energy
-        g = -self.dforces.f   # Gradient
+        e = forces.pot   # Energy
+        g = -forces.f   # Gradient
         return e, g
 
 
@@ -223,6 +331,9 @@ class DummyOptimizer(dobject):
 
         self.mode = geop.mode
         self.tolerances = geop.tolerances
+        self.ls_parallel = geop.ls_parallel
+        if self.ls_parallel < 1:
+            raise ValueError("The number of parallel line search points must be at least one")
 
         # Check for very tight tolerances
 
@@ -263,6 +374,20 @@ class DummyOptimizer(dobject):
         self.old_f = geop.old_f
         self.d = geop.d
 
+    def line_search(self, u0, du0):
+        """ Minimizes the energy along the direction set in the LineMapper,
+            evaluating several trial steps at once if ls_parallel > 1. """
+
+        if self.ls_parallel > 1:
+            min_parallel(self.lm, fdf0=(u0, du0), x0=0.0,
+                         tol=self.ls_options["tolerance"] * self.tolerances["energy"],
+                         itmax=self.ls_options["iter"], init_step=self.ls_options["step"],
+                         npoints=self.ls_parallel)
+        else:
+            min_brent(self.lm, fdf0=(u0, du0), x0=0.0,
+                      tol=self.ls_options["tolerance"] * self.tolerances["energy"],
+                      itmax=self.ls_options["iter"], init_step=self.ls_options["step"])
+
     def exitstep(self, fx, u0, x):
         """ Exits the simulation step. Computes time, checks for convergence. """
 
@@ -352,7 +477,8 @@ class BFGSOptimizer(DummyOptimizer):
         # Do one iteration of BFGS
         # The invhessian and the directions are updated inside.
         BFGS(self.old_x, self.d, self.gm, fdf0, self.invhessian, self.big_step,
-             self.ls_options["tolerance"] * self.tolerances["energy"], self.ls_options["iter"])
+             self.ls_options["tolerance"] * self.tolerances["energy"], self.ls_options["iter"],
+             self.ls_parallel)
 
         info("   Number of force calls: %d" % (self.gm.fcount)); self.gm.fcount = 0
         # Update positions and forces
@@ -456,6 +582,43 @@ class LBFGSOptimizer(DummyOptimizer):
 
         self.scale = geop.scale
 
+        self.precond = geop.precond
+        self.precond_options = geop.precond_options
+        self.precond_hessian = geop.precond_hessian
+        if self.precond == "hessian":
+            nat3 = 3 * self.beads.natoms
+            if self.precond_hessian.size != nat3 * nat3:
+                raise ValueError("Hessian size does not match system size")
+            self.precond_hessian.shape = (nat3, nat3)
+        self.qprecond = None
+        self.ihessian = None
+
+    def update_precond(self):
+        """ Returns a function that applies the inverse of the model Hessian
+            to a vector, or None if L-BFGS is not preconditioned. The model is
+            built again only when the atoms have moved appreciably. """
+
+        if self.precond == "none":
+            return None
+
+        qc = dstrip(self.beads.qc).copy()
+        if self.qprecond is None or (self.precond != "hessian" and np.amax(np.absolute(qc - self.qprecond)) > 0.1):
+            info(" @GEOP: Building the %s preconditioner" % self.precond, verbosity.debug)
+            h = dstrip(self.cell.h)
+            if self.precond == "exp":
+                hessian = hessian_exp(qc, h, self.precond_options["mu"], self.precond_options["A"], self.precond_options["stab"])
+            elif self.precond == "lindh":
+                hessian = hessian_lindh(qc, h, self.beads.names, self.precond_options["stab"])
+            else:
+                # e.g. from a phonons calculation, which has zero modes for the translations
+                hessian = 0.5 * (self.precond_hessian + self.precond_hessian.T)
+                hessian = hessian + np.eye(len(hessian)) * self.precond_options["stab"] * np.trace(hessian) / len(hessian)
+            self.ihessian = np.linalg.inv(hessian)
+            self.qprecond = qc
+
+        nbeads = self.beads.nbeads
+        return lambda v: np.dot(v.reshape((nbeads, -1)), self.ihessian).reshape(v.shape)
+
     def step(self, step=None):
         """ Does one simulation time step
             Attributes:
@@ -466,9 +629,13 @@ class LBFGSOptimizer(DummyOptimizer):
 
         info("\nMD STEP %d" % step, verbosity.debug)
 
+        precond = self.update_precond()
         if step == 0:
             info(" @GEOP: Initializing L-BFGS", verbosity.debug)
-            self.d += dstrip(self.forces.f) / np.sqrt(np.dot(self.forces.f.flatten(), self.forces.f.flatten()))
+            if precond is None:
+                self.d += dstrip(self.forces.f) / np.sqrt(np.dot(self.forces.f.flatten(), self.forces.f.flatten()))
+            else:
+                self.d += precond(dstrip(self.forces.f))
 
         self.old_x[:] = self.beads.q
         self.old_u[:] = self.forces.pot
@@ -485,7 +652,7 @@ class LBFGSOptimizer(DummyOptimizer):
         # We update everything  within L_BFGS (and all other calls).
         L_BFGS(self.old_x, self.d, self.gm, self.qlist, self.glist,
                fdf0, self.big_step, self.ls_options["tolerance"] * self.tolerances["energy"],
-               self.ls_options["iter"], self.corrections, self.scale, step)
+               self.ls_options["iter"], self.corrections, self.scale, step, self.ls_parallel, precond)
 
         info("   Number of force calls: %d" % (self.gm.fcount)); self.gm.fcount = 0
 
@@ -540,13 +707,11 @@ class SDOptimizer(DummyOptimizer):
         self.lm.set_dir(dstrip(self.beads.q), dq1_unit)
 
         # Reuse initial value since we have energy and forces already
-        u0, du0 = (self.forces.pot.copy(), np.dot(dstrip(self.forces.f.flatten()), dq1_unit.flatten()))
+        u0, du0 = (self.forces.pot.copy(), -np.dot(dstrip(self.forces.f.flatten()), dq1_unit.flatten()))
 
         # Do one SD iteration; return positions and energy
         #(x, fx,dfx) = min_brent(self.lm, fdf0=(u0, du0), x0=0.0,  #DELETE
-        min_brent(self.lm, fdf0=(u0, du0), x0=0.0,
-                  tol=self.ls_options["tolerance"] * self.tolerances["energy"],
-                  itmax=self.ls_options["iter"], init_step=self.ls_options["step"])
+        self.line_search(u0, du0)
         info("   Number of force calls: %d" % (self.lm.fcount)); self.lm.fcount = 0
 
         # Update positions and forces
@@ -625,12 +790,10 @@ class CGOptimizer(DummyOptimizer):
         self.lm.set_dir(dstrip(self.beads.q), dq1_unit)
 
         # Reuse initial value since we have energy and forces already
-        u0, du0 = (self.forces.pot.copy(), np.dot(dstrip(self.forces.f.flatten()), dq1_unit.flatten()))
+        u0, du0 = (self.forces.pot.copy(), -np.dot(dstrip(self.forces.f.flatten()), dq1_unit.flatten()))
 
         # Do one CG iteration; return positions and energy
-        min_brent(self.lm, fdf0=(u0, du0), x0=0.0,
-                  tol=self.ls_options["tolerance"] * self.tolerances["energy"],
-                  itmax=self.ls_options["iter"], init_step=self.ls_options["step"])
+        self.line_search(u0, du0)
         info("   Number of force calls: %d" % (self.lm.fcount)); self.lm.fcount = 0
 
         # Update positions and forces
@@ -647,3 +810,52 @@ class CGOptimizer(DummyOptimizer):
         # Exit simulation step
         d_x_max = np.amax(np.absolute(d_x))
         self.exitstep(self.forces.pot, u0, d_x_max)
+
+
+class FIREOptimizer(DummyOptimizer):
+    """
+    FIRE (fast inertial relaxation engine) minimization: damped dynamics
+    in which the velocity is mixed with the direction of the force, and
+    the time step grows while the energy goes down. Needs a single force
+    evaluation per step, and no line search.
+    """
+
+    def bind(self, geop):
+        # call bind function from DummyOptimizer
+        super(FIREOptimizer, self).bind(geop)
+
+        if geop.v.size != self.beads.q.size:
+            if geop.v.size == 0:
+                geop.v = np.zeros((self.beads.nbeads, 3 * self.beads.natoms), float)
+            else:
+                raise ValueError("FIRE velocity size does not match system size")
+
+        self.v = geop.v
+        self.fire_options = geop.fire_options
+
+    def step(self, step=None):
+        """ Does one simulation time step
+            Attributes:
+            qtime: The time taken in updating the positions.
+        """
+
+        self.qtime = -time.time()
+        info("\nMD STEP %d" % step, verbosity.debug)
+
+        self.old_x[:] = self.beads.q
+        self.old_u[:] = self.forces.pot
+        self.old_f[:] = self.forces.f
+
+        if len(self.fixatoms) > 0:
+            for dqb in self.old_f:
+                dqb[self.fixatoms * 3] = 0.0
+                dqb[self.fixatoms * 3 + 1] = 0.0
+                dqb[self.fixatoms * 3 + 2] = 0.0
+
+        # Do one FIRE step; the velocities and the time step are updated inside
+        self.beads.q = FIRE(self.old_x, self.old_f, self.v, dstrip(self.beads.m3), self.fire_options)
+        info("   FIRE time step %e, mixing %e" % (self.fire_options["dt"], self.fire_options["alpha"]), verbosity.debug)
+
+        # Exit simulation step
+        d_x_max = np.amax(np.absolute(np.subtract(self.beads.q, self.old_x)))
+        self.exitstep(self.forces.pot, self.old_u, d_x_max)
@@ -10,11 +10,13 @@ Algorithms implemented by Michele Ceriotti and Bejamin Helfrecht, 2015
 
 import numpy as np
 import time
+from copy import deepcopy
 
 from ipi.engine.motion import Motion
+from ipi.engine.motion.geop import BatchMapper
 from ipi.utils.depend import *
 from ipi.utils.softexit import softexit
-from ipi.utils.mintools import L_BFGS, min_brent_neb
+from ipi.utils.mintools import L_BFGS, min_brent_neb, FIRE
 from ipi.utils.messages import verbosity, info
 
 
@@ -27,11 +29,135 @@ __all__ = ['NEBMover']
 #       NEBLineMover AND THE RELEVANT BLOCKS IN NEBMover. IF THESE OPTIONS ARE DESIRED,
 #       THE INFRASTRUCTURE IS PRESENT BUT MUST BE DEBUGGED AND MADE CONSISTENT WITH
 #       THAT PRESENT IN NEBBFGSMover (TO REMOVE REMAINING ERRORS IN COMPUTATION).
-#       CLIMBING IMAGE AND VARIABLE SPRING CONSTANTS HAVE NOT YET BEEN IMPLEMENTED, BUT
-#       THE GENERIC INFRASTRUCTURE IS PRESENT (SEE COMMENTED BLOCKS IN NEBLineMover AND
-#       NEBBFGSMover). REQUIRES REARRANGEMENT AND DEBUGGING.
-#       THIS NEB IMPLEMENTATION USES THE 'IMPROVED TANGENTS' OF HENKELMAN AND JONSSON, 2000.
-#       THE 'OLD IMPLEMENTATION' IS PRESERVED IN COMMENTS
+#       THIS NEB IMPLEMENTATION USES THE 'IMPROVED TANGENTS' OF HENKELMAN AND JONSSON, 2000,
+#       AND THE CLIMBING IMAGE AND VARIABLE SPRING CONSTANTS OF HENKELMAN, UBERUAGA AND
+#       JONSSON, 2000. THE NEB FORCES ARE COMPUTED FOR ALL THE IMAGES AT ONCE IN neb_forces.
+
+
+def neb_tangents(bq, be):
+    """Computes the normalized tangents to the path at the inner images.
+
+    Uses the 'improved tangents' of Henkelman and Jonsson, 2000: the tangent
+    points towards the neighbouring image with the higher energy, and is a
+    weighted average of the two directions at the extrema of the energy
+    along the path. If the energies are all equal, the bisector of the
+    two directions is used.
+
+    Args:
+        bq: An array of shape (nimages, 3*natoms) giving the positions of the images.
+        be: An array giving the energies of the images.
+
+    Returns:
+        An array with the same shape as bq, holding the unit tangents. The
+        tangents of the end images are zero.
+    """
+
+    btau = np.zeros(bq.shape, float)
+    if len(bq) < 3:
+        return btau
+
+    d1 = bq[1:-1] - bq[:-2]   # tau minus
+    d2 = bq[2:] - bq[1:-1]    # tau plus
+    em = be[:-2]
+    e0 = be[1:-1]
+    ep = be[2:]
+
+    # mixes the two directions at the extrema of the energy
+    dmax = np.maximum(np.absolute(ep - e0), np.absolute(em - e0))[:, np.newaxis]
+    dmin = np.minimum(np.absolute(ep - e0), np.absolute(em - e0))[:, np.newaxis]
+    tau = np.where((ep > em)[:, np.newaxis], d2 * dmax + d1 * dmin, d2 * dmin + d1 * dmax)
+
+    # energy increasing or decreasing monotonically along the path
+    tau = np.where(((ep > e0) & (e0 > em))[:, np.newaxis], d2, tau)
+    tau = np.where(((ep < e0) & (e0 < em))[:, np.newaxis], d1, tau)
+
+    # falls back to the bisector when the energies are all equal
+    norm = np.sqrt((tau ** 2).sum(axis=1))
+    flat = norm == 0.0
+    if flat.any():
+        bis = d1 / np.sqrt((d1 ** 2).sum(axis=1))[:, np.newaxis] + d2 / np.sqrt((d2 ** 2).sum(axis=1))[:, np.newaxis]
+        tau[flat] = bis[flat]
+        norm[flat] = np.sqrt((bis[flat] ** 2).sum(axis=1))
+
+    btau[1:-1] = tau / norm[:, np.newaxis]
+    return btau
+
+
+def spring_constants(be, spring):
+    """Computes the spring constants between consecutive images.
+
+    With variable springs, the springs are stiffer close to the top of the
+    barrier, so that the images gather where the resolution is most useful.
+    The constant of the spring between images i-1 and i decreases linearly
+    from kappamax at the highest image to kappamin when the higher of the
+    two images is at the energy of the higher end of the path.
+
+    Args:
+        be: An array giving the energies of the images.
+        spring: A dictionary with the keys 'varsprings', 'kappa', 'kappamax'
+            and 'kappamin', as in NEBMover.
+
+    Returns:
+        An array of length nimages - 1, giving the spring constant of each
+        segment of the path.
+    """
+
+    kappa = np.zeros(len(be) - 1, float)
+    if not spring["varsprings"]:
+        kappa.fill(spring["kappa"])
+        return kappa
+
+    ei = np.maximum(be[1:], be[:-1])
+    emax = np.amax(be)
+    eref = max(be[0], be[-1])
+    kappa.fill(spring["kappamin"])
+    if emax > eref:
+        high = ei > eref
+        kappa[high] = spring["kappamax"] - (spring["kappamax"] - spring["kappamin"]) * (emax - ei[high]) / (emax - eref)
+    return kappa
+
+
+def neb_forces(bq, bf, be, kappa, climb=False):
+    """Computes the NEB forces on all the images at once.
+
+    The component of the physical forces along the tangent is replaced by
+    the spring forces, which only act along the tangent. With climbing
+    image, the highest inner image feels no spring force, and the component
+    of its physical force along the tangent is inverted, so that it climbs
+    up to the saddle point along the path. The forces on the end images are
+    returned unchanged.
+
+    Args:
+        bq: An array of shape (nimages, 3*natoms) giving the positions of the images.
+        bf: An array with the same shape as bq giving the physical forces.
+        be: An array giving the energies of the images.
+        kappa: An array giving the spring constants of the segments of the
+            path, as returned by spring_constants.
+        climb: A boolean giving whether the highest image should climb.
+
+    Returns:
+        A tuple giving the array of NEB forces, with the same shape as bf,
+        and the index of the climbing image, or None.
+    """
+
+    nebf = bf.copy()
+    if len(bq) < 3:
+        return nebf, None
+
+    btau = neb_tangents(bq, be)[1:-1]
+    fpar = (bf[1:-1] * btau).sum(axis=1)
+
+    # spring forces, along the tangents
+    dl = np.sqrt(((bq[1:] - bq[:-1]) ** 2).sum(axis=1))
+    fspring = kappa[1:] * dl[1:] - kappa[:-1] * dl[:-1]
+
+    nebf[1:-1] += (fspring - fpar)[:, np.newaxis] * btau
+
+    imax = None
+    if climb:
+        imax = np.argmax(be[1:-1]) + 1
+        nebf[imax] = bf[imax] - 2.0 * fpar[imax - 1] * btau[imax - 1]
+    return nebf, imax
 
 
 class NEBLineMover(object):
@@ -40,14 +166,16 @@ class NEBLineMover(object):
     Attributes:
         x0: initial position
         d: move direction
-        kappa: spring constants
+        spring: spring constant options, as in NEBMover
+        climb: flag for climbing image NEB
         first: flag indicating first iteration of simulation
     """
 
     def __init__(self):
         self.x0 = None
         self.d = None
-        self.kappa = None
+        self.spring = None
+        self.climb = False
         self.first = True
 
     def bind(self, ens):
@@ -68,102 +196,16 @@ class NEBLineMover(object):
             self.dbeads.q = self.x0 + self.d * x
 
         # List of atom/bead positions
-        bq = dstrip(self.dbeads.q).copy()
+        bq = dstrip(self.dbeads.q)
 
         # List of forces
-        bf = dstrip(self.dforces.f).copy()
+        bf = dstrip(self.dforces.f)
 
         # List of bead energies
-        be = dstrip(self.dforces.pots).copy()
-
-        # Number of images
-        nimg = self.dbeads.nbeads
-
-        # Number of atoms
-        nat = self.dbeads.natoms
-
-        kappa = np.zeros(nimg)
-
-        # Get tangents, end images are distinct, fixed, pre-relaxed configurations
-        btau = np.zeros((nimg, 3 * nat), float)
-        for ii in range(1, nimg - 1):
-            d1 = bq[ii] - bq[ii - 1]   # tau mius
-            d2 = bq[ii + 1] - bq[ii]   # tau plus
-
-            # "Old" implementation of NEB
-            btau[ii] = d1 / np.linalg.norm(d1) + d2 / np.linalg.norm(d2)
-            btau[ii] *= 1.0 / np.linalg.norm(btau)
-
-#            # Energy of images: (ii+1) < (ii) < (ii-1)
-#            if (be[ii + 1] < be[ii]) and (be[ii] < be[ii - 1]):
-#                btau[ii] = d2
-#
-#            # Energy of images (ii-1) < (ii) < (ii+1)
-#            elif (be[ii - 1] < be[ii]) and (be[ii] < be[ii + 1]):
-#                btau[ii] = d1
-#
-#            # Energy of image (ii) is a minimum or maximum
-#            else:
-#                maxpot = max(be[ii + 1] - be[ii], be[ii - 1], be[ii])
-#                minpot = min(be[ii + 1] - be[ii], be[ii - 1], be[ii])
-#
-#                if be[ii + 1] < be[ii - 1]:
-#                    btau[ii] = d1 * minpot + d2 * maxpot
-#
-#                elif be[ii - 1] < be[ii + 1]:
-#                    btau[ii] = d1 * maxpot + d2 * minpot
-#
-#                else:
-#                    print "Error in NEB tangents: Energy of images are equal"
-#
-#            btau[ii] *= 1.0 / np.linalg.norm(btau)
-
-        # if mode == "variablesprings": #TODO: input option for variable spring mode
-
-
-#        if mode == "ci":
-#
-#        # Climbing NEB term. Choose highest energy bead after 5 (arbitrary) iterations
-#            if step >= 5:
-#                imax = np.argmax(be)
-#                bf[imax] = bf[imax] - 2 * np.dot(bf[imax], btau[imax]) * btau[imax]
-#
-#                # Determine variable spring constants
-#                #kappa = np.zeros(nimg)
-#                #ei = np.zeros(nimg)
-#                #emax = np.amax(be)
-#                #eref = max(be[0], be[nimg])
-#                #kappamax = self.kappa_max
-#                #kappamin = self.kappa_min #TODO: input options for max and min spring constant
-#                #deltakappa = kappamax - kappamin
-#                #for ii in range(1, nimg - 1):
-#                #    ei[ii] = max(be[ii], be[ii - 1])
-#                #    if ei[j] > eref:
-#                #        kappa[ii] = kappamax - deltakappa * ((emax - ei[ii]) / (emax - eref))
-#                #    else:
-#                #        kappa[ii] = kappamin
-#
-#        else:
-#            kappa.fill(self.kappa)
-#
-#
-#            # get perpendicular forces
-#            for ii in range(1, nimg - 1):
-#                bf[ii] = bf[ii] - np.dot(bf[ii], btau[ii]) * btau[ii]
-#
-#            # adds the spring forces
-#            for ii in range(1, nimg - 1):
-#                bf[ii] += kappa[ii] * btau[ii] * np.dot(btau[ii], (bq[ii + 1] + bq[ii - 1] - 2 * bq[ii]))
-
-        kappa.fill(self.kappa)
-
-        # get perpendicular forces
-        for ii in range(1, nimg - 1):
-            bf[ii] = bf[ii] - np.dot(bf[ii], btau[ii]) * btau[ii]
-
-        # adds the spring forces
-        for ii in range(1, nimg - 1):
-            bf[ii] += kappa[ii] * btau[ii] * np.dot(btau[ii], (bq[ii + 1] + bq[ii - 1] - 2 * bq[ii]))
+        be = dstrip(self.dforces.pots)
+
+        # NEB forces, for all the images at once
+        bf = neb_forces(bq, bf, be, spring_constants(be, self.spring), self.climb)[0]
 
         # For first iteration, move in direction of the force
         if self.first is True:
@@ -179,127 +221,130 @@ class NEBLineMover(object):
         return linefunc
 
 
-class NEBBFGSMover(object):
+class NEBBFGSMover(BatchMapper):
     """Creation of the multi-dimensional function that will be minimized
 
     Attributes:
         x0: initial position
         d: move direction
         xold: position from previous step
-        kappa: spring constants"""
+        spring: spring constant options, as in NEBMover
+        climb: flag for climbing image NEB
+        adaptive: flag for reusing the forces of the images that did not move
+        frozen: flags for the images that are not moved
+        qfrozen: positions at which the frozen images are held
+        nebforce: NEB forces on all the images, including the frozen ones,
+            from the last evaluation
+        qcache: positions of the images for which the results of the force
+            calculations are stored
+        ufvxcache: for each image, the results of each force component"""
 
     def __init__(self):
+        super(NEBBFGSMover, self).__init__()
         self.x0 = None
         self.d = None
         self.xold = None
-        self.kappa = None
-
-    def bind(self, ens):
-        self.dbeads = ens.beads.copy()
-        self.dcell = ens.cell.copy()
-        self.dforces = ens.forces.copy(self.dbeads, self.dcell)
-
-    def __call__(self, x):
+        self.spring = None
+        self.climb = False
+        self.adaptive = False
+        self.frozen = None
+        self.qfrozen = None
+        self.nebforce = None
+        self.qcache = None
+        self.ufvxcache = None
+
+    def position(self, x):
+        """returns the bead positions, holding the frozen images in place"""
+
+        if self.frozen is None or not self.frozen.any():
+            return x
+        q = dstrip(x).copy()
+        q[self.frozen] = self.qfrozen[self.frozen]
+        return q
+
+    def prepare(self, beads, forces):
+        """Restores the results of the force calculations for the images that
+        did not move since they were computed, so they are not sent to the
+        clients again."""
+
+        if not self.adaptive or self.qcache is None:
+            return
+
+        bq = dstrip(beads.q)
+        same = [b for b in xrange(beads.nbeads) if np.array_equal(bq[b], self.qcache[b])]
+        if len(same) == 0:
+            return
+
+        # updates the positions seen by each force component first, as this
+        # would otherwise taint the restored results again
+        for mb in forces.mbeads:
+            mb.q
+        for b in same:
+            for k, mf in enumerate(forces.mforces):
+                ufvx = dd(mf._forces[b]).ufvx
+                ufvx.set(deepcopy(self.ufvxcache[b][k]), manual=False)
+                # marks the restored value as up to date, tainting the quantities depending on it
+                ufvx.taint(taintme=False)
+        info(" @NEB: Reusing the forces of %d images out of %d" % (len(same), beads.nbeads), verbosity.debug)
+
+    def store(self, beads, forces):
+        """Stores the results of the force calculations for all the images."""
+
+        self.qcache = dstrip(beads.q).copy()
+        self.ufvxcache = [[deepcopy(dd(mf._forces[b]).ufvx._value) for mf in forces.mforces]
+                          for b in xrange(beads.nbeads)]
+
+    def evaluate(self, beads, forces):
 
         # Bead positions
-        self.dbeads.q = x
-        bq = dstrip(self.dbeads.q).copy()
+        bq = dstrip(beads.q)
 
         # Forces
-        bf = dstrip(self.dforces.f).copy()
+        bf = dstrip(forces.f)
 
         # Bead energies
-        be = dstrip(self.dforces.pots).copy()
+        be = dstrip(forces.pots)
 
-        # Number of beads
-        nimg = self.dbeads.nbeads
+        if self.adaptive:
+            self.store(beads, forces)
 
-        # Number of atoms
-        nat = self.dbeads.natoms
+        # NEB forces, for all the images at once. End images are distinct,
+        # fixed, pre-relaxed configurations
+        bf, imax = neb_forces(bq, bf, be, spring_constants(be, self.spring), self.climb)
+        if imax is not None:
+            info(" @NEB: Climbing image is %d" % imax, verbosity.debug)
 
-        # Array for sping constants
-        kappa = np.zeros(nimg)
+        # Return forces and modulus of gradient. Frozen images do not move
+        self.nebforce = bf
+        g = -bf
+        if self.frozen is not None:
+            g[self.frozen] = 0.0
+        e = np.linalg.norm(g)   # self.dforces.pot # 0.0
+        return e, g
 
-        # get tangents, end images are distinct, fixed, pre-relaxed configurations
-        btau = np.zeros((nimg, 3 * nat), float)
-        for ii in range(1, nimg - 1):
-            d1 = bq[ii] - bq[ii - 1]   # tau minus
-            d2 = bq[ii + 1] - bq[ii]   # tau plus
+    def freeze(self, beads, forces, tol):
+        """Freezes the inner images whose NEB force is below tolerance, and
+        releases the frozen images whose NEB force rose above it, since the
+        last evaluation, because their neighbours moved.
 
-            # Old implementation of NEB tangents
-            #btau[ii] = d1 / np.linalg.norm(d1) + d2 / np.linalg.norm(d2)
-            #btau[ii] *= 1.0 / np.linalg.norm(btau)
+        Returns the energy and gradient at the positions in beads, with the
+        new set of frozen images.
+        """
 
-            # Energy of images: (ii+1) < (ii) < (ii-1)
-            if (be[ii + 1] < be[ii]) and (be[ii] < be[ii - 1]):
-                btau[ii] = d1
+        self.evaluate(beads, forces)
+        fmax = np.amax(np.absolute(self.nebforce), axis=1)
+        frozen = np.zeros(len(fmax), bool)
+        frozen[1:-1] = fmax[1:-1] <= tol
+        if self.frozen is None or (frozen != self.frozen).any():
+            info(" @NEB: %d images out of %d are frozen" % (frozen.sum(), len(frozen)), verbosity.medium)
+            # the function being minimized has changed
+            self.cache = []
+        self.frozen = frozen
+        self.qfrozen = dstrip(beads.q).copy()
 
-            # Energy of images (ii-1) < (ii) < (ii+1)
-            elif (be[ii - 1] < be[ii]) and (be[ii] < be[ii + 1]):
-                btau[ii] = d2
-
-            # Energy of image (ii) is a minimum or maximum
-            else:
-                maxpot = max(abs(be[ii + 1] - be[ii]), abs(be[ii - 1] - be[ii]))
-                minpot = min(abs(be[ii + 1] - be[ii]), abs(be[ii - 1] - be[ii]))
-
-                if be[ii + 1] < be[ii - 1]:
-                    btau[ii] = d2 * minpot + d1 * maxpot
-
-                elif be[ii - 1] < be[ii + 1]:
-                    btau[ii] = d2 * maxpot + d1 * minpot
-
-                else:
-                    print "Error in NEB tangents: Energy of images are equal"
-
-            btau[ii] *= 1.0 / np.linalg.norm(btau)
-
-        # if mode == "variablesprings":
-
-
-#        if mode == "ci":
-#
-#        # Climbing NEB term. Choose highest energy bead after 5 (arbitrary) iterations
-#            if step >= 5:
-#                imax = np.argmax(be)
-#                bf[imax] = bf[imax] - 2 * np.dot(bf[imax], btau[imax]) * btau[imax]
-#
-#                # Determine variable spring constants
-#                #kappa = np.zeros(nimg)
-#                #ei = np.zeros(nimg)
-#                #emax = np.amax(be)
-#                #eref = max(be[0], be[nimg])
-#                #kappamax = self.spring["kappa_max"]
-#                #kappamin = self.spring["kappa_min"]
-#                #deltakappa = kappamax - kappamin
-#                #for ii in range(1, nimg - 1):
-#                #    ei[ii] = max(be[ii], be[ii - 1])
-#                #    if ei[j] > eref:
-#                #        kappa[ii] = kappamax - deltakappa * ((emax - ei[ii]) / (emax - eref))
-#                #    else:
-#                #        kappa[ii] = kappamin
-#
-#        else:
-#            kappa.fill(self.kappa)
-#
-        # Array of spring constants; all are equal
-        kappa.fill(self.kappa)
-
-        # Get perpendicular forces
-        for ii in range(1, nimg - 1):
-            bf[ii] = bf[ii] - np.dot(bf[ii], btau[ii]) * btau[ii]
-
-        # Adds the spring forces
-        for ii in range(1, nimg - 1):
-
-            # Old implementation
-            #bf[ii] += kappa[ii] * btau[ii] * np.dot(btau[ii], (bq[ii + 1] + bq[ii - 1] - 2 * bq[ii]))
-            bf[ii] += kappa[ii] * (np.linalg.norm(bq[ii + 1] - bq[ii]) - np.linalg.norm(bq[ii] - bq[ii - 1])) * btau[ii]
-
-        # Return forces and modulus of gradient
-        g = -bf
-        e = np.linalg.norm(g)   # self.dforces.pot # 0.0
-        return e, g
+        g = -self.nebforce
+        g[self.frozen] = 0.0
+        return np.linalg.norm(g), g
 
 
 class NEBMover(Motion):
@@ -316,6 +361,8 @@ class NEBMover(Motion):
             iter: maximum iterations for line search per MD step
             step: initial step size for SD/CG
             adaptive: flag for adaptive step size
+        ls_parallel: number of step lengths of the L-BFGS line search that are
+            evaluated at once, as concurrent force calculations
         tolerances:
             energy: tolerance on change in energy for exiting minimization
             force: tolerance on force/change in force for exiting minimization
@@ -327,9 +374,18 @@ class NEBMover(Motion):
         spring:
             varsprings: T/F for variable spring constants
             kappa: single spring constant if varsprings is F
-            kappamax: max spring constant if varsprings is T *** NOT YET IMPLEMENTED ***
-            kappamin: min spring constant if varsprings is T *** NOT YET IMPLEMENTED ***
-        climb: flag for climbing image NEB *** NOT YET IMPLEMENTED ***
+            kappamax: max spring constant if varsprings is T
+            kappamin: min spring constant if varsprings is T
+        climb: flag for climbing image NEB
+        freeze: flag for freezing the images whose NEB force is below the
+            force tolerance, reusing their forces instead of computing them again
+        fire_options:
+            dt: current time step for FIRE
+            dtmax: maximum time step
+            alpha: current mixing parameter
+            nsteps: number of steps since the last uphill move
+            maxstep: maximum displacement of an atom in one step
+        v_fire: velocities of the images for FIRE
     """
 
     def __init__(self, fixcom=False, fixatoms=None,
@@ -339,6 +395,7 @@ class NEBMover(Motion):
                  old_direction=np.zeros(0, float),
                  invhessian_bfgs=np.eye(0),
                  ls_options={"tolerance": 1e-5, "iter": 100.0, "step": 1e-3, "adaptive": 1.0},
+                 ls_parallel=1,
                  tolerances={"energy": 1e-5, "force": 1e-5, "position": 1e-5},
                  corrections_lbfgs=5,
                  qlist_lbfgs=np.zeros(0, float),
@@ -346,7 +403,10 @@ class NEBMover(Motion):
                  endpoints=True,
                  spring={"varsprings": False, "kappa": 1.0, "kappamax": 1.5, "kappamin": 0.5},
                  scale_lbfgs=2,
-                 climb=False):
+                 climb=False,
+                 freeze=False,
+                 fire_options={"dt": 41.341373, "dtmax": 413.41373, "alpha": 0.1, "nsteps": 0, "maxstep": 0.5},
+                 v_fire=np.zeros(0, float)):
         """Initialises NEBMover.
 
         Args:
@@ -358,6 +418,7 @@ class NEBMover(Motion):
 
         # Optimization options
         self.ls_options = ls_options
+        self.ls_parallel = ls_parallel
         self.tolerances = tolerances
         self.mode = mode
         self.big_step = biggest_step
@@ -370,7 +431,10 @@ class NEBMover(Motion):
         self.endpoints = endpoints
         self.spring = spring
         self.climb = climb
+        self.freeze = freeze
         self.scale = scale_lbfgs
+        self.fire_options = fire_options
+        self.v = v_fire
 
         self.neblm = NEBLineMover()
         self.nebbfgsm = NEBBFGSMover()
@@ -378,6 +442,8 @@ class NEBMover(Motion):
     def bind(self, ens, beads, nm, cell, bforce, prng):
 
         super(NEBMover, self).bind(ens, beads, nm, cell, bforce, prng)
+        if self.ls_parallel < 1:
+            raise ValueError("The number of parallel line search points must be at least one")
         if self.old_f.shape != beads.q.shape:
             if self.old_f.shape == (0,):
                 self.old_f = np.zeros(beads.q.shape, float)
@@ -388,6 +454,11 @@ class NEBMover(Motion):
                 self.old_d = np.zeros(beads.q.shape, float)
             else:
                 raise ValueError("Conjugate gradient direction size does not match system size")
+        if self.v.shape != beads.q.shape:
+            if self.v.size == 0:
+                self.v = np.zeros(beads.q.shape, float)
+            else:
+                raise ValueError("FIRE velocity size does not match system size")
         if self.invhessian.size != (beads.q.size * beads.q.size):
             if self.invhessian.size == 0:
                 self.invhessian = np.eye(beads.q.flatten().size, beads.q.flatten().size, 0, float)
@@ -397,14 +468,22 @@ class NEBMover(Motion):
         self.neblm.bind(self)
         self.nebbfgsm.bind(self)
 
+        if self.freeze:
+            if self.mode not in ["lbfgs", "fire"]:
+                raise ValueError("Freezing converged images is only implemented for the L-BFGS and FIRE NEB optimizers")
+            for mf in self.forces.mforces:
+                if mf.nbeads != beads.nbeads:
+                    raise ValueError("Freezing converged images is not compatible with ring polymer contraction")
+            self.nebbfgsm.adaptive = True
+
     def step(self, step=None):
         """Does one simulation time step."""
 
         info("\nMD STEP %d" % step, verbosity.debug)
 
-        # Fetch spring constants
-        self.nebbfgsm.kappa = self.spring["kappa"]
-        self.neblm.kappa = self.spring["kappa"]
+        # Fetch spring constants and climbing image options
+        self.nebbfgsm.spring = self.neblm.spring = self.spring
+        self.nebbfgsm.climb = self.neblm.climb = self.climb
 
         self.ptime = self.ttime = 0
         self.qtime = -time.time()
@@ -428,6 +507,11 @@ class NEBMover(Motion):
             else:
                 fx, nebgrad = self.nebbfgsm(self.beads.q)
 
+            if self.freeze:
+                fx, nebgrad = self.nebbfgsm.freeze(self.nebbfgsm.dbeads, self.nebbfgsm.dforces, self.tolerances["force"])
+                if step == 0:
+                    self.nebbfgsm.d = -nebgrad
+
             # Intial gradient and gradient modulus
             u0, du0 = (fx, nebgrad)
 
@@ -440,7 +524,10 @@ class NEBMover(Motion):
             L_BFGS(self.beads.q, self.nebbfgsm.d, self.nebbfgsm, self.qlist, self.glist,
                    fdf0=(u0, du0), big_step=self.big_step, tol=self.ls_options["tolerance"],
                    itmax=self.ls_options["iter"],
-                   m=self.corrections, scale=self.scale, k=step)
+                   m=self.corrections, scale=self.scale, k=step, npoints=self.ls_parallel)
+
+            if self.freeze:
+                self.nebbfgsm.d[self.nebbfgsm.frozen] = 0.0
 
             info(" @GEOP: Updated position list", verbosity.debug)
             info(" @GEOP: Updated gradient list", verbosity.debug)
@@ -455,6 +542,38 @@ class NEBMover(Motion):
 
             info(" @GEOP: Updated bead positions", verbosity.debug)
 
+        elif self.mode == "fire":
+
+            # FIRE minimization. The NEB forces are obtained directly from the
+            # forces on the beads, so each step needs a single force evaluation
+            if self.freeze:
+                fx, nebgrad = self.nebbfgsm.freeze(self.beads, self.forces, self.tolerances["force"])
+                self.v[self.nebbfgsm.frozen] = 0.0
+            else:
+                fx, nebgrad = self.nebbfgsm.evaluate(self.beads, self.forces)
+            nebforce = -nebgrad
+
+            # End images are fixed
+            nebforce[0] = 0.0
+            nebforce[-1] = 0.0
+            self.old_f[:] = nebforce
+
+            fmax = np.amax(np.absolute(nebforce))
+            if fmax <= self.tolerances["force"]:
+                self.qtime += time.time()
+                softexit.trigger("Geometry optimization converged. Exiting simulation")
+                return
+
+            info(" @GEOP: Not converged, NEB force = %.8f, tol = %f" % (fmax, self.tolerances["force"]), verbosity.debug)
+
+            # Do one FIRE step; the velocities and the time step are updated inside
+            self.beads.q = FIRE(dstrip(self.beads.q).copy(), nebforce, self.v, dstrip(self.beads.m3), self.fire_options)
+            if self.freeze:
+                # the frozen images have not moved, and their forces are already known
+                self.nebbfgsm.prepare(self.beads, self.forces)
+            self.qtime += time.time()
+            return
+
         # Routine for steepest descent and conjugate gradient
         # TODO: CURRENTLY DOES NOT WORK. MUST BE ELIMINATED OR DEBUGGED
         else:
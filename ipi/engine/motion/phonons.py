@@ -19,28 +19,53 @@ along with this program. If not, see <http.//www.gnu.org/licenses/>.
 
 __all__ = ['DynMatrixMover']
 
+import os
+import struct
+import hashlib
 import numpy as np
 import time
 
 
 from ipi.engine.motion import Motion
+from ipi.engine.beads import Beads
+from ipi.engine.forces import Forces, ForceComponent
 from ipi.utils.depend import *
 from ipi.utils import units
 from ipi.utils.softexit import softexit
+from ipi.utils.symmetry import find_symmetry, irreducible_displacements, rebuild_force_constants
 from ipi.utils.messages import verbosity, warning, info
+from ipi.utils.io import open_backup
+
+
+# the row file starts with this string, followed by a header giving the
+# number of degrees of freedom and of rows, the displacements, the mode, the
+# symmetry tolerance and a hash of the reference positions and cell
+ROWFILE_MAGIC = "IPIROWS2"
+ROWFILE_HEADER = "<qqdd8sd20s"
 
 
 class DynMatrixMover(Motion):
     """Dynamic matrix calculation routine by finite difference.
     """
 
-    def __init__(self, fixcom=False, fixatoms=None, mode="fd", energy_shift=0.0, pos_shift=0.001, output_shift=0.000, dynmat=np.zeros(0, float), refdynmat=np.zeros(0, float), prefix="", asr="none"):
+    def __init__(self, fixcom=False, fixatoms=None, mode="fd", energy_shift=0.0, pos_shift=0.001, output_shift=0.000, dynmat=np.zeros(0, float), refdynmat=np.zeros(0, float), prefix="", asr="none", batch=1, symprec=1e-3, rowfile="", rows_done=np.zeros(0, int)):
         """Initialises DynMatrixMover.
         Args:
         fixcom	: An optional boolean which decides whether the centre of mass
                   motion will be constrained or not. Defaults to False. 
         dynmatrix : A 3Nx3N array that stores the dynamic matrix.
         refdynmatrix : A 3Nx3N array that stores the refined dynamic matrix.
+        batch : The number of rows of the dynamic matrix computed at each
+                step. The displaced configurations of all the rows in a batch
+                are dispatched at once, so that they can be computed by
+                several clients concurrently. Zero means all the rows.
+        symprec : The tolerance on the atomic positions used to find the
+                symmetries of the system in the sfd mode.
+        rowfile : The name of a file where the forces of the displaced
+                configurations are appended as soon as each row is
+                computed, so that a restarted calculation skips them.
+                Empty to disable.
+        rows_done : The indices of the rows that have already been computed.
         """
 
         super(DynMatrixMover, self).__init__(fixcom=fixcom, fixatoms=fixatoms)
@@ -49,6 +74,8 @@ class DynMatrixMover(Motion):
         self.mode = mode
         if self.mode == "fd":
             self.phcalc = FDPhononCalculator()
+        elif self.mode == "sfd":
+            self.phcalc = SFDPhononCalculator()
         elif self.mode == "nmfd":
             self.phcalc = NMFDPhononCalculator()
         elif self.mode == "enmfd":
@@ -64,6 +91,11 @@ class DynMatrixMover(Motion):
         self.V = None
         self.prefix = prefix
         self.asr = asr
+        self.batch = batch
+        self.symprec = symprec
+        self.rowfile = rowfile
+        self.rows_done = rows_done
+        self._rowstream = None
 
         if self.prefix == "":
             self.prefix = "PHONONS"
@@ -80,15 +112,152 @@ class DynMatrixMover(Motion):
         self.m = dstrip(self.beads.m)
         self.phcalc.bind(self)
 
-        self.dbeads = self.beads.copy()
+        self.nbatch = self.batch
+        if self.nbatch <= 0 or self.nbatch > self.phcalc.nrows:
+            self.nbatch = self.phcalc.nrows
+
         self.dcell = self.cell.copy()
-        self.dforces = self.forces.copy(self.dbeads, self.dcell)
+        self._bforces = {}
+
+        # the rows listed in the checkpoint or found in the row file are not
+        # computed again
+        self.done = np.zeros(self.phcalc.nrows, bool)
+        self.done[[k for k in self.rows_done if k < self.phcalc.nrows]] = True
+        # checkpoints written before the completed rows were stored only
+        # give the step, which is known when the first step is run
+        self._fromstep = (len(self.rows_done) == 0)
+        if self.rowfile != "":
+            self.read_rows()
+        if self.done.any():
+            info(" @PHONONS: %d rows out of %d have already been computed." % (self.done.sum(), self.phcalc.nrows), verbosity.low)
+
+    def rows(self):
+        """Returns the indices of the rows computed at the next step."""
+
+        return np.where(~self.done)[0][:self.nbatch]
+
+    def row_done(self, k, plus, minus):
+        """Marks a row as computed, appending it to the row file if required.
+
+        Args:
+           k: The index of the row.
+           plus: The negative of the force for the positive displacement.
+           minus: The negative of the force for the negative displacement.
+        """
+
+        self.done[k] = True
+        self.rows_done = np.where(self.done)[0]
+        if self._rowstream is not None:
+            self._rowstream.write(struct.pack("<q", k))
+            self._rowstream.write(np.asarray(plus, "<f8").tostring())
+            self._rowstream.write(np.asarray(minus, "<f8").tostring())
+
+    def _rowfile_header(self):
+        """Returns the header identifying the calculation in the row file.
+
+        The reference positions and cell determine the displaced
+        configurations, and in sfd mode also which displacements are
+        computed, so a hash of them is part of the header.
+        """
+
+        geometry = hashlib.sha1()
+        geometry.update(np.asarray(dstrip(self.beads.q)[0], "<f8").tostring())
+        geometry.update(np.asarray(dstrip(self.cell.h), "<f8").tostring())
+        return ROWFILE_MAGIC + struct.pack(ROWFILE_HEADER, 3 * self.beads.natoms, self.phcalc.nrows,
+                                           self.deltax, self.deltae, self.mode, self.symprec, geometry.digest())
+
+    def read_rows(self):
+        """Reads the rows stored in the row file, and opens it for appending.
+
+        Each record holds the index of the row and the forces for the two
+        displaced configurations. An incomplete record at the end of the file,
+        left by a run that was killed while writing, is discarded. If the file
+        belongs to a different calculation it is backed up and a new one is
+        started.
+        """
+
+        header = self._rowfile_header()
+        ndof = 3 * self.beads.natoms
+        reclen = 8 + 16 * ndof
+
+        nrec = -1
+        if os.path.exists(self.rowfile):
+            with open(self.rowfile, "rb") as stream:
+                data = stream.read()
+            if data[:len(header)] == header:
+                nrec = (len(data) - len(header)) / reclen
+            else:
+                warning(" @PHONONS: Row file " + self.rowfile + " does not match the current calculation, and will be overwritten.", verbosity.low)
+
+        if nrec < 0:
+            self._rowstream = open_backup(self.rowfile, "wb")
+            self._rowstream.write(header)
+        else:
+            for i in xrange(nrec):
+                offset = len(header) + i * reclen
+                k = struct.unpack("<q", data[offset:offset + 8])[0]
+                f = np.fromstring(data[offset + 8:offset + reclen], "<f8")
+                if not self.done[k]:
+                    self.phcalc.addrow(k, f[:ndof], f[ndof:])
+                    self.done[k] = True
+            self.rows_done = np.where(self.done)[0]
+            self._rowstream = open(self.rowfile, "r+b")
+            self._rowstream.truncate(len(header) + nrec * reclen)
+            self._rowstream.seek(0, 2)
+        self._rowstream.flush()
+
+    def evaluate(self, qs):
+        """Computes the forces for a set of displaced configurations.
+
+        The configurations are held as the replicas of a Beads object, so that
+        they are queued all at once as independent requests and are computed
+        by as many clients as are available.
+
+        Args:
+           qs: An array of shape (n, 3*natoms) giving the positions of each
+              configuration.
+
+        Returns:
+           An array of shape (n, 3*natoms) giving the forces.
+        """
+
+        n = len(qs)
+        if n not in self._bforces:
+            bbeads = Beads(self.beads.natoms, n)
+            bbeads.m[:] = self.beads.m
+            bbeads.names[:] = self.beads.names
+            # every configuration is evaluated in full, with no ring polymer contraction
+            fcomp = [ForceComponent(ffield=fc.ffield, name=fc.name, nbeads=0, weight=fc.weight,
+                                    mts_weights=fc.mts_weights, epsilon=fc.epsilon) for fc in self.forces.fcomp]
+            bforces = Forces()
+            bforces.bind(bbeads, self.dcell, fcomp, self.forces.ff)
+            self._bforces[n] = (bbeads, bforces)
+
+        bbeads, bforces = self._bforces[n]
+        bbeads.q = qs
+        return dstrip(bforces.f).copy()
 
     def step(self, step=None):
         """Executes one step of phonon computation. """
-        if (step < 3 * self.beads.natoms):
-            self.phcalc.step(step)
+
+        if self._fromstep:
+            # in such checkpoints, the rows were computed in order, one
+            # batch per step
+            self._fromstep = False
+            if step is not None and step > 0:
+                self.done[:min(step * self.nbatch, self.phcalc.nrows)] = True
+                self.rows_done = np.where(self.done)[0]
+                info(" @PHONONS: Assuming that the first %d rows were computed before step %d." % (min(step * self.nbatch, self.phcalc.nrows), step), verbosity.low)
+
+        rows = self.rows()
+        if len(rows) > 0:
+            self.phcalc.step(rows)
+            if self._rowstream is not None:
+                self._rowstream.flush()
         else:
+            if self._rowstream is not None:
+                self._rowstream.close()
+                self._rowstream = None
             self.phcalc.transform()
             self.refdynmatrix = self.apply_asr(self.refdynmatrix.copy())
             self.printall(self.prefix, self.refdynmatrix.copy())
@@ -217,8 +386,10 @@ class DummyPhononCalculator(dobject):
     def bind(self, dm):
         """ Reference all the variables for simpler access."""
         self.dm = dm
+        # the number of rows, i.e. of pairs of displaced configurations
+        self.nrows = 3 * self.dm.beads.natoms
 
-    def step(self, step=None):
+    def step(self, rows=None):
         """Dummy simulation time step which does nothing."""
         pass
 
@@ -253,22 +424,47 @@ class FDPhononCalculator(DummyPhononCalculator):
         else:
             self.dm.refdynmatrix = self.dm.refdynmatrix.reshape(((self.dm.beads.q.size, self.dm.beads.q.size)))
 
-    def step(self, step=None):
-        """Computes one row of the dynamic matrix."""
+    def step(self, rows=None):
+        """Computes a batch of rows of the dynamic matrix.
+
+        The positive and negative displacements of all the rows of the batch
+        are evaluated concurrently, and the rows are then assembled.
+
+        Args:
+           rows: The indices of the rows to be computed.
+        """
+
+        q = dstrip(self.dm.beads.q)[0]
+        qs = np.zeros((2 * len(rows), len(q)), float)
+        for i, k in enumerate(rows):
+            dev = self.displacement(k)
+            qs[2 * i] = q + dev
+            qs[2 * i + 1] = q - dev
+
+        f = self.dm.evaluate(qs)
+        for i, k in enumerate(rows):
+            self.addrow(k, -f[2 * i], -f[2 * i + 1])
+            self.dm.row_done(k, -f[2 * i], -f[2 * i + 1])
+
+    def displacement(self, k):
+        """Returns the finite displacement used to compute the kth row."""
 
-        # initializes the finite deviation
         dev = np.zeros(3 * self.dm.beads.natoms, float)
-        dev[step] = self.dm.deltax
-        # displaces kth d.o.f by delta.
-        self.dm.dbeads.q = self.dm.beads.q + dev
-        plus = - dstrip(self.dm.dforces.f).copy()
-        # displaces kth d.o.f by -delta.
-        self.dm.dbeads.q = self.dm.beads.q - dev
-        minus = - dstrip(self.dm.dforces.f).copy()
-        # computes a row of force-constant matrix
-        dmrow = (plus - minus) / (2 * self.dm.deltax) * self.dm.ism[step] * self.dm.ism
-        self.dm.dynmatrix[step] = dmrow
-        self.dm.refdynmatrix[step] = dmrow
+        dev[k] = self.dm.deltax
+        return dev
+
+    def addrow(self, k, plus, minus):
+        """Computes the kth row from the forces of the displaced configurations.
+
+        Args:
+           k: The index of the row.
+           plus: The negative of the force for the positive displacement.
+           minus: The negative of the force for the negative displacement.
+        """
+
+        dmrow = (plus - minus) / (2 * self.dm.deltax) * self.dm.ism[k] * self.dm.ism
+        self.dm.dynmatrix[k] = dmrow
+        self.dm.refdynmatrix[k] = dmrow
 
     def transform(self):
         dm = self.dm.dynmatrix.copy()
@@ -277,6 +473,48 @@ class FDPhononCalculator(DummyPhononCalculator):
         self.dm.refdynmatrix = 0.50 * (rdm + rdm.T)
 
 
+class SFDPhononCalculator(FDPhononCalculator):
+    """ Finite difference phonon evaluator exploiting the symmetry of the system.
+
+    Only the displacements that are not related by a symmetry operation
+    (including the translations by a primitive lattice vector in supercells)
+    are computed, and the full matrix is rebuilt from them at the end. Until
+    then, the kth row of dynmatrix holds the derivative of the forces along
+    the kth displacement, so that it is saved in the checkpoints.
+    """
+
+    def bind(self, dm):
+        """ Reference all the variables for simpler access, and finds the
+        irreducible displacements."""
+        super(SFDPhononCalculator, self).bind(dm)
+
+        natoms = self.dm.beads.natoms
+        self.ops = find_symmetry(dstrip(self.dm.beads.q)[0], dstrip(self.dm.cell.h), dstrip(self.dm.beads.names), self.dm.symprec)
+        self.disps = irreducible_displacements(self.ops, natoms)
+        self.nrows = len(self.disps)
+        info(" @PHONONS: Found %d symmetry operations, computing %d displacements out of %d." % (len(self.ops), self.nrows, 3 * natoms), verbosity.low)
+
+    def displacement(self, k):
+        """Returns the kth irreducible displacement."""
+
+        a, u = self.disps[k]
+        dev = np.zeros(3 * self.dm.beads.natoms, float)
+        dev[3 * a:3 * a + 3] = u * self.dm.deltax
+        return dev
+
+    def addrow(self, k, plus, minus):
+        """Stores the derivative of the forces along the kth displacement."""
+
+        self.dm.dynmatrix[k] = (plus - minus) / (2 * self.dm.deltax)
+        self.dm.refdynmatrix[k] = self.dm.dynmatrix[k]
+
+    def transform(self):
+        fc = rebuild_force_constants(self.ops, self.dm.beads.natoms, self.disps, self.dm.dynmatrix[:self.nrows])
+        dm = fc * self.dm.ism[:, np.newaxis] * self.dm.ism
+        self.dm.dynmatrix = 0.50 * (dm + dm.T)
+        self.dm.refdynmatrix = self.dm.dynmatrix.copy()
+
+
 class NMFDPhononCalculator(FDPhononCalculator):
     """ Normal mode finite difference phonon evaluator.
     """
@@ -300,21 +538,25 @@ class NMFDPhononCalculator(FDPhononCalculator):
         for i in xrange(len(self.dm.V)):
             self.dm.V[:, i] *= self.dm.ism
 
-    def step(self, step=None):
-        """Computes one row of the dynamic matrix."""
-
-        # initializes the finite deviation
-        vknorm = np.sqrt(np.dot(self.dm.V[:, step], self.dm.V[:, step]))
-        dev = np.real(self.dm.V[:, step] / vknorm) * self.dm.deltax
-        # displaces by -delta along kth normal mode.
-        self.dm.dbeads.q = self.dm.beads.q + dev
-        plus = - dstrip(self.dm.dforces.f).copy().flatten()
-        # displaces by -delta along kth normal mode.
-        self.dm.dbeads.q = self.dm.beads.q - dev
-        minus = - dstrip(self.dm.dforces.f).copy().flatten()
-        # computes a row of the refined dynmatrix, in the basis of the eigenvectors of the first dynmatrix
-        dmrowk = (plus - minus) / (2 * self.dm.deltax / vknorm)
-        self.dm.refdynmatrix[step] = np.dot(self.dm.V.T, dmrowk)
+    def delta(self, k):
+        """Returns the norm of the kth mode and the displacement along it."""
+
+        vknorm = np.sqrt(np.dot(self.dm.V[:, k], self.dm.V[:, k]))
+        return vknorm, self.dm.deltax
+
+    def displacement(self, k):
+        """Returns the finite displacement along the kth normal mode."""
+
+        vknorm, delta = self.delta(k)
+        return np.real(self.dm.V[:, k] / vknorm) * delta
+
+    def addrow(self, k, plus, minus):
+        """Computes the kth row of the refined dynmatrix, in the basis of the
+        eigenvectors of the first dynmatrix."""
+
+        vknorm, delta = self.delta(k)
+        dmrowk = (plus - minus) / (2 * delta / vknorm)
+        self.dm.refdynmatrix[k] = np.dot(self.dm.V.T, dmrowk)
 
     def transform(self):
         self.dm.refdynmatrix = np.dot(self.dm.U, np.dot(self.dm.refdynmatrix, np.transpose(self.dm.U)))
@@ -326,20 +568,11 @@ class ENMFDPhononCalculator(NMFDPhononCalculator):
     """ Energy scaled normal mode finite difference phonon evaluator.
     """
 
-    def step(self, step=None):
-        """Computes one row of the dynamic matrix."""
+    def delta(self, k):
+        """Returns the norm of the kth mode and the displacement along it,
+        chosen so that the energy changes by about energy_shift."""
 
-        # initializes the finite deviation
-        vknorm = np.sqrt(np.dot(self.dm.V[:, step], self.dm.V[:, step]))
-        edelta = vknorm * np.sqrt(self.dm.deltae * 2.0 / abs(self.dm.w2[step]))
+        vknorm = np.sqrt(np.dot(self.dm.V[:, k], self.dm.V[:, k]))
+        edelta = vknorm * np.sqrt(self.dm.deltae * 2.0 / abs(self.dm.w2[k]))
         if edelta > 100 * self.dm.deltax: edelta = 100 * self.dm.deltax
-        dev = np.real(self.dm.V[:, step] / vknorm) * edelta
-        # displaces by -delta along kth normal mode.
-        self.dm.dbeads.q = self.dm.beads.q + dev
-        plus = - dstrip(self.dm.dforces.f).copy().flatten()
-        # displaces by -delta along kth normal mode.
-        self.dm.dbeads.q = self.dm.beads.q - dev
-        minus = - dstrip(self.dm.dforces.f).copy().flatten()
-        # computes a row of the refined dynmatrix, in the basis of the eigenvectors of the first dynmatrix
-        dmrowk = (plus - minus) / (2 * edelta / vknorm)
-        self.dm.refdynmatrix[step] = np.dot(self.dm.V.T, dmrowk)
+        return vknorm, edelta
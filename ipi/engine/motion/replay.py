@@ -10,10 +10,10 @@
 import time
 
 from ipi.engine.motion import Motion
+from ipi.utils.depend import dstrip
 from ipi.utils.softexit import softexit
-from ipi.utils.io import read_file
+from ipi.utils.io.io_trajectory import TrajectoryReader
 from ipi.utils.io.inputs.io_xml import xml_parse_file
-from ipi.utils.units import unit_to_internal
 
 
 __all__ = ['Replay']
@@ -28,6 +28,16 @@ class Replay(Motion):
 
     Attributes:
         intraj: The input trajectory file.
+        stride: The number of steps of the trajectory advanced at each step.
+        prefetch: The number of steps of the trajectory that are read ahead
+            of time, in a background thread.
+        window: The number of steps of the trajectory whose forces are
+            computed at once. The forces of the steps after the current one
+            are requested in advance, on copies of the system.
+        reader: The object reading the frames of the trajectory, by index.
+        wbeads, wcell, wforces: The copies of the beads, cell and forces
+            holding the steps of the window.
+        wsteps: The step held in each of the copies.
         ptime: The time taken in updating the velocities.
         qtime: The time taken in updating the positions.
         ttime: The time taken in applying the thermostat steps.
@@ -36,7 +46,7 @@ class Replay(Motion):
         None really meaningful.
     """
 
-    def __init__(self, fixcom=False, fixatoms=None, intraj=None):
+    def __init__(self, fixcom=False, fixatoms=None, intraj=None, stride=1, prefetch=4, window=1):
         """Initialises Replay.
 
         Args:
@@ -45,6 +55,9 @@ class Replay(Motion):
            fixcom: An optional boolean which decides whether the centre of mass
               motion will be constrained or not. Defaults to False.
            intraj: The input trajectory file.
+           stride: The stride with which the trajectory is read.
+           prefetch: The number of steps that are read ahead of time.
+           window: The number of steps whose forces are computed at once.
         """
 
         super(Replay, self).__init__(fixcom=fixcom, fixatoms=fixatoms)
@@ -53,9 +66,62 @@ class Replay(Motion):
         self.intraj = intraj
         if intraj.mode == "manual":
             raise ValueError("Replay can only read from PDB or XYZ files -- or a single frame from a CHK file")
-        self.rfile = open(self.intraj.value, "r")
+        self.stride = stride
+        self.prefetch = prefetch
+        self.window = window
+        self.reader = None
+        self.wbeads = self.wcell = self.wforces = self.wsteps = None
+        self.rfile = None
         self.rstep = 0
 
+    def bind(self, ens, beads, nm, cell, bforce, prng):
+        """Binds the ensemble to the calculator, and indexes the trajectory.
+
+        Each step of the trajectory holds one frame for each bead.
+        """
+
+        super(Replay, self).bind(ens, beads, nm, cell, bforce, prng)
+        if self.window < 1:
+            raise ValueError("The replay window must hold at least one step")
+        if self.intraj.mode == "xyz" or self.intraj.mode == "pdb":
+            self.reader = TrajectoryReader(self.intraj.value, self.intraj.mode, self.intraj.units,
+                                           group=self.beads.nbeads, stride=self.stride, prefetch=self.prefetch)
+        else:
+            self.rfile = open(self.intraj.value, "r")
+
+        if self.window > 1 and self.reader is not None:
+            self.wbeads = [self.beads.copy() for i in xrange(self.window)]
+            self.wcell = [self.cell.copy() for i in xrange(self.window)]
+            self.wforces = [self.forces.copy(b, c) for b, c in zip(self.wbeads, self.wcell)]
+            self.wsteps = [-1] * self.window
+
+    def fill_window(self, istep):
+        """Loads the steps of the window starting at istep into the copies of
+        the system, and requests their forces.
+
+        The copies holding the steps that are still in the window are left
+        alone, so only the steps that have just entered it are sent to the
+        clients. The forces are computed concurrently, in any order.
+
+        Raises:
+            EOFError: Raised if istep is beyond the end of the trajectory.
+        """
+
+        for s in xrange(istep, istep + self.window):
+            k = s % self.window
+            if self.wsteps[k] == s:
+                continue
+            try:
+                q, h = self.reader.read(s)
+            except EOFError:
+                if s == istep:
+                    raise
+                break
+            self.wbeads[k].q[:] = q
+            self.wcell[k].h[:] = h
+            self.wsteps[k] = s
+            self.wforces[k].queue()
+
     def step(self, step=None):
         """Does one replay time step."""
 
@@ -63,43 +129,47 @@ class Replay(Motion):
         self.ttime = 0.0
         self.qtime = -time.time()
 
-        while True:
-            self.rstep += 1
+        if self.reader is not None:
+            # goes straight to the requested step, without parsing the ones in between
+            if step is not None:
+                self.rstep = step
             try:
-                if self.intraj.mode == "xyz":
-                    for b in self.beads:
-                        myframe = read_file("xyz", self.rfile)
-                        myatoms = myframe['atoms']
-                        mycell = myframe['cell']
-                        myatoms.q *= unit_to_internal("length", self.intraj.units, 1.0)
-                        mycell.h *= unit_to_internal("length", self.intraj.units, 1.0)
-                        b.q[:] = myatoms.q
-                    self.cell.h[:] = mycell.h
-                elif self.intraj.mode == "pdb":
-                    for b in self.beads:
-                        myatoms, mycell = read_file("pdb", self.rfile)
-                        myatoms.q *= unit_to_internal("length", self.intraj.units, 1.0)
-                        mycell.h *= unit_to_internal("length", self.intraj.units, 1.0)
-                        b.q[:] = myatoms.q
-                    self.cell.h[:] = mycell.h
-                elif self.intraj.mode == "chk" or self.intraj.mode == "checkpoint":
-
-                    # TODO: Adapt the new `Simulation.load_from_xml`?
-
-                    # reads configuration from a checkpoint file
-                    xmlchk = xml_parse_file(self.rfile)   # Parses the file.
-
-                    from ipi.inputs.simulation import InputSimulation
-                    simchk = InputSimulation()
-                    simchk.parse(xmlchk.fields[0][1])
-                    mycell = simchk.cell.fetch()
-                    mybeads = simchk.beads.fetch()
-                    self.cell.h[:] = mycell.h
-                    self.beads.q[:] = mybeads.q
-                    softexit.trigger(" # Read single checkpoint")
+                if self.wsteps is None:
+                    q, h = self.reader.read(self.rstep)
+                else:
+                    self.fill_window(self.rstep)
             except EOFError:
+                self.reader.close()
                 softexit.trigger(" # Finished reading re-run trajectory")
-            if (step is None) or (self.rstep > step):
-                break
+
+            if self.wsteps is None:
+                self.beads.q[:] = q
+                self.cell.h[:] = h
+            else:
+                # waits for the forces of the current step, and copies them
+                # over, so that the properties are output in the order of
+                # the trajectory whatever the order the results arrive in
+                k = self.rstep % self.window
+                dstrip(self.wforces[k].f)
+                self.beads.q[:] = dstrip(self.wbeads[k].q)
+                self.cell.h[:] = dstrip(self.wcell[k].h)
+                self.forces.transfer_forces(self.wforces[k])
+            self.rstep += 1
+
+        elif self.intraj.mode == "chk" or self.intraj.mode == "checkpoint":
+
+            # TODO: Adapt the new `Simulation.load_from_xml`?
+
+            # reads configuration from a checkpoint file
+            xmlchk = xml_parse_file(self.rfile)   # Parses the file.
+
+            from ipi.inputs.simulation import InputSimulation
+            simchk = InputSimulation()
+            simchk.parse(xmlchk.fields[0][1])
+            mycell = simchk.cell.fetch()
+            mybeads = simchk.beads.fetch()
+            self.cell.h[:] = mycell.h
+            self.beads.q[:] = mybeads.q
+            softexit.trigger(" # Read single checkpoint")
 
         self.qtime += time.time()
@@ -10,22 +10,101 @@ and the restart files.
 
 
 import os
+import sys
 import time
+import threading
+import traceback
+import Queue
 
 import numpy as np
 
 from ipi.utils.messages import verbosity, info, warning
 from ipi.utils.units import Constants, unit_to_internal, unit_to_user
 from ipi.utils.softexit import softexit
+from ipi.utils.prng import Random
 from ipi.utils.depend import *
 import ipi.utils.io as io
 from ipi.utils.io.inputs.io_xml import *
+from ipi.utils.io.inputs.io_binary import binary_write
 from ipi.utils.io import open_backup
 from ipi.engine.properties import getkey
 from ipi.engine.atoms import *
 from ipi.engine.cell import *
 
-__all__ = ['PropertyOutput', 'TrajectoryOutput', 'CheckpointOutput']
+__all__ = ['PropertyOutput', 'TrajectoryOutput', 'CheckpointOutput', 'OutputWriter', 'StateSnapshot']
+
+
+class OutputWriter(object):
+    """Class that formats and writes output data on a background thread.
+
+    Output objects take a snapshot of the data they have to print while the
+    simulation is in a consistent state, and submit a job that formats and
+    writes it to file. Jobs are executed in order by a single thread, so that
+    slow I/O does not add to the time taken by each step. The queue is
+    bounded, so that if writing falls behind the simulation blocks until
+    there is room for more jobs.
+
+    Attributes:
+       maxsize: The maximum number of jobs waiting to be written.
+       queue: The queue of pending jobs.
+    """
+
+    def __init__(self, maxsize=64):
+        """Initializes the writer and starts the writer thread.
+
+        Args:
+           maxsize: The maximum number of jobs that can be queued before
+              submit() blocks.
+        """
+
+        self.maxsize = maxsize
+        self.queue = Queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._write_loop, name="output_writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+        # must be registered before the outputs, so that the queue is
+        # drained before the streams get closed
+        softexit.register_function(self.drain)
+
+    def _write_loop(self):
+        """Executes the queued jobs. A `None` job stops the thread."""
+
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    break
+                job()
+            except Exception:
+                warning("Exception while writing output:\n" + "".join(traceback.format_exception(*sys.exc_info())), verbosity.low)
+            finally:
+                self.queue.task_done()
+
+    def submit(self, job):
+        """Queues a job, blocking if the queue is full.
+
+        Args:
+           job: A function taking no arguments that writes out data.
+        """
+
+        self.queue.put(job)
+
+    def pending(self):
+        """Returns the number of jobs that have not been written yet."""
+
+        return self.queue.qsize()
+
+    def drain(self):
+        """Waits until all the queued jobs have been written."""
+
+        self.queue.join()
+
+    def stop(self):
+        """Writes all the pending jobs and stops the writer thread."""
+
+        self.queue.put(None)
+        self.queue.join()
 
 
 class PropertyOutput(dobject):
@@ -43,6 +122,8 @@ class PropertyOutput(dobject):
        nout: Number of steps since data was last flushed.
        out: The output stream on which to output the properties.
        system: The system object to get the data to be output from.
+       writer: An optional OutputWriter used to write the data in the
+          background.
     """
 
     def __init__(self, filename="out", stride=1, flush=1, outlist=None):
@@ -67,15 +148,19 @@ class PropertyOutput(dobject):
         self.flush = flush
         self.nout = 0
         self.out = None
+        self.writer = None
 
-    def bind(self, system):
+    def bind(self, system, writer=None):
         """Binds output proxy to System object.
 
         Args:
            system: A System object to be bound.
+           writer: An optional OutputWriter. If given, the properties are
+              formatted and written out on the writer thread.
         """
 
         self.system = system
+        self.writer = writer
 
         # Checks as soon as possible if some asked-for properties are
         # missing or mispelled
@@ -146,7 +231,9 @@ class PropertyOutput(dobject):
 
         if not (self.system.simul.step + 1) % self.stride == 0:
             return
-        self.out.write("  ")
+
+        # takes a snapshot of the values, that can be written out later on
+        values = []
         for what in self.outlist:
             try:
                 quantity, dimension, unit = self.system.properties[what]
@@ -154,6 +241,26 @@ class PropertyOutput(dobject):
                     quantity = unit_to_user(dimension, unit, quantity)
             except KeyError:
                 raise KeyError(what + " is not a recognized property")
+            if not hasattr(quantity, "__len__"):
+                values.append(quantity)
+            else:
+                values.append(np.array(quantity, float))
+
+        if self.writer is None:
+            self.write_values(values)
+        else:
+            self.writer.submit(lambda: self.write_values(values))
+
+    def write_values(self, values):
+        """Writes out a line of property values.
+
+        Args:
+           values: A list of the values of the properties, in the same order
+              as in outlist.
+        """
+
+        self.out.write("  ")
+        for quantity in values:
             if not hasattr(quantity, "__len__"):
                 self.out.write(write_type(float, quantity) + "   ")
             else:
@@ -188,6 +295,8 @@ class TrajectoryOutput(dobject):
        ibead: Index of the replica to print the trajectory of.
        cell_units: The units that the cell parameters are given in.
        system: The System object to get the data to be output from.
+       writer: An optional OutputWriter used to write the data in the
+          background.
     """
 
     def __init__(self, filename="out", stride=1, flush=1, what="", format="xyz", cell_units="atomic_unit", ibead=-1):
@@ -217,15 +326,19 @@ class TrajectoryOutput(dobject):
         self.cell_units = cell_units
         self.out = None
         self.nout = 0
+        self.writer = None
 
-    def bind(self, system):
+    def bind(self, system, writer=None):
         """Binds output proxy to System object.
 
         Args:
            system: A System object to be bound.
+           writer: An optional OutputWriter. If given, the trajectory frames
+              are formatted and written out on the writer thread.
         """
 
         self.system = system
+        self.writer = writer
 
         # Checks as soon as possible if some asked-for trajs are missing or mispelled
         key = getkey(self.what)
@@ -302,29 +415,53 @@ class TrajectoryOutput(dobject):
         if not (self.system.simul.step + 1) % self.stride == 0:
             return
 
+        data, dimension, units = self.system.trajs[self.what]  # gets the trajectory data that must be printed
+
+        # takes a snapshot of the frame, that can be written out later on
+        if getkey(self.what) == "extras":
+            data = list(data)
+        else:
+            data = np.array(dstrip(data), copy=True)
+        h = dstrip(self.system.cell.h).copy()
+        step = self.system.simul.step + 1
+
+        if self.writer is None:
+            self.write_frame(data, dimension, units, h, step)
+        else:
+            self.writer.submit(lambda: self.write_frame(data, dimension, units, h, step))
+
+    def write_frame(self, data, dimension, units, h, step):
+        """Writes out a snapshot of the trajectory to the output stream(s).
+
+        Args:
+           data: The trajectory data.
+           dimension: The dimensions of the trajectory data.
+           units: The units the trajectory should be printed in.
+           h: The cell matrix.
+           step: The step number to be printed in the title.
+        """
+
         doflush = False
         self.nout += 1
         if self.flush > 0 and self.nout >= self.flush:
             doflush = True
             self.nout = 0
 
-        data, dimension, units = self.system.trajs[self.what]  # gets the trajectory data that must be printed
         # quick-and-dirty way to check if a trajectory is "global" or per-bead
         # Checks to see if there is a list of files or just a single file.
         if hasattr(self.out, "__getitem__"):
             if self.ibead < 0:
                 for b in range(len(self.out)):
                     if self.out[b] is not None:
-                        self.write_traj(data, self.what, self.out[b], b, format=self.format, dimension=dimension, units=units, cell_units=self.cell_units, flush=doflush)
+                        self.write_traj(data, self.what, self.out[b], b, format=self.format, dimension=dimension, units=units, cell_units=self.cell_units, flush=doflush, h=h, step=step)
             elif self.ibead < len(self.out):
-                self.write_traj(data, self.what, self.out[self.ibead], self.ibead, format=self.format, dimension=dimension, units=units, cell_units=self.cell_units, flush=doflush)
+                self.write_traj(data, self.what, self.out[self.ibead], self.ibead, format=self.format, dimension=dimension, units=units, cell_units=self.cell_units, flush=doflush, h=h, step=step)
             else:
                 raise ValueError("Selected bead index " + str(self.ibead) + " does not exist for trajectory " + self.what)
         else:
-            self.write_traj(data, getkey(self.what), self.out, b=0, format=self.format, dimension=dimension, units=units, cell_units=self.cell_units, flush=doflush)
-        
+            self.write_traj(data, getkey(self.what), self.out, b=0, format=self.format, dimension=dimension, units=units, cell_units=self.cell_units, flush=doflush, h=h, step=step)
 
-    def write_traj(self, data, what, stream, b=0, format="xyz", dimension="", units="automatic", cell_units="automatic", flush=True):
+    def write_traj(self, data, what, stream, b=0, format="xyz", dimension="", units="automatic", cell_units="automatic", flush=True, h=None, step=None):
         """Prints out a frame of a trajectory for the specified quantity and bead.
 
         Args:
@@ -335,11 +472,19 @@ class TrajectoryOutput(dobject):
            cell_units: The units used to specify the cell parameters.
            flush: A boolean which specifies whether to flush the output buffer
               after each write to file or not.
+           h: The cell matrix. Defaults to the current cell of the system.
+           step: The step number printed in the title. Defaults to the
+              current step of the simulation.
         """
 
+        if h is None:
+            h = self.system.cell.h
+        if step is None:
+            step = self.system.simul.step + 1
+
         key = getkey(what)
         if key in ["extras"]:
-            stream.write(" #*EXTRAS*# Step:  %10d  Bead:  %5d  \n" % (self.system.simul.step + 1, b))
+            stream.write(" #*EXTRAS*# Step:  %10d  Bead:  %5d  \n" % (step, b))
             stream.write(data[b])
             stream.write("\n")
             if flush:
@@ -356,16 +501,210 @@ class TrajectoryOutput(dobject):
             fatom.q[:] = data
 
         fcell = Cell()
-        fcell.h = self.system.cell.h
+        fcell.h = h
 
         if units == "": units = "automatic"
         if cell_units == "": cell_units = "automatic"
-        io.print_file(format, fatom, fcell, stream, title=("Step:  %10d  Bead:   %5d " % (self.system.simul.step + 1, b)), key=key, dimension=dimension, units=units, cell_units=cell_units)
+        io.print_file(format, fatom, fcell, stream, title=("Step:  %10d  Bead:   %5d " % (step, b)), key=key, dimension=dimension, units=units, cell_units=cell_units)
         if flush:
             stream.flush()
             os.fsync(stream)
 
 
+class StateSnapshot(object):
+    """Class holding a lightweight copy of the dynamical state of a simulation.
+
+    Copies the arrays and values that change during a step (positions,
+    momenta, cell, thermostat and barostat states, conserved energy
+    contributions, random number generator state...) into preallocated
+    buffers, so that a checkpoint corresponding to the beginning of a step
+    can be written without building a full input object tree every step.
+
+    The simulation itself is never modified: the buffers are written into
+    the corresponding fields of an input object tree that has been stored
+    beforehand, and that holds all the quantities that do not change
+    during a run.
+
+    Attributes:
+       simul: The simulation object the snapshot refers to.
+       complete: False if the simulation contains objects whose state
+          cannot be captured by the snapshot, in which case a full store
+          of the simulation status must be used instead.
+       stored: True if the snapshot contains a stored state.
+       values: A list of [source, buffer, path] lists. The source is a depend
+          object or a numpy array, and the path gives the location of the
+          corresponding field in the input object tree, as a tuple of
+          attribute names and indices.
+       prng_states: A list of (random number generator, lazy state) tuples,
+          as returned by Random.lazy_state().
+    """
+
+    def __init__(self, simul):
+        """Initializes the snapshot, collecting the objects that should be saved.
+
+        Args:
+           simul: A simulation object.
+        """
+
+        from ipi.engine.motion import Motion, Dynamics, MultiMotion
+        from ipi.engine.smotion import Smotion, ReplicaExchange
+
+        self.simul = simul
+        self.complete = True
+        self.stored = False
+        self.values = []
+        self.prng_states = []
+        self._lock = threading.RLock()
+        self._storing = False
+
+        ensemble_fields = [("eens", "eens"), ("temp", "temperature"), ("pext", "pressure"),
+                           ("stressext", "stress"), ("bweights", "bias_weights"), ("hweights", "hamiltonian_weights")]
+
+        self._add(dd(simul).step, ("step",))
+        nff = len(simul.fflist)
+        for isys, s in enumerate(simul.syslist):
+            path = ("extra", nff + isys, 1)
+            self._add(dd(s.beads).q, path + ("beads", "q"))
+            self._add(dd(s.beads).p, path + ("beads", "p"))
+            self._add(dd(s.cell).h, path + ("cell",))
+            densemble = dd(s.ensemble)
+            for name, field in ensemble_fields:
+                if hasattr(densemble, name):
+                    self._add(getattr(densemble, name), path + ("ensemble", field))
+
+            mlist = [(s.motion, path + ("motion",))]
+            while len(mlist) > 0:
+                m, mpath = mlist.pop()
+                if type(m) is MultiMotion:
+                    mlist += [(mm, mpath + ("extra", i, 1)) for i, mm in enumerate(m.mlist)]
+                elif type(m) is Dynamics:
+                    self._add_thermostat(m.thermostat, mpath + ("dynamics", "thermostat"))
+                    self._add_barostat(m.barostat, mpath + ("dynamics", "barostat"))
+                elif type(m) is not Motion:
+                    # the internal state of other motion classes is not tracked
+                    self.complete = False
+
+        if simul.smotion is not None:
+            if type(simul.smotion) is ReplicaExchange:
+                self._add(simul.smotion.repindex, ("smotion", "remd", "repindex"))
+            elif type(simul.smotion) is not Smotion:
+                self.complete = False
+
+    def _add(self, source, path):
+        """Adds a quantity to the list of quantities to be saved.
+
+        Args:
+           source: A depend_value, a depend_array, or a plain numpy array that
+              is modified in place by the simulation.
+           path: The location of the corresponding field in the input tree.
+        """
+
+        if isinstance(source, depend_array):
+            self.values.append([source, dstrip(source[:]).copy(), path])
+        elif isinstance(source, np.ndarray):
+            self.values.append([source, source.copy(), path])
+        else:
+            self.values.append([source, source.get(), path])
+
+    def _add_thermostat(self, thermo, path):
+        """Adds the state of a thermostat, and of the thermostats it contains.
+
+        Args:
+           thermo: A thermostat object.
+           path: The location of the thermostat in the input tree.
+        """
+
+        from ipi.engine.thermostats import MultiThermo, ThermoGLE, ThermoNMGLE, ThermoNMGLEG
+
+        self._add(dd(thermo).ethermo, path + ("ethermo",))
+        if type(thermo) in [ThermoGLE, ThermoNMGLE, ThermoNMGLEG]:
+            self._add(thermo.s, path + ("s",))
+        elif type(thermo) is MultiThermo:
+            for i, t in enumerate(thermo.tlist):
+                self._add_thermostat(t, path + ("extra", i, 1))
+
+    def _add_barostat(self, baro, path):
+        """Adds the state of a barostat, including its thermostat.
+
+        Args:
+           baro: A barostat object.
+           path: The location of the barostat in the input tree.
+        """
+
+        from ipi.engine.barostats import BaroBZP, BaroRGB
+
+        if type(baro) in [BaroBZP, BaroRGB]:
+            self._add(dd(baro).p, path + ("p",))
+        if hasattr(baro, "thermostat"):
+            self._add_thermostat(baro.thermostat, path + ("thermostat",))
+
+    def store(self):
+        """Copies the current state into the snapshot buffers."""
+
+        with self._lock:
+            self._storing = True
+            for v in self.values:
+                if isinstance(v[0], depend_array):
+                    v[1][:] = dstrip(v[0][:])  # slicing makes sure the value is up to date
+                elif isinstance(v[0], np.ndarray):
+                    v[1][:] = v[0]
+                else:
+                    v[1] = v[0].get()
+            # the states are only expanded when a checkpoint is written, so
+            # that the numbers generated ahead of time are not generated again
+            self.prng_states = [(prng, prng.lazy_state()) for prng in self.simul.prng.all_streams()]
+            self.stored = True
+            self._storing = False
+
+    def write_status(self, status):
+        """Writes the stored state into an input object tree.
+
+        Args:
+           status: An InputSimulation object, in which the simulation has
+              been stored before.
+
+        Returns:
+           False if the snapshot does not hold a complete state, e.g. because
+           it is being stored by the thread that is calling this function.
+        """
+
+        from ipi.utils.inputvalue import InputArray
+        from ipi.inputs.cell import InputCell
+
+        with self._lock:
+            if self._storing or not self.stored:
+                return False
+            for source, value, path in self.values:
+                field = status
+                for key in path:
+                    if isinstance(key, int):
+                        field = field[key]
+                    else:
+                        field = getattr(field, key)
+                if isinstance(field, InputCell):
+                    # the cell input stores a cell object, rather than its matrix
+                    InputArray.store(field, value)
+                else:
+                    field.store(value)
+            states = dict((id(prng), state) for prng, state in self.prng_states)
+            self._write_prng(status.prng, self.simul.prng, states)
+        return True
+
+    def _write_prng(self, iprng, prng, states):
+        """Writes the stored state of a random number generator, and of its
+        streams, into the corresponding input object."""
+
+        state = Random.expand_state(states[id(prng)])
+        iprng.state.store(state[1])
+        iprng.set_pos.store(state[2])
+        iprng.has_gauss.store(state[3])
+        iprng.gauss.store(state[4])
+        for k, istream in iprng.extra:
+            name = istream.name.fetch()
+            if name in prng.streams:
+                self._write_prng(istream, prng.streams[name], states)
+
+
 class CheckpointOutput(dobject):
     """Class dealing with outputting checkpoints.
 
@@ -379,11 +718,19 @@ class CheckpointOutput(dobject):
        overwrite: If True, the checkpoint file is overwritten at each output.
           If False, will output to 'filename_step'. Note that no check is done
           on whether 'filename_step' exists already.
+       format: The format of the checkpoint file, either 'xml' or 'binary'.
        simul: The simulation object to get the data to be output from.
        status: An input simulation object used to write out the checkpoint file.
+       snapshot: A StateSnapshot holding the state of the simulation at the
+          beginning of the step, which is written into status on a rollback.
+
+    Checkpoint files are written on a background thread, at most one at a
+    time, to a temporary file that is renamed to the final file name only
+    once it has been completely written out, so that a crash during the
+    write never leaves a truncated checkpoint behind.
     """
 
-    def __init__(self, filename="restart", stride=1000, overwrite=True, step=0):
+    def __init__(self, filename="restart", stride=1000, overwrite=True, step=0, format="xml"):
         """Initializes a checkpoint output proxy.
 
         Args:
@@ -394,14 +741,18 @@ class CheckpointOutput(dobject):
               If False, will output to 'filename_step'. Note that no check is done
               on whether 'filename_step' exists already.
            step: The number of checkpoint files that have been created so far.
+           format: The format of the checkpoint file, either 'xml' or 'binary'.
         """
 
         self.filename = filename
+        self.format = format
         self.step = step
         self.stride = stride
         self.overwrite = overwrite
         self._storing = False
         self._continued = False
+        self._thread = None
+        self.snapshot = None
 
     def bind(self, simul):
         """Binds output proxy to simulation object.
@@ -414,6 +765,7 @@ class CheckpointOutput(dobject):
         import ipi.inputs.simulation as isimulation
         self.status = isimulation.InputSimulation()
         self.status.store(simul)
+        softexit.register_function(self.wait)
 
     def store(self):
         """Stores the current simulation status.
@@ -424,10 +776,54 @@ class CheckpointOutput(dobject):
         positions would have been consistent.
         """
 
+        self.wait()    # the status must not change while it is being written out
         self._storing = True
         self.status.store(self.simul)
         self._storing = False
 
+    def store_snapshot(self):
+        """Stores a lightweight copy of the current simulation state.
+
+        This has the same purpose as store(), but only copies the arrays that
+        change during a step, rather than building the full input object tree.
+        Falls back to store() if the simulation contains objects whose state
+        is not captured by the snapshot.
+        """
+
+        if self.snapshot is None:
+            self.snapshot = StateSnapshot(self.simul)
+            if self.snapshot.complete:
+                # the snapshot is written into this status on a rollback, so it
+                # must hold everything else, e.g. the streams of random numbers
+                # created while the simulation was being set up
+                self.store()
+
+        if self.snapshot.complete:
+            self._storing = True
+            self.snapshot.store()
+            self._storing = False
+        else:
+            self.store()
+
+    def rollback(self):
+        """Updates the stored status to the last snapshot of the simulation.
+
+        Writes the state saved by store_snapshot() into the stored status, so
+        that it can be written out as a checkpoint. This can be called from
+        any thread while a step is running, so the simulation itself is only
+        read if the snapshot is not usable.
+        """
+
+        if self.snapshot is not None and self.snapshot.complete:
+            if self.snapshot.write_status(self.status) or not self.snapshot.stored:
+                return
+            info("@ CHECKPOINT: Rollback called while storing the snapshot. Force re-storing", verbosity.low)
+        elif self._storing:
+            info("@ CHECKPOINT: Rollback called while storing. Force re-storing", verbosity.low)
+        else:
+            return
+        self.store()
+
     def write(self, store=True):
         """Writes out the required trajectories.
 
@@ -452,24 +848,67 @@ class CheckpointOutput(dobject):
         if not (self.simul.step + 1) % self.stride == 0:
             return
 
-        # function to use to open files
-        open_function = open_backup
+        # at most one checkpoint is written at any time
+        self.wait()
 
         if self.overwrite:
             filename = self.filename
-            if self._continued:
-                open_function = open
         else:
             filename = self.filename + "_" + str(self.step)
+        # existing files are backed up, except when overwriting our own checkpoint
+        backup = not (self.overwrite and self._continued)
 
         # Advance the step counter before saving, so next time the correct index will be loaded.
         if store:
             self.step += 1
             self.store()
-            self.status.step.store(self.simul.step+1)
+            self.status.step.store(self.simul.step + 1)
 
-        with open_function(filename, "w") as check_file:
-            check_file.write(self.status.write(name="simulation"))
+        # the status now holds a copy of the state, that can be written out in the background
+        self._thread = threading.Thread(target=self.write_file, name="checkpoint_" + filename, args=(filename, backup))
+        self._thread.daemon = True
+        self._thread.start()
 
         # Do not use backed up file open on subsequent writes.
         self._continued = True
+
+    def write_file(self, filename, backup=True):
+        """Serialises the stored status and writes it to file.
+
+        The checkpoint is written to a temporary file, that is flushed to disk
+        and then atomically renamed to the final file name.
+
+        Args:
+           filename: The name of the checkpoint file.
+           backup: A boolean saying whether an existing file should be backed
+              up rather than replaced.
+        """
+
+        tmpname = filename + ".tmp"
+        try:
+            if self.format == "binary":
+                with open(tmpname, "wb") as check_file:
+                    binary_write(check_file, self.status, name="simulation")
+                    check_file.flush()
+                    os.fsync(check_file.fileno())
+            else:
+                data = self.status.write(name="simulation")
+                with open(tmpname, "w") as check_file:
+                    check_file.write(data)
+                    check_file.flush()
+                    os.fsync(check_file.fileno())
+
+            if backup:
+                io.backup_file(filename)
+            os.rename(tmpname, filename)
+        except Exception:
+            warning("Exception while writing checkpoint " + filename + ":\n" + "".join(traceback.format_exception(*sys.exc_info())), verbosity.low)
+
+    def wait(self):
+        """Waits until the checkpoint that is being written, if any, is complete."""
+
+        if self._thread is not None:
+            while self._thread.isAlive():
+                # This is necessary as join() without timeout prevents main from receiving signals.
+                self._thread.join(2.0)
+            self._thread = None
@@ -208,6 +208,15 @@ class Properties(dobject):
                      "help": "The elapsed simulation time.",
                      'func': (lambda: (1 + self.simul.step) * self.motion.dt)},
 
+            "timing": {"dimension": "undefined",
+                       "help": "The wall clock time (in seconds) spent in a phase of the latest step.",
+                       "longhelp": """The wall clock time (in seconds) spent in a phase of the latest step. Takes an argument 'phase',
+                       which can be 'step', 'smotion', 'output' or 'checkpoint' for the phases of the whole simulation step, or
+                       'motion', 'forces' (waiting for the forces to be computed), 'propagation', 'thermostat' or 'barostat'
+                       (the thermostat of the barostat) for the phases of the motion of this system. Since the properties are
+                       written during the output phase, 'step', 'output' refer to the previous step. Defaults to 'motion'.""",
+                       'func': self.get_timing},
+
             "temperature": {"dimension": "temperature",
                             "help": "The current temperature, as obtained from the MD kinetic energy.",
                             "longhelp": """The current temperature, as obtained from the MD kinetic energy of the (extended)
@@ -649,6 +658,7 @@ class Properties(dobject):
         self.cell = system.cell
         self.forces = system.forces
         self.simul = system.simul
+        self.timings = system.timings
         # dummy beads and forcefield objects so that we can use scaled and
         # displaced path estimators without changing the simulation bead
         # coordinates
@@ -735,6 +745,21 @@ class Properties(dobject):
         else:
             return prop_vec[bead, 3 * atom:3 * (atom + 1)]
 
+    def get_timing(self, phase="motion"):
+        """Returns the wall clock time spent in a phase of the latest step.
+
+        Args:
+           phase: The name of the phase. The phases of the motion of the system
+              are taken from the system, the others from the simulation.
+        """
+
+        if phase in self.timings:
+            return self.timings[phase]
+        elif phase in self.simul.timings:
+            return self.simul.timings[phase]
+        else:
+            raise ValueError("Unknown timing phase '" + phase + "'")
+
     def get_temp(self, atom="", bead="", nm=""):
         """Calculates the MD kinetic temperature.
 
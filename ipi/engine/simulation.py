@@ -12,19 +12,156 @@ choosing which properties to initialise, and which properties to output.
 
 
 import os
+import sys
 import threading
 import time
+import Queue
 from copy import deepcopy
 
 from ipi.utils.depend import depend_value, dobject, dd
+from ipi.utils.io import open_backup
 from ipi.utils.io.inputs.io_xml import xml_parse_file
+from ipi.utils.io.inputs.io_binary import binary_file, is_binary
 from ipi.utils.messages import verbosity, info, warning, banner
 from ipi.utils.softexit import softexit
+from ipi.utils.profiler import Profiler
+from ipi.interfaces.status import StatusServer
 import ipi.engine.outputs as eoutputs
 import ipi.inputs.simulation as isimulation
 
 
-__all__ = ['Simulation']
+__all__ = ['Simulation', 'WorkerPool']
+
+
+# how often idle worker threads check whether they should stop, and how long
+# a worker that is still busy is waited for when the simulation is halted
+POOLTIMEOUT = 0.1
+POOLEXITTIMEOUT = 2.0
+
+
+class WorkerPool(object):
+    """A pool of persistent worker threads used to run tasks in parallel.
+
+    The threads are created once and reused for every batch of tasks, so
+    that running the per-system motion steps or the output writers
+    concurrently does not require spawning new threads at each step.
+    `run` acts as a barrier: it returns only once all the tasks in the
+    batch have been completed.
+
+    Attributes:
+        nworkers: The number of worker threads.
+        tasks: The queue of pending tasks.
+        threads: The list of worker threads.
+    """
+
+    def __init__(self, nworkers, name="worker"):
+        """Initialises WorkerPool and starts the worker threads.
+
+        Args:
+            nworkers: The number of worker threads to create.
+            name: A prefix for the names of the worker threads.
+        """
+
+        self.nworkers = nworkers
+        self.tasks = Queue.Queue()
+        self.threads = []
+        self._lock = threading.Condition()
+        self._pending = 0
+        self._errors = []
+        self._doloop = [True]
+
+        for i in xrange(nworkers):
+            t = threading.Thread(target=self._work, name="%s_%d" % (name, i))
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def _work(self):
+        """Main loop of each worker thread.
+
+        A `None` task stops the thread. The queue is polled, so that an idle
+        thread also stops once the pool is stopped, rather than being left
+        blocked when the interpreter shuts down. Queued tasks are always run
+        before stopping, since `run` waits for them.
+        """
+
+        while True:
+            try:
+                task = self.tasks.get(timeout=POOLTIMEOUT)
+            except Queue.Empty:
+                if not self._doloop[0]:
+                    break
+                continue
+            if task is None:
+                break
+            func, kwargs = task
+            try:
+                func(**kwargs)
+            except SystemExit:
+                # softexit.trigger() ends with sys.exit(), which should just
+                # terminate the task, as it would do for a standalone thread
+                pass
+            except Exception:
+                with self._lock:
+                    self._errors.append(sys.exc_info())
+            with self._lock:
+                self._pending -= 1
+                if self._pending == 0:
+                    self._lock.notify_all()
+
+    def run(self, tasks):
+        """Runs a batch of tasks and waits until all of them are completed.
+
+        Args:
+            tasks: A list of (function, kwargs) tuples.
+        """
+
+        if len(tasks) > self.nworkers:
+            # tasks may depend on each other (e.g. systems sharing a forcefield),
+            # so they must all be able to run at the same time
+            raise ValueError("Cannot run more tasks than worker threads in a WorkerPool")
+
+        with self._lock:
+            self._pending += len(tasks)
+        for t in tasks:
+            self.tasks.put(t)
+
+        with self._lock:
+            while self._pending > 0:
+                # This is necessary as wait() without timeout prevents main from receiving signals.
+                self._lock.wait(2.0)
+            errors = self._errors
+            self._errors = []
+
+        if len(errors) > 0:
+            etype, evalue, etb = errors[0]
+            raise etype, evalue, etb
+
+    def stop(self, timeout=None):
+        """Stops all the worker threads once the pending tasks are done.
+
+        Args:
+            timeout: The maximum time to wait for each thread to finish, or
+                None to wait until all of them have finished.
+        """
+
+        self._doloop[0] = False
+        for t in self.threads:
+            self.tasks.put(None)
+        for t in self.threads:
+            if t is not threading.currentThread():
+                t.join(timeout)
+        self.threads = []
+
+    def softexit(self):
+        """Stops the worker threads when the simulation is halted.
+
+        Softexit can be triggered from a worker thread, or while the other
+        workers are waiting for forces that will never be computed, so busy
+        workers are only waited for a limited time.
+        """
+
+        self.stop(POOLEXITTIMEOUT)
 
 
 class Simulation(dobject):
@@ -51,11 +188,27 @@ class Simulation(dobject):
             the current state of the simulation. This is because we cannot
             restart from half way through a step, only from the beginning of a
             step, so this is necessary for the trajectory to be continuous.
+        pool: A WorkerPool used to step the systems and write the outputs in
+            parallel when threading is enabled.
+        writer: An OutputWriter that formats and writes the property and
+            trajectory outputs in the background when threading is enabled.
+        timings: A dictionary holding the wall clock time spent in the different
+            phases of the latest step.
+        timing_file: The name of a file where the time spent in the different
+            phases of each step is written, or an empty string.
+        profiler: A statistical profiler, which samples the stacks of all the
+            threads during a window of steps.
+        status_socket: The name of a UNIX socket on which a summary of the
+            state of the simulation is served as JSON, or an empty string.
 
     Depend objects:
         step: The current simulation step.
     """
 
+    # phases of a step that are timed for the whole simulation and for each system
+    timing_phases = ["step", "motion", "smotion", "output", "checkpoint"]
+    system_timing_phases = ["motion", "forces", "propagation", "thermostat", "barostat"]
+
     @staticmethod
     def load_from_xml(fn_input, custom_verbosity=None, request_banner=False):
         """Load an XML input file and return a `Simulation` object.
@@ -68,14 +221,23 @@ class Simulation(dobject):
                 if verbosity is higher than 'quiet'.
         """
 
-        # parse the file
-        xmlrestart = xml_parse_file(open(fn_input))
+        # parse the file, that might also be a binary checkpoint
+        if is_binary(fn_input):
+            bfile = binary_file(fn_input)
+            xmlrestart = bfile.xml
+        else:
+            bfile = None
+            xmlrestart = xml_parse_file(open(fn_input), lowmem=True)
 
         # prepare the simulation input object
         input_simulation = isimulation.InputSimulation()
 
         # check the input and partition it appropriately
-        input_simulation.parse(xmlrestart.fields[0][1])
+        if bfile is None:
+            input_simulation.parse(xmlrestart.fields[0][1])
+        else:
+            with bfile:
+                input_simulation.parse(xmlrestart.fields[0][1])
 
         # override verbosity if requested
         if custom_verbosity is not None:
@@ -94,7 +256,7 @@ class Simulation(dobject):
         # echo the input file if verbose enough
         if verbosity.level > 0:
             print " # i-PI loaded input file: ", fn_input
-        if verbosity.level > 1:
+        if verbosity.level > 1 and bfile is None:
             print " --- begin input file content ---"
             ifile = open(fn_input, "r")
             for line in ifile.readlines():
@@ -104,7 +266,7 @@ class Simulation(dobject):
 
         return simulation
 
-    def __init__(self, mode, syslist, fflist, outputs, prng, smotion=None, step=0, tsteps=1000, ttime=0, threads=False):
+    def __init__(self, mode, syslist, fflist, outputs, prng, smotion=None, step=0, tsteps=1000, ttime=0, threads=False, timing_file="", profiler=None, status_socket=""):
         """Initialises Simulation class.
 
         Args:
@@ -120,6 +282,13 @@ class Simulation(dobject):
                 to 1000.
             ttime: The simulation running time. Used on restart, to keep a
                 cumulative total.
+            threads: Whether the systems should be stepped in parallel threads.
+            timing_file: An optional name of a file where the timings of
+                each step are written.
+            profiler: An optional statistical profiler, which samples the
+                stacks of all the threads during a window of steps.
+            status_socket: An optional name of a UNIX socket on which the
+                status of the simulation is served.
         """
 
         info(" # Initializing simulation object ", verbosity.low)
@@ -129,8 +298,8 @@ class Simulation(dobject):
         dself = dd(self)
 
         self.syslist = syslist
-        for s in syslist:
-            s.prng = self.prng    # bind the system's prng to self prng
+        for i, s in enumerate(syslist):
+            s.prng = self.prng.stream("system%d" % i)    # bind the system's prng to self prng, or to an independent stream
             s.init.init_stage1(s)
 
         #! TODO - does this have any meaning now that we introduce the smotion class?
@@ -151,6 +320,18 @@ class Simulation(dobject):
         self.chk = None
         self.rollback = True
 
+        self.pool = None
+        self.writer = None
+        self.timings = {"motion": 0.0, "smotion": 0.0, "output": 0.0, "checkpoint": 0.0, "step": 0.0}
+        self.timing_file = timing_file
+        if profiler is None:
+            profiler = Profiler()
+        self.profiler = profiler
+        self.status_socket = status_socket
+        self._run_start = None
+        self._run_steps = 0
+        self._run_time = 0.0
+
     def bind(self):
         """Calls the bind routines for all the objects in the simulation."""
 
@@ -167,6 +348,12 @@ class Simulation(dobject):
         if len(filename_list) > len(set(filename_list)):
             raise ValueError("Output filenames are not unique. Modify filename attributes.")
 
+        # with threading, outputs are formatted and written on a separate thread
+        if self.threading:
+            self.writer = eoutputs.OutputWriter()
+        else:
+            self.writer = None
+
         self.outputs = []
         for o in self.outtemplate:
             if type(o) is eoutputs.CheckpointOutput:    # checkpoints are output per simulation
@@ -178,11 +365,16 @@ class Simulation(dobject):
                     no = deepcopy(o)
                     if s.prefix != "":
                         no.filename = s.prefix + "_" + no.filename
-                    no.bind(s)
+                    no.bind(s, self.writer)
                     self.outputs.append(no)
                     isys += 1
 
-        self.chk = eoutputs.CheckpointOutput("RESTART", 1, True, 0)
+        # the soft exit restart file uses the same format as the checkpoints
+        chkformat = "xml"
+        for o in self.outputs:
+            if type(o) is eoutputs.CheckpointOutput and o.format == "binary":
+                chkformat = "binary"
+        self.chk = eoutputs.CheckpointOutput("RESTART", 1, True, 0, format=chkformat)
         self.chk.bind(self)
 
         if not self.smotion is None:
@@ -200,8 +392,11 @@ class Simulation(dobject):
         if not self.rollback:
             info("SOFTEXIT: Saving the latest status at the end of the step")
             self.chk.store()
+        else:
+            self.chk.rollback()
 
         self.chk.write(store=False)
+        self.chk.wait()
 
     def run(self):
         """Runs the simulation.
@@ -213,108 +408,104 @@ class Simulation(dobject):
 
         # registers the softexit routine
         softexit.register_function(self.softexit)
+        softexit.register_function(self.profiler.finish)
         softexit.start(self.ttime)
 
         for k, f in self.fflist.iteritems():
             f.run()
 
+        # optional endpoint to monitor the running simulation
+        server = None
+        if self.status_socket != "":
+            server = StatusServer(self.status_socket, self.status)
+            server.open()
+
+        # the same worker threads are reused for all the steps
+        if self.threading:
+            self.pool = WorkerPool(max(len(self.syslist), len(self.outputs)), name="simulation")
+            softexit.register_function(self.pool.softexit)
+
         # prints inital configuration -- only if we are not restarting
         if self.step == 0:
             self.step = -1
             # must use multi-threading to avoid blocking in multi-system runs with WTE
-            if self.threading:
-                stepthreads = []
-                for o in self.outputs:                    
-                    st = threading.Thread(target=o.write, name=o.filename)
-                    st.daemon = True
-                    st.start()
-                    stepthreads.append(st)
-
-                for st in stepthreads:
-                    while st.isAlive():
-                        # This is necessary as join() without timeout prevents main from receiving signals.
-                        st.join(2.0)
-            else:
-                for o in self.outputs:
-                    o.write()  # threaded output seems to cause random hang-ups. should make things properly thread-safe
-
+            self.write_outputs()
             self.step = 0
 
-        steptime = 0.0
         simtime = time.time()
+        self._run_start = simtime
+
+        # optional log of the time spent in each phase of each step
+        tfile = None
+        if self.timing_file != "":
+            tfile = open_backup(self.timing_file, "w")
+            tfile.write(self.timing_header())
 
         cstep = 0
-        #tptime = 0.0
-        #tqtime = 0.0
-        #tttime = 0.0
         ttot = 0.0
+        tphase = dict.fromkeys(self.timings, 0.0)
         # main MD loop
         for self.step in xrange(self.step, self.tsteps):
             # stores the state before doing a step.
-            # this is a bit time-consuming but makes sure that we can honor soft
-            # exit requests without screwing the trajectory
+            # this makes sure that we can honor soft exit requests without
+            # screwing the trajectory
 
-            steptime = -time.time()
+            tstep = time.time()
             if softexit.triggered:
                 break
 
-            self.chk.store()
+            self.profiler.step(self.step)
+
+            tstart = time.time()
+            self.chk.store_snapshot()
+            self.timings["checkpoint"] = time.time() - tstart
 
+            tstart = time.time()
             if self.threading:
-                stepthreads = []
-                # steps through all the systems
-                for s in self.syslist:
-                    # creates separate threads for the different systems
-                    st = threading.Thread(target=s.motion.step, name=s.prefix, kwargs={"step": self.step})
-                    st.daemon = True
-                    st.start()
-                    stepthreads.append(st)
-
-                for st in stepthreads:
-                    while st.isAlive():
-                        # This is necessary as join() without timeout prevents main from receiving signals.
-                        st.join(2.0)
+                # steps through all the systems, in separate threads
+                self.pool.run([(s.motion_step, {"step": self.step}) for s in self.syslist])
             else:
                 for s in self.syslist:
-                    s.motion.step(step=self.step)
+                    s.motion_step(step=self.step)
+            self.timings["motion"] = time.time() - tstart
 
             if softexit.triggered:
                 # Don't continue if we are about to exit.
                 break
 
             # does the "super motion" step
+            tstart = time.time()
             if self.smotion is not None:
                 # TODO: We need a file where we store the exchanges
                 self.smotion.step(self.step)
+            self.timings["smotion"] = time.time() - tstart
 
             if softexit.triggered:
                 # Don't write if we are about to exit.
                 break
 
-            if self.threading:
-                stepthreads = []
-                for o in self.outputs:
-                    st = threading.Thread(target=o.write, name=o.filename)
-                    st.daemon = True
-                    st.start()
-                    stepthreads.append(st)
-
-                for st in stepthreads:
-                    while st.isAlive():
-                        # This is necessary as join() without timeout prevents main from receiving signals.
-                        st.join(2.0)
-            else:
-                for o in self.outputs:
-                    o.write()
+            tstart = time.time()
+            self.write_outputs()
+            self.timings["output"] = time.time() - tstart
 
-            steptime += time.time()
-            ttot += steptime
+            self.timings["step"] = time.time() - tstep
+            ttot += self.timings["step"]
+            self._run_time += self.timings["step"]
+            self._run_steps += 1
+            for k in tphase:
+                tphase[k] += self.timings[k]
             cstep += 1
 
+            if tfile is not None:
+                tfile.write(self.timing_line())
+
             if (verbosity.high or (verbosity.medium and self.step % 100 == 0) or (verbosity.low and self.step % 1000 == 0)):
                 info(" # Average timings at MD step % 7d. t/step: %10.5e" % (self.step, ttot / cstep))
+                info(" # Average phase timings. motion: %10.5e smotion: %10.5e output: %10.5e checkpoint: %10.5e" %
+                     (tphase["motion"] / cstep, tphase["smotion"] / cstep, tphase["output"] / cstep, tphase["checkpoint"] / cstep), verbosity.high)
                 cstep = 0
                 ttot = 0.0
+                tphase = dict.fromkeys(self.timings, 0.0)
                 # info(" # MD diagnostics: V: %10.5e    Kcv: %10.5e   Ecns: %10.5e" %
                 #     (self.properties["potential"], self.properties["kinetic_cv"], self.properties["conserved"] ) )
 
@@ -326,4 +517,75 @@ class Simulation(dobject):
                 info(" # Wall clock time expired! Bye bye!", verbosity.low)
                 break
 
+        if self.pool is not None:
+            self.pool.stop()
+            self.pool = None
+
+        if tfile is not None:
+            tfile.close()
+
+        self.profiler.finish()
+
+        if server is not None:
+            server.close()
+
         self.rollback = False
+
+    def timing_header(self):
+        """Returns the header of the timing file, describing its columns."""
+
+        columns = ["step"] + ["time{%s}" % k for k in self.timing_phases]
+        for i, s in enumerate(self.syslist):
+            columns += ["system%d.time{%s}" % (i, k) for k in self.system_timing_phases]
+
+        rstr = ""
+        for i, c in enumerate(columns):
+            rstr += "# column %3d --> %s\n" % (i + 1, c)
+        return rstr
+
+    def timing_line(self):
+        """Returns a line of the timing file, with the timings of the latest step."""
+
+        rstr = "%10d" % (self.step + 1)
+        for k in self.timing_phases:
+            rstr += " %12.5e" % self.timings[k]
+        for s in self.syslist:
+            for k in self.system_timing_phases:
+                rstr += " %12.5e" % s.timings[k]
+        return rstr + "\n"
+
+    def status(self):
+        """Returns a summary of the state of the running simulation.
+
+        Called by the status server from its own thread, so it only reads
+        quantities that can be accessed safely while the simulation runs.
+
+        Returns:
+           A dictionary giving the current step, the average wall clock time
+           per step, the timings of the latest step, the state of the
+           requests and clients of each force field, and the number of
+           output jobs waiting to be written.
+        """
+
+        fstatus = {}
+        for k, f in self.fflist.iteritems():
+            fstatus[k] = f.status()
+
+        rstatus = {"step": self.step,
+                   "total_steps": self.tsteps,
+                   "elapsed": time.time() - self._run_start if self._run_start is not None else 0.0,
+                   "step_time": self._run_time / self._run_steps if self._run_steps > 0 else 0.0,
+                   "timings": dict(self.timings),
+                   "forcefields": fstatus,
+                   "requests": sum(f["requests"] for f in fstatus.values()),
+                   "output_pending": self.writer.pending() if self.writer is not None else 0}
+        return rstatus
+
+    def write_outputs(self):
+        """Writes all the outputs, in parallel if threading is enabled."""
+
+        if self.threading:
+            self.pool.run([(o.write, {}) for o in self.outputs])
+        else:
+            for o in self.outputs:
+                o.write()  # threaded output seems to cause random hang-ups. should make things properly thread-safe
@@ -51,6 +51,8 @@ class System(dobject):
        trajs: A trajectory object for dealing with trajectory output.
        init: A class to deal with initializing the system.
        simul: The parent simulation object.
+       timings: A dictionary giving the wall-clock time spent in the different
+          phases of the last motion step.
     """
 
     def __init__(self, init, beads, nm, cell, fcomponents, ensemble=None, motion=None, prefix=""):
@@ -86,6 +88,8 @@ class System(dobject):
         self.properties = Properties()
         self.trajs = Trajectories()
 
+        self.timings = {"motion": 0.0, "forces": 0.0, "propagation": 0.0, "thermostat": 0.0, "barostat": 0.0}
+
     def bind(self, simul):
         """Calls the bind routines for all the objects in the system."""
 
@@ -105,3 +109,31 @@ class System(dobject):
         self._propertylock = threading.Lock()
         self.properties.bind(self)
         self.trajs.bind(self)
+
+    def motion_step(self, step=None):
+        """Does a motion step, and records the time spent in its phases.
+
+        The time spent waiting for the forces is obtained from the force
+        objects, and the time spent in the thermostats from the integrator,
+        if there is one. The rest of the motion step is counted as
+        propagation.
+
+        Args:
+           step: The current simulation step.
+        """
+
+        tforces = -self.forces.wait_time()
+        tmotion = -time.time()
+        self.motion.step(step=step)
+        tmotion += time.time()
+        tforces += self.forces.wait_time()
+
+        integrator = getattr(self.motion, "integrator", None)
+        tthermo = getattr(integrator, "ttime", 0.0)
+        tbaro = getattr(integrator, "btime", 0.0)
+
+        self.timings["motion"] = tmotion
+        self.timings["forces"] = tforces
+        self.timings["thermostat"] = tthermo
+        self.timings["barostat"] = tbaro
+        self.timings["propagation"] = max(0.0, tmotion - tforces - tthermo - tbaro)
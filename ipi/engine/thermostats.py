@@ -531,6 +531,8 @@ class ThermoGLE(Thermostat):
           drift back towards equilibrium. Depends on A and the time step.
        S: Matrix for the stochastic contribution of the thermostat, i.e.
           the uncorrelated Gaussian noise. Depends on C and T.
+       TS: The matrices T and S side by side, so that the drift and the noise
+          can be applied with a single matrix product. Depends on T and S.
     """
 
     def get_T(self):
@@ -552,6 +554,11 @@ class ThermoGLE(Thermostat):
         rC = np.identity(self.ns + 1, float) * self.temp
         return rC[:]
 
+    def get_TS(self):
+        """Stacks the drift and noise matrices as [T|S]."""
+
+        return np.hstack((self.T, self.S))
+
     def __init__(self, temp=1.0, dt=1.0, A=None, C=None, ethermo=0.0):
         """Initialises ThermoGLE.
 
@@ -590,6 +597,8 @@ class ThermoGLE(Thermostat):
                                dependencies=[dself.A, dself.dt])
         dself.S = depend_value(name="S", func=self.get_S,
                                dependencies=[dself.C, dself.T])
+        dself.TS = depend_value(name="TS", func=self.get_TS,
+                                dependencies=[dself.T, dself.S])
 
         self.s = np.zeros(0)
 
@@ -634,19 +643,35 @@ class ThermoGLE(Thermostat):
             self.s[:] = np.dot(SC, self.prng.gvec(self.s.shape))
         else:
             info("GLE additional DOFs initialised from input.", verbosity.medium)
+            if not self.s.flags.c_contiguous:
+                self.s = np.ascontiguousarray(self.s)
+
+        # work buffers for the stacked [s; noise] block and for the momenta
+        self._sx = np.zeros((2 * (self.ns + 1), len(dself.m)))
+        self._p = np.zeros(len(dself.m))
 
     def step(self):
-        """Updates the bound momentum vector with a GLE thermostat"""
+        """Updates the bound momentum vector with a GLE thermostat.
 
-        p = dstrip(self.p).copy()
+        The momenta, the auxiliary momenta and the noise are collected in a
+        preallocated buffer [s; noise], so that both the drift and the noise
+        are applied by a single product with [T|S] written directly into s.
+        """
 
-        self.s[0, :] = self.p / self.sm
+        ns1 = self.ns + 1
+        sx = self._sx
+        sm = dstrip(self.sm)
 
-        self.ethermo += np.dot(self.s[0], self.s[0]) * 0.5
-        self.s[:] = np.dot(self.T, self.s) + np.dot(self.S, self.prng.gvec(self.s.shape))
-        self.ethermo -= np.dot(self.s[0], self.s[0]) * 0.5
+        np.divide(dstrip(self.p), sm, out=sx[0])
+        sx[1:ns1] = self.s[1:]
+        sx[ns1:] = self.prng.gvec(self.s.shape)
 
-        self.p = self.s[0] * self.sm
+        ekin = np.dot(sx[0], sx[0])
+        np.dot(self.TS, sx, out=self.s)
+        self.ethermo += 0.5 * (ekin - np.dot(self.s[0], self.s[0]))
+
+        np.multiply(self.s[0], sm, out=self._p)
+        self.p = self._p
 
 
 class ThermoNMGLE(Thermostat):
@@ -654,7 +679,8 @@ class ThermoNMGLE(Thermostat):
 
     An extension to the GLE thermostat which is applied in the
     normal modes representation, and which allows to use a different
-    GLE for each normal mode
+    GLE for each normal mode. All the normal modes are propagated at once,
+    with a batched matrix product.
 
     Attributes:
        ns: The number of auxilliary degrees of freedom.
@@ -670,6 +696,8 @@ class ThermoNMGLE(Thermostat):
           diffusion matrix, giving the strength of the coupling of the system
           with the heat bath, and thus the size of the stochastic
           contribution of the thermostat.
+       TS: The drift and noise matrices [T|S] of each normal mode, as in
+          ThermoGLE. Depends on A, C and dt.
     """
 
     def get_C(self):
@@ -680,6 +708,18 @@ class ThermoNMGLE(Thermostat):
             rv[b] = np.identity(self.ns + 1, float) * self.temp
         return rv[:]
 
+    def get_TS(self):
+        """Calculates the stacked drift and noise matrices of all the normal modes."""
+
+        ns1 = self.ns + 1
+        rTS = np.zeros((self.nb, ns1, 2 * ns1), float)
+        for b in range(self.nb):
+            T = matrix_exp(-0.5 * self.dt * self.A[b])
+            SST = Constants.kb * (self.C[b] - np.dot(T, np.dot(self.C[b], T.T)))
+            rTS[b, :, :ns1] = T
+            rTS[b, :, ns1:] = root_herm(SST)
+        return rTS
+
     def __init__(self, temp=1.0, dt=1.0, A=None, C=None, ethermo=0.0):
         """Initialises ThermoGLE.
 
@@ -761,62 +801,53 @@ class ThermoNMGLE(Thermostat):
                 self.s[b] = np.dot(SC, self.prng.gvec(self.s[b].shape))
         else:
             info("GLE additional DOFs initialised from input.", verbosity.medium)
+            if not self.s.flags.c_contiguous:
+                self.s = np.ascontiguousarray(self.s)
 
-        prev_ethermo = self.ethermo
-
-        # creates a set of thermostats to be applied to individual normal modes
-        self._thermos = [ThermoGLE(temp=1, dt=1, A=self.A[b], C=self.C[b]) for b in range(self.nb)]
+        dself.p = dd(nm).pnm
+        dself.m = dd(nm).dynm3
+        dself.sm = depend_array(name="sm", value=np.zeros(dself.m.shape),
+                                func=self.get_sm, dependencies=[dself.m])
+        dself.TS = depend_value(name="TS", func=self.get_TS,
+                                dependencies=[dself.A, dself.C, dself.dt])
 
-        # must pipe all the dependencies in such a way that values for the nm
-        # thermostats are automatically updated based on the "master" thermostat
-        def make_Agetter(k):
-            return lambda: self.A[k]
+        # work buffers for the stacked [s; noise] blocks and for the momenta
+        self._sx = np.zeros((self.nb, 2 * (self.ns + 1), nm.natoms * 3))
+        self._p = np.zeros((self.nb, nm.natoms * 3))
 
-        def make_Cgetter(k):
-            return lambda: self.C[k]
+        # other thermostats to be applied after the GLE
+        self._thermos = []
 
-        it = 0
-        for t in self._thermos:
-            t.s = self.s[it]  # gets the s's as a slice of self.s
-            t.bind(pm=(nm.pnm[it, :], nm.dynm3[it, :]), prng=self.prng)  # bind thermostat t to the it-th normal mode
+    def step(self):
+        """Updates the thermostat in NM representation, propagating all the
+        normal modes at once.
 
-            # pipes temp and dt
-            dpipe(dself.temp, dd(t).temp)
-            dpipe(dself.dt, dd(t).dt)
+        As in ThermoGLE, the momenta, the auxiliary momenta and the noise of
+        each mode are collected in a [s; noise] buffer, and all the modes are
+        propagated with a single batched product with [T|S]. The noise is drawn
+        in a single call, in the same order as it would be for one mode at a time.
+        """
 
-            # here we pipe the A and C of individual NM to the "master" arrays
-            dd(t).A.add_dependency(dself.A)
-            dd(t).A._func = make_Agetter(it)
-            dd(t).C.add_dependency(dself.C)
-            dd(t).C._func = make_Cgetter(it)
-            dself.ethermo.add_dependency(dd(t).ethermo)
-            it += 1
+        ns1 = self.ns + 1
+        sx = self._sx
+        sm = dstrip(self.sm)
 
-        # since the ethermo will be "delegated" to the normal modes thermostats,
-        # one has to split
-        # any previously-stored value between the sub-thermostats
-        for t in self._thermos:
-            t.ethermo = prev_ethermo / self.nb
+        np.divide(dstrip(self.p), sm, out=sx[:, 0])
+        sx[:, 1:ns1] = self.s[:, 1:]
+        sx[:, ns1:] = self.prng.gvec(self.s.shape)
 
-        dself.ethermo._func = self.get_ethermo;
+        ekin = np.einsum("ij,ij->", sx[:, 0], sx[:, 0])
+        np.matmul(self.TS, sx, out=self.s)
+        self.ethermo += 0.5 * (ekin - np.einsum("ij,ij->", self.s[:, 0], self.s[:, 0]))
 
-    def step(self):
-        """Updates the thermostat in NM representation by looping over the
-        individual DOFs.
-        """
+        np.multiply(self.s[:, 0], sm, out=self._p)
+        self.p = self._p
 
+        # the energy exchanged by the other thermostats is added to the total
         for t in self._thermos:
             t.step()
-
-    def get_ethermo(self):
-        """Computes the total energy transferred to the heat bath for all the nm
-        thermostats.
-        """
-
-        et = 0.0;
-        for t in self._thermos:
-            et += t.ethermo
-        return et
+            self.ethermo += t.ethermo
+            t.ethermo = 0.0
 
 
 class ThermoNMGLEG(ThermoNMGLE):
@@ -834,6 +865,7 @@ class ThermoNMGLEG(ThermoNMGLE):
     def __init__(self, temp=1.0, dt=1.0, A=None, C=None, tau=1.0, ethermo=0.0):
 
         super(ThermoNMGLEG, self).__init__(temp, dt, A, C, ethermo)
+        dself = dd(self)
         dself.tau = depend_value(value=tau, name='tau')
 
     def bind(self, beads=None, atoms=None, pm=None, nm=None, prng=None, fixdof=None):
@@ -855,6 +887,7 @@ class ThermoNMGLEG(ThermoNMGLE):
         """
 
         super(ThermoNMGLEG, self).bind(nm=nm, prng=prng, fixdof=fixdof)
+        dself = dd(self)
 
         t = ThermoSVR(self.temp, self.dt, self.tau)
 
@@ -865,7 +898,6 @@ class ThermoNMGLEG(ThermoNMGLE):
         dpipe(dself.dt, dd(t).dt)
         dpipe(dself.tau, dd(t).tau)
 
-        dd(self).ethermo.add_dependency(dd(t).ethermo)
         self._thermos.append(t)
 
 
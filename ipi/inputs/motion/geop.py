@@ -43,7 +43,7 @@ class InputGeop(InputDictionary):
 
     attribs = {"mode": (InputAttribute, {"dtype": str, "default": "lbfgs",
                                          "help": "The geometry optimization algorithm to be used",
-                                         "options": ['sd', 'cg', 'bfgs', 'bfgstrm', 'lbfgs']})}
+                                         "options": ['sd', 'cg', 'bfgs', 'bfgstrm', 'lbfgs', 'fire']})}
 
     # options of the method (mostly tolerances)
     fields = {"ls_options": (InputDictionary, {"dtype": [float, int, float, float],
@@ -56,6 +56,9 @@ class InputGeop(InputDictionary):
                                                "options": ["tolerance", "iter", "step", "adaptive"],
                                                "default": [1, 100, 1e-3, 1.0],
                                                "dimension": ["undefined", "undefined", "length", "undefined"]}),
+              "ls_parallel": (InputValue, {"dtype": int,
+                                           "default": 1,
+                                           "help": "The number of trial steps of the line search that are evaluated at once. The force calculations for all of them are queued together, so they can be computed concurrently by different clients, reducing the number of rounds of force evaluations. 1 uses the serial line search."}),
               "tolerances": (InputDictionary, {"dtype": float,
                                                "options": ["energy", "force", "position"],
                                                "default": [1e-7, 1e-4, 1e-3],
@@ -70,9 +73,40 @@ class InputGeop(InputDictionary):
                                             0 identity.
                                             1 Use first member of position/gradient list. 
                                             2 Use last  member of position/gradient list."""}),
+              "precond_lbfgs": (InputValue, {"dtype": str,
+                                             "default": "none",
+                                             "options": ["none", "exp", "lindh", "hessian"],
+                                             "help": """Preconditioner for L-BFGS, used as the initial inverse Hessian.
+                                            none: the identity.
+                                            exp: the exponential model of Packwood et al., coupling the atoms closer than twice the nearest neighbour distance.
+                                            lindh: the bond stretching terms of the model Hessian of Lindh et al.
+                                            hessian: the Hessian given in hessian_lbfgs, e.g. the one written by a phonons calculation."""}),
+              "precond_options": (InputDictionary, {"dtype": float,
+                                                    "options": ["mu", "A", "stab"],
+                                                    "default": [0.1, 3.0, 0.1],
+                                                    "help": """Options for the L-BFGS preconditioner. Includes:
+                              mu: energy scale of the exponential model, in atomic units,
+                              A: decay with distance of the exponential model,
+                              stab: constant added to the diagonal of the model Hessian, as a fraction of its average diagonal element.
+                              """}),
+              "hessian_lbfgs": (InputArray, {"dtype": float,
+                                             "default": input_default(factory=np.zeros, args=(0,)),
+                                             "help": "The Hessian used as preconditioner when precond_lbfgs is 'hessian', in atomic units. It can be read from the .hess file written by a phonons calculation, using mode='file'."}),
               "corrections_lbfgs": (InputValue, {"dtype": int,
                                                  "default": 6,
                                                  "help": "The number of past vectors to store for L-BFGS."}),
+              "fire_options": (InputDictionary, {"dtype": [float, float, float, int, float],
+                                                 "help": """Options for the FIRE optimizer. Includes:
+                              dt: the time step, which is adapted during the optimization,
+                              dtmax: the largest time step,
+                              alpha: the current mixing of the velocity with the direction of the force,
+                              nsteps: the number of steps since the last uphill move,
+                              maxstep: the largest displacement of an atom in one step.
+                              The default time steps are 1 and 10 fs.
+                              """,
+                                                 "options": ["dt", "dtmax", "alpha", "nsteps", "maxstep"],
+                                                 "default": [41.341373, 413.41373, 0.1, 0, 0.5],
+                                                 "dimension": ["time", "time", "undefined", "undefined", "length"]}),
               # re-start parameters, estimate hessian, etc.
               "old_pos": (InputArray, {"dtype": float,
                                        "default": input_default(factory=np.zeros, args=(0,)),
@@ -104,7 +138,11 @@ class InputGeop(InputDictionary):
                                            "help": "List of previous position differences for L-BFGS, if known."}),
               "glist_lbfgs": (InputArray, {"dtype": float,
                                            "default": input_default(factory=np.zeros, args=(0,)),
-                                           "help": "List of previous gradient differences for L-BFGS, if known."})
+                                           "help": "List of previous gradient differences for L-BFGS, if known."}),
+              "v_fire": (InputArray, {"dtype": float,
+                                      "default": input_default(factory=np.zeros, args=(0,)),
+                                      "help": "The velocities in a FIRE optimization.",
+                                      "dimension": "velocity"})
               }
 
     dynamic = {}
@@ -118,6 +156,7 @@ class InputGeop(InputDictionary):
 
         self.mode.store(geop.mode)
         self.tolerances.store(geop.tolerances)
+        self.ls_parallel.store(geop.ls_parallel)
 
         if geop.mode == "bfgs":
             self.old_direction.store(geop.d)
@@ -133,6 +172,9 @@ class InputGeop(InputDictionary):
             self.glist_lbfgs.store(geop.glist)
             self.corrections_lbfgs.store(geop.corrections)
             self.scale_lbfgs.store(geop.scale)
+            self.precond_lbfgs.store(geop.precond)
+            self.precond_options.store(geop.precond_options)
+            self.hessian_lbfgs.store(geop.precond_hessian)
             self.biggest_step.store(geop.big_step)
         elif geop.mode == "sd":
             self.ls_options.store(geop.ls_options)
@@ -140,6 +182,9 @@ class InputGeop(InputDictionary):
             self.old_direction.store(geop.d)
             self.ls_options.store(geop.ls_options)
             self.old_force.store(geop.old_f)
+        elif geop.mode == "fire":
+            self.fire_options.store(geop.fire_options)
+            self.v_fire.store(geop.v)
 
     def fetch(self):
         rv = super(InputGeop, self).fetch()
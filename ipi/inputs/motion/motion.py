@@ -72,6 +72,13 @@ class InputMotionBase(Input):
                                            "help": "Option for (path integral) molecular dynamics"}),
               "file": (InputInitFile, {"default": input_default(factory=ipi.engine.initializer.InitFile, kwargs={"mode": "xyz"}),
                                        "help": "This describes the location to read a trajectory file from."}),
+              "replay_options": (InputDictionary, {"dtype": int,
+                                                   "options": ["stride", "prefetch", "window"],
+                                                   "default": [1, 4, 1],
+                                                   "help": """Options for reading the trajectory file in replay mode. Includes:
+                              stride: the number of steps of the trajectory that are advanced at each step; the frames in between are skipped without being parsed,
+                              prefetch: the number of steps of the trajectory that are read ahead of time by a background thread. 0 reads each step when it is needed,
+                              window: the number of steps of the trajectory whose forces are requested at once. The steps are independent, so their force calculations are spread over all the clients, and the properties are still output in the order of the trajectory. 1 computes one step at a time."""}),
               "vibrations": (InputDynMatrix, {"default": {},
                                               "help": "Option for phonon computation"}),
               "alchemy": (InputAlchemy, {"default": {},
@@ -122,6 +129,7 @@ class InputMotionBase(Input):
 
         if tsc == 0:
             self.file.store(sc.intraj)
+            self.replay_options.store({"stride": sc.stride, "prefetch": sc.prefetch, "window": sc.window})
         elif tsc > 0:
             self.fixcom.store(sc.fixcom)
             self.fixatoms.store(sc.fixatoms)
@@ -137,7 +145,7 @@ class InputMotionBase(Input):
         super(InputMotionBase, self).fetch()
 
         if self.mode.fetch() == "replay":
-            sc = Replay(fixcom=self.fixcom.fetch(), fixatoms=self.fixatoms.fetch(), intraj=self.file.fetch())
+            sc = Replay(fixcom=self.fixcom.fetch(), fixatoms=self.fixatoms.fetch(), intraj=self.file.fetch(), **self.replay_options.fetch())
         elif self.mode.fetch() == "minimize":
             sc = GeopMotion(fixcom=self.fixcom.fetch(), fixatoms=self.fixatoms.fetch(), **self.optimizer.fetch())
         elif self.mode.fetch() == "neb":
@@ -45,7 +45,7 @@ class InputNEB(InputDictionary):
 
     attribs = {"mode": (InputAttribute, {"dtype": str, "default": "lbfgs",
                                          "help": "The geometry optimization algorithm to be used",
-                                         "options": ['sd', 'cg', 'bfgs', 'lbfgs']})}
+                                         "options": ['sd', 'cg', 'bfgs', 'lbfgs', 'fire']})}
 
     fields = {"ls_options": (InputDictionary, {"dtype": [float, int, float, float],
                                                "help": """Options for line search methods. Includes:
@@ -59,6 +59,9 @@ class InputNEB(InputDictionary):
                                                "options": ["tolerance", "iter", "step", "adaptive"],
                                                "default": [1e-6, 100, 1e-3, 1.0],
                                                "dimension": ["energy", "undefined", "length", "undefined"]}),
+              "ls_parallel": (InputValue, {"dtype": int,
+                                           "default": 1,
+                                           "help": "The number of trial steps of the line search that are evaluated at once. The force calculations for all of them are queued together, so they can be computed concurrently by different clients, reducing the number of rounds of force evaluations. 1 uses the serial line search."}),
               "tolerances": (InputDictionary, {"dtype": float,
                                                "options": ["energy", "force", "position"],
                                                "default": [1e-8, 1e-8, 1e-8],
@@ -98,10 +101,29 @@ class InputNEB(InputDictionary):
               "spring": (InputDictionary, {"dtype": [bool, float, float, float],
                                            "options": ["varsprings", "kappa", "kappamax", "kappamin"],
                                            "default": [False, 1.0, 1.5, 0.5],
-                                           "help": "Uniform or variable spring constants along the elastic band"}),
+                                           "help": "Uniform or variable spring constants along the elastic band. With variable springs, the spring constant between two images decreases linearly from kappamax at the highest image to kappamin when the higher of the two images is at the energy of the higher end of the band, and is kappamin below that."}),
               "climb": (InputValue, {"dtype": bool,
                                      "default": False,
-                                     "help": "Use climbing image NEB"})
+                                     "help": "Use climbing image NEB. The highest inner image feels no spring force, and the component of its force along the band is inverted, so it converges to the saddle point."}),
+              "freeze": (InputValue, {"dtype": bool,
+                                      "default": False,
+                                      "help": "Stop moving the images whose NEB force is below the force tolerance, and reuse their forces instead of sending them to the clients again. A frozen image is released when its NEB force rises above the tolerance because its neighbours moved. Only for the 'lbfgs' and 'fire' modes."}),
+              "fire_options": (InputDictionary, {"dtype": [float, float, float, int, float],
+                                                 "help": """Options for the FIRE optimizer. Includes:
+                              dt: the time step, which is adapted during the optimization,
+                              dtmax: the largest time step,
+                              alpha: the current mixing of the velocity with the direction of the force,
+                              nsteps: the number of steps since the last uphill move,
+                              maxstep: the largest displacement of an atom in one step.
+                              The default time steps are 1 and 10 fs.
+                              """,
+                                                 "options": ["dt", "dtmax", "alpha", "nsteps", "maxstep"],
+                                                 "default": [41.341373, 413.41373, 0.1, 0, 0.5],
+                                                 "dimension": ["time", "time", "undefined", "undefined", "length"]}),
+              "v_fire": (InputArray, {"dtype": float,
+                                      "default": input_default(factory=np.zeros, args=(0,)),
+                                      "help": "The velocities of the images in a FIRE optimization.",
+                                      "dimension": "velocity"})
               }
 
     dynamic = {}
@@ -112,6 +134,7 @@ class InputNEB(InputDictionary):
     def store(self, neb):
         if neb == {}: return
         self.ls_options.store(neb.ls_options)
+        self.ls_parallel.store(neb.ls_parallel)
         self.tolerances.store(neb.tolerances)
         self.mode.store(neb.mode)
         self.old_force.store(neb.old_f)
@@ -123,7 +146,10 @@ class InputNEB(InputDictionary):
         self.endpoints.store(neb.endpoints)
         self.spring.store(neb.spring)
         self.climb.store(neb.climb)
+        self.freeze.store(neb.freeze)
         self.scale_lbfgs.store(neb.scale)
+        self.fire_options.store(neb.fire_options)
+        self.v_fire.store(neb.v)
 
     def fetch(self):
         rv = super(InputNEB, self).fetch()
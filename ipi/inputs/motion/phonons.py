@@ -41,8 +41,8 @@ class InputDynMatrix(InputDictionary):
     """
 
     attribs = {"mode": (InputAttribute, {"dtype": str, "default": "fd",
-                                         "help": "The algorithm to be used: finite differences (fd), normal modes finite differences (nmfd), and energy-scaled normal mode finite differences (enmfd).",
-                                         "options": ["fd", "nmfd", "enmfd"]})}
+                                         "help": "The algorithm to be used: finite differences (fd), symmetry-reduced finite differences (sfd), normal modes finite differences (nmfd), and energy-scaled normal mode finite differences (enmfd). In sfd mode, the symmetry operations of the system are found from the positions and the cell, only the displacements that are not related by symmetry are computed, and the full dynamical matrix is rebuilt from them.",
+                                         "options": ["fd", "sfd", "nmfd", "enmfd"]})}
     fields = {
         "pos_shift": (InputValue, {"dtype": float, "default": 0.01,
                                    "help": "The finite displacement in position used to compute derivative of force."
@@ -59,6 +59,18 @@ class InputDynMatrix(InputDictionary):
                 "asr": (InputValue, {"dtype": str, "default": "none", "options": ["none", "poly", "lin", "crystal"],
                                      "help": "Removes the zero frequency vibrational modes depending on the symmerty of the system."
                                      }),
+                "batch": (InputValue, {"dtype": int, "default": 1,
+                                       "help": "The number of rows of the dynamical matrix computed at each step. The displaced configurations needed for all the rows of a batch are sent at once to the forcefield, so that they are computed concurrently by all the connected clients. Zero means that all the rows are computed in a single step."
+                                       }),
+                "symprec": (InputValue, {"dtype": float, "default": 1e-3,
+                                         "help": "The maximum displacement (in atomic units) of an atom from the image of another atom for them to be considered equivalent by a symmetry operation, in sfd mode."
+                                         }),
+                "rowfile": (InputValue, {"dtype": str, "default": "",
+                                         "help": "The name of a binary file to which the forces for the displaced configurations are appended as soon as each row is computed. When the calculation is restarted, the rows found in this file are not computed again, regardless of the number of clients or of the batch size. If empty, no file is written, and only the rows listed in the checkpoint are reused."
+                                         }),
+                "rows_done": (InputArray, {"dtype": int,
+                                           "default": np.zeros(0, int),
+                                           "help": "The indices of the rows of the dynamical matrix that have already been computed."}),
                 "dynmat": (InputArray, {"dtype": float,
                                         "default": np.zeros(0, float),
                                         "help": "Portion of the dynamical matrix known up to now."}),
@@ -80,6 +92,10 @@ class InputDynMatrix(InputDictionary):
         self.output_shift.store(phonons.deltaw)
         self.prefix.store(phonons.prefix)
         self.asr.store(phonons.asr)
+        self.batch.store(phonons.batch)
+        self.symprec.store(phonons.symprec)
+        self.rowfile.store(phonons.rowfile)
+        self.rows_done.store(phonons.rows_done)
         self.dynmat.store(phonons.dynmatrix)
         self.refdynmat.store(phonons.refdynmatrix)
 
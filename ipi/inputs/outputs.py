@@ -156,6 +156,7 @@ class InputCheckpoint(InputValue):
           data to file.
        overwrite: whether checkpoints should be overwritten, or multiple
           files output.
+       format: The file format, either 'xml' or 'binary'.
     """
 
     default_help = """This class defines how a checkpoint file should be output. Optionally, between the checkpoint tags, you can specify one integer giving the current step of the simulation. By default this integer will be zero."""
@@ -168,6 +169,9 @@ class InputCheckpoint(InputValue):
                                           "help": "The number of steps between successive writes."})
     attribs["overwrite"] = (InputAttribute, {"dtype": bool, "default": True,
                                              "help": "This specifies whether or not each consecutive checkpoint file will overwrite the old one."})
+    attribs["format"] = (InputAttribute, {"dtype": str, "default": "xml",
+                                          "options": ["xml", "binary"],
+                                          "help": "The format of the checkpoint file. 'xml' writes a plain text file. 'binary' writes the same xml description, but stores large arrays as raw binary data, so that the file is smaller and much faster to write and read back."})
 
     def __init__(self, help=None, default=None, dtype=None, dimension=None):
         """Initializes InputCheckpoint.
@@ -181,7 +185,7 @@ class InputCheckpoint(InputValue):
         """Returns a CheckpointOutput object."""
 
         step = super(InputCheckpoint, self).fetch()
-        return eoutputs.CheckpointOutput(self.filename.fetch(), self.stride.fetch(), self.overwrite.fetch(), step=step)
+        return eoutputs.CheckpointOutput(self.filename.fetch(), self.stride.fetch(), self.overwrite.fetch(), step=step, format=self.format.fetch())
 
     def parse(self, xml=None, text=""):
         """Overwrites the standard parse function so that we can specify this tag
@@ -209,6 +213,7 @@ class InputCheckpoint(InputValue):
         self.stride.store(chk.stride)
         self.filename.store(chk.filename)
         self.overwrite.store(chk.overwrite)
+        self.format.store(chk.format)
 
     def check(self):
         """Checks for optional parameters."""
@@ -36,8 +36,22 @@ class InputRandom(Input):
           0.0.
        set_pos: An optional integer giving the position in the state array
           that is being read from. Defaults to 0.
+       prefetch: An optional integer giving the number of Gaussian numbers
+          that are generated ahead of time in a background thread. Defaults
+          to 0.
+       split: An optional boolean giving whether independent streams of random
+          numbers are used by the different systems and thermostats. Defaults
+          to False.
+
+    Attributes:
+       name: The name of the stream, for the generators of the independent
+          streams.
     """
 
+    attribs = {"name": (InputAttribute, {"dtype": str,
+                                         "default": "",
+                                         "help": "The name of the stream of random numbers. Only used for the streams derived from the main generator."})}
+
     fields = {"seed": (InputValue, {"dtype": int,
                                     "default": 123456,
                                     "help": "This is the seed number used to generate the initial state of the random number generator."}),
@@ -52,7 +66,13 @@ class InputRandom(Input):
                                      "help": "The stored Gaussian number."}),
               "set_pos": (InputValue, {"dtype": int,
                                        "default": 0,
-                                       "help": "Gives the position in the state array that the random number generator is reading from."})}
+                                       "help": "Gives the position in the state array that the random number generator is reading from."}),
+              "prefetch": (InputValue, {"dtype": int,
+                                        "default": 0,
+                                        "help": "The number of Gaussian random numbers that are generated ahead of time by a background thread, in blocks. The sequence of random numbers does not depend on this setting. Zero disables the prefetching."}),
+              "split": (InputValue, {"dtype": bool,
+                                     "default": False,
+                                     "help": "If true, each system and each thermostat uses its own stream of random numbers, derived from the seed. This makes runs with several systems reproducible when the systems are evolved in parallel threads. The state of each stream is stored in a 'stream' tag."})}
 
     default_help = "Deals with the pseudo-random number generator."
     default_label = "PRNG"
@@ -72,6 +92,15 @@ class InputRandom(Input):
         self.set_pos.store(gstate[2])
         self.has_gauss.store(gstate[3])
         self.gauss.store(gstate[4])
+        self.prefetch.store(prng.prefetch)
+        self.split.store(prng.split)
+
+        self.extra = []
+        for name in sorted(prng.streams):
+            istream = InputRandom()
+            istream.store(prng.streams[name])
+            istream.name.store(name)
+            self.extra.append(("stream", istream))
 
     def fetch(self):
         """Creates a random number object.
@@ -84,6 +113,16 @@ class InputRandom(Input):
 
         super(InputRandom, self).fetch()
         if not self.state._explicit:
-            return Random(seed=self.seed.fetch())
+            prng = Random(seed=self.seed.fetch(), prefetch=self.prefetch.fetch(), split=self.split.fetch())
         else:
-            return Random(state=('MT19937', self.state.fetch(), self.set_pos.fetch(), self.has_gauss.fetch(), self.gauss.fetch()))
+            prng = Random(seed=self.seed.fetch(),
+                          state=('MT19937', self.state.fetch(), self.set_pos.fetch(), self.has_gauss.fetch(), self.gauss.fetch()),
+                          prefetch=self.prefetch.fetch(), split=self.split.fetch())
+
+        for (k, istream) in self.extra:
+            prng.streams[istream.name.fetch()] = istream.fetch()
+
+        return prng
+
+
+InputRandom.dynamic = {"stream": (InputRandom, {"help": "The state of one of the independent streams of random numbers."})}
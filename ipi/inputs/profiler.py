@@ -0,0 +1,84 @@
+"""Creates objects that deal with the statistical profiler."""
+
+# This file is part of i-PI.
+# i-PI Copyright (C) 2014-2015 i-PI developers
+# See the "licenses" directory for full license information.
+
+
+from ipi.utils.profiler import Profiler
+from ipi.utils.inputvalue import *
+
+
+__all__ = ['InputProfiler']
+
+
+class InputProfiler(Input):
+    """Profiler input class.
+
+    Handles generating the statistical profiler from the xml input file,
+    and generating the xml checkpoint tags from an instance of the object.
+
+    Attributes:
+       mode: The format of the profiler output, or 'off' to disable profiling.
+
+    Fields:
+       filename: The name of the output file. Defaults to 'profile'.
+       start: The first step that is profiled. Defaults to 0.
+       steps: The number of steps that are profiled. Defaults to 1.
+       interval: The time between two samples, in seconds. Defaults to 0.005.
+    """
+
+    attribs = {"mode": (InputAttribute, {"dtype": str,
+                                         "default": "off",
+                                         "options": ["off", "collapsed", "pstats"],
+                                         "help": "The format of the profiler output. 'collapsed' writes one line per stack, with the thread name and the functions separated by semicolons, followed by the number of samples, which can be turned into a flame graph. 'pstats' writes a file that can be read with the pstats module. 'off' disables the profiler."})}
+
+    fields = {"filename": (InputValue, {"dtype": str,
+                                        "default": "profile",
+                                        "help": "The name of the file the profiler output is written to."}),
+              "start": (InputValue, {"dtype": int,
+                                     "default": 0,
+                                     "help": "The first step that is profiled."}),
+              "steps": (InputValue, {"dtype": int,
+                                     "default": 1,
+                                     "help": "The number of steps that are profiled."}),
+              "interval": (InputValue, {"dtype": float,
+                                        "default": 0.005,
+                                        "help": "The wall clock time (in seconds) between two samples of the stacks of the threads."})}
+
+    default_help = "Runs a statistical profiler during a window of steps. The stacks of all the threads, including the ones communicating with the clients and writing the outputs, are sampled periodically from a background thread, so the simulation is not slowed down appreciably."
+    default_label = "PROFILER"
+
+    def store(self, profiler):
+        """Takes a profiler instance and stores a minimal representation of it.
+
+        Args:
+           profiler: A profiler object.
+        """
+
+        super(InputProfiler, self).store(profiler)
+        self.mode.store(profiler.mode)
+        self.filename.store(profiler.filename)
+        self.start.store(profiler.start)
+        self.steps.store(profiler.steps)
+        self.interval.store(profiler.interval)
+
+    def fetch(self):
+        """Creates a profiler object.
+
+        Returns:
+           A profiler object with the options given in the input.
+        """
+
+        super(InputProfiler, self).fetch()
+        return Profiler(mode=self.mode.fetch(), filename=self.filename.fetch(), start=self.start.fetch(),
+                        steps=self.steps.fetch(), interval=self.interval.fetch())
+
+    def check(self):
+        """Checks for optional parameters."""
+
+        super(InputProfiler, self).check()
+        if self.steps.fetch() < 0:
+            raise ValueError("The number of profiled steps must be positive.")
+        if self.interval.fetch() <= 0:
+            raise ValueError("The profiler sampling interval must be positive.")
@@ -15,11 +15,13 @@ from ipi.utils.depend import *
 from ipi.utils.inputvalue import *
 from ipi.utils.units import *
 from ipi.utils.prng import *
+from ipi.utils.profiler import Profiler
 from ipi.utils.io import *
 from ipi.utils.io.inputs.io_xml import *
 from ipi.utils.messages import verbosity
 from ipi.engine.smotion import Smotion
 from ipi.inputs.prng import InputRandom
+from ipi.inputs.profiler import InputProfiler
 from ipi.inputs.system import InputSystem, InputSysTemplate
 from ipi.engine.system import System
 import ipi.inputs.forcefields as iforcefields
@@ -48,6 +50,12 @@ class InputSimulation(Input):
        step: An integer giving the current simulation step. Defaults to 0.
        total_steps: The total number of steps. Defaults to 1000
        total_time:  The wall clock time limit. Defaults to 0 (no limit).
+       timing: The name of a file where the wall clock time spent in the
+          different phases of each step is written. Defaults to '' (no file).
+       status: The name of a UNIX socket on which a summary of the state of
+          the simulation is served as JSON. Defaults to '' (no socket).
+       profile: A statistical profiler, sampling the stacks of all the
+          threads during a window of steps. Disabled by default.
        paratemp: A helper object for parallel tempering simulations
 
     Dynamic fields:
@@ -72,6 +80,14 @@ class InputSimulation(Input):
               "total_time": (InputValue, {"dtype": float,
                                           "default": 0,
                                           "help": "The maximum wall clock time (in seconds)."}),
+              "timing": (InputValue, {"dtype": str,
+                                      "default": "",
+                                      "help": "The name of a file where the wall clock time (in seconds) spent in each phase of every step is written, for the whole simulation (motion, smotion, output and checkpoint) and for each system (waiting for the forces, propagation, thermostat and barostat). The same quantities can be output as the 'timing' property. If empty, no file is written."}),
+              "status": (InputValue, {"dtype": str,
+                                      "default": "",
+                                      "help": "The name of a UNIX socket on which the state of the running simulation is served. Each connection receives a line holding a JSON dictionary with the current step, the average wall clock time per step, the number of queued, running and completed force requests and the connected clients of each forcefield, and the number of outputs waiting to be written. If empty, no socket is created."}),
+              "profile": (InputProfiler, {"help": InputProfiler.default_help,
+                                          "default": input_default(factory=Profiler)}),
               "smotion": (InputSmotion, {"default": input_default(factory=Smotion),
                                          "help": "Options for a 'super-motion' step between system replicas"})
     }
@@ -83,7 +99,7 @@ class InputSimulation(Input):
                                               }),
                "threading": (InputAttribute, {"dtype": bool,
                                               "default": True,
-                                              "help": "Whether multiple-systems execution should be parallel. Makes execution non-reproducible due to the random number generator being used from concurrent threads."
+                                              "help": "Whether multiple-systems execution should be parallel. Makes execution non-reproducible due to the random number generator being used from concurrent threads, unless the systems use independent streams of random numbers (see the 'split' option of 'prng')."
                                               }),
                "mode": (InputAttribute, {"dtype": str,
                                          "default": "md",
@@ -118,6 +134,9 @@ class InputSimulation(Input):
         self.step.store(simul.step)
         self.total_steps.store(simul.tsteps)
         self.total_time.store(simul.ttime)
+        self.timing.store(simul.timing_file)
+        self.status.store(simul.status_socket)
+        self.profile.store(simul.profiler)
         self.smotion.store(simul.smotion)
         self.threading.store(simul.threading)
 
@@ -215,6 +234,9 @@ class InputSimulation(Input):
             step=self.step.fetch(),
             tsteps=self.total_steps.fetch(),
             ttime=self.total_time.fetch(),
-            threads=self.threading.fetch())
+            threads=self.threading.fetch(),
+            timing_file=self.timing.fetch(),
+            profiler=self.profile.fetch(),
+            status_socket=self.status.fetch())
 
         return rsim
@@ -86,6 +86,21 @@ class Status(object):
     Busy = 16
     Timeout = 32
 
+    @staticmethod
+    def names(status):
+        """Returns the names of the flags that are set in a status.
+
+        Args:
+           status: An integer labelling the status of a client.
+
+        Returns:
+           A list of strings, e.g. ['Up', 'Busy'].
+        """
+
+        if status == Status.Disconnected:
+            return ["Disconnected"]
+        return [n for n in ["Up", "Ready", "NeedsInit", "HasData", "Busy", "Timeout"] if status & getattr(Status, n)]
+
 
 class DriverSocket(socket.socket):
     """Deals with communication between the client and driver code.
@@ -481,6 +496,20 @@ class InterfaceSocket(object):
         if self.mode == "unix":
             os.unlink("/tmp/ipi_" + self.address)
 
+    def status(self):
+        """Returns a summary of the state of the connected clients.
+
+        Returns:
+           A dictionary giving the number of running jobs and, for each
+           client, its address, status flags and the id of its last request.
+        """
+
+        clients = []
+        for c in list(getattr(self, "clients", [])):
+            clients.append({"peer": str(c.peername), "status": Status.names(c.status),
+                            "lastreq": c.lastreq, "locked": c.locked})
+        return {"clients": clients, "jobs": len(getattr(self, "jobs", []))}
+
     def pool_update(self):
         """Deals with keeping the pool of client drivers up-to-date during a
         force calculation step.
@@ -0,0 +1,112 @@
+"""Serves a summary of the state of a running simulation on a UNIX socket.
+
+Every connection to the socket receives a single line holding a JSON
+dictionary, after which the connection is closed, e.g.
+
+   python -c "import socket; s = socket.socket(socket.AF_UNIX); s.connect('status.sock'); print s.recv(65536)"
+
+This makes it possible to monitor many simulations cheaply, without
+parsing the log, and to spot stalled pools of clients automatically.
+"""
+
+# This file is part of i-PI.
+# i-PI Copyright (C) 2014-2015 i-PI developers
+# See the "licenses" directory for full license information.
+
+
+import os
+import sys
+import json
+import socket
+import threading
+import traceback
+
+from ipi.utils.messages import verbosity, warning, info
+from ipi.utils.softexit import softexit
+
+
+__all__ = ['StatusServer']
+
+
+SERVERTIMEOUT = 0.25
+
+
+class StatusServer(object):
+    """Answers connections on a UNIX socket with the status of the simulation.
+
+    Attributes:
+       address: The name of the file of the UNIX socket.
+       status: A function taking no arguments that returns a dictionary
+          describing the state of the simulation.
+       server: The listening socket.
+    """
+
+    def __init__(self, address, status):
+        """Initialises StatusServer.
+
+        Args:
+           address: The name of the file of the UNIX socket.
+           status: The function returning the status dictionary.
+        """
+
+        self.address = address
+        self.status = status
+        self.server = None
+        self._thread = None
+        self._doloop = [False]
+
+    def open(self):
+        """Creates the socket and starts the thread answering the connections.
+
+        Raises:
+           RuntimeError: Raised if the socket cannot be created.
+        """
+
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.server.bind(self.address)
+        except socket.error:
+            raise RuntimeError("Error opening the status socket. Check if a file " + self.address + " exists, and remove it if unused.")
+        self.server.listen(5)
+        self.server.settimeout(SERVERTIMEOUT)
+        info(" @STATUS: Serving the simulation status on " + self.address, verbosity.low)
+
+        self._doloop[0] = True
+        self._thread = threading.Thread(target=self._serve_loop, name="status")
+        self._thread.daemon = True
+        self._thread.start()
+        softexit.register_function(self.close)
+        softexit.register_thread(self._thread, self._doloop)
+
+    def _serve_loop(self):
+        """Answers the incoming connections until the server is closed."""
+
+        while self._doloop[0]:
+            try:
+                conn, addr = self.server.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+
+            try:
+                conn.sendall(json.dumps(self.status(), sort_keys=True) + "\n")
+            except Exception:
+                warning(" @STATUS: Exception while sending the status:\n" + "".join(traceback.format_exception(*sys.exc_info())), verbosity.medium)
+            finally:
+                conn.close()
+
+    def close(self):
+        """Stops answering the connections and removes the socket file."""
+
+        if self.server is None:
+            return
+
+        self._doloop[0] = False
+        if self._thread is not None and self._thread is not threading.currentThread():
+            self._thread.join()
+        self._thread = None
+        self.server.close()
+        self.server = None
+        if os.path.exists(self.address):
+            os.remove(self.address)
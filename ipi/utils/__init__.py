@@ -5,4 +5,4 @@
 # See the "licenses" directory for full license information.
 
 
-__all__ = ['depend', 'units', 'mathtools', 'prng', 'inputvalue', 'nmtransform', 'messages', 'softexit', 'io']
+__all__ = ['depend', 'units', 'mathtools', 'prng', 'inputvalue', 'nmtransform', 'messages', 'softexit', 'profiler', 'symmetry', 'io']
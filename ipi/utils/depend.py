@@ -643,11 +643,13 @@ class depend_array(np.ndarray, depend_base):
 __dp_dot = np.dot
 
 
-def dep_dot(da, db):
+def dep_dot(da, db, out=None):
     a = dstrip(da)
     b = dstrip(db)
 
-    return __dp_dot(a, b)
+    if out is None:
+        return __dp_dot(a, b)
+    return __dp_dot(a, b, out=dstrip(out))
 
 np.dot = dep_dot
 
@@ -23,6 +23,7 @@ from copy import copy
 import numpy as np
 
 from ipi.utils.io.inputs.io_xml import *
+from ipi.utils.io.inputs.io_binary import binary_current_store, binary_current_file
 from ipi.utils.units import unit_to_internal, unit_to_user
 
 
@@ -937,7 +938,7 @@ class InputArray(InputValue):
     attribs["shape"] = (InputAttribute, {"dtype": tuple, "help": "The shape of the array.", "default": (0,)})
     attribs["mode"] = (InputAttribute, {"dtype": str,
                                         "default": "manual",
-                                        "options": ["manual", "file"],
+                                        "options": ["manual", "file", "binary"],
                                         "help": "If 'mode' is 'manual', then the array is read from the content of 'cell' takes a 9-elements vector containing the cell matrix (row-major). If 'mode' is 'abcABC', then 'cell' takes an array of 6 floats, the first three being the length of the sides of the system parallelopiped, and the last three being the angles (in degrees) between those sides. Angle A corresponds to the angle between sides b and c, and so on for B and C. If mode is 'abc', then this is the same as for 'abcABC', but the cell is assumed to be orthorhombic. 'pdb' and 'chk' read the cell from a PDB or a checkpoint file, respectively."})
 
     def __init__(self, help=None, default=None, dtype=None, dimension=None):
@@ -1001,22 +1002,18 @@ class InputArray(InputValue):
            A string giving the stored value in the appropriate xml format.
         """
 
-        rstr = ""
-        if (len(self.value) > ELPERLINE):
-            rstr += "\n" + indent + " [ "
-        else:
-            rstr += " [ "  # inlines the array if it is small enough
-
-        for i, v in enumerate(self.value):
-            if (len(self.value) > ELPERLINE and i > 0 and i % ELPERLINE == 0):
-                rstr += "\n" + indent + "   "
-            rstr += write_type(self.type, v) + ", "
+        # large numerical arrays are stored as raw data when writing a binary checkpoint
+        bstore = binary_current_store()
+        if bstore is not None and len(self.value) > ELPERLINE and self.value.dtype.kind in "biuf":
+            self.mode.store("binary")
+            rstr = Input.write(self, name=name, indent=indent, text=" %d " % bstore.add(self.value))
+            self.mode.store("manual")
+            return rstr
 
-        rstr = rstr.rstrip(", ")  # get rid of trailing commas
         if (len(self.value) > ELPERLINE):
-            rstr += " ]\n"
+            rstr = "\n" + indent + " [ " + write_array(self.type, self.value, ELPERLINE, "\n" + indent + "   ") + " ]\n"
         else:
-            rstr += " ] "
+            rstr = " [ " + write_array(self.type, self.value) + " ] "  # inlines the array if it is small enough
 
         return Input.write(self, name=name, indent=indent, text=rstr)
 
@@ -1036,6 +1033,12 @@ class InputArray(InputValue):
             self.value = read_array(self.type, self._text)
         elif mode == "file":
             self.value = np.loadtxt(self._text.strip(), comments="#", dtype=self.type).flatten()
+        elif mode == "binary":
+            bfile = binary_current_file()
+            if bfile is None:
+                raise ValueError("Arrays in 'binary' mode can only be read from a binary checkpoint")
+            self.value = np.asarray(bfile.array(int(self._text)), dtype=self.type).flatten()
+            self.mode.store("manual")
         else:
             raise ValueError("Unsupported array reading mode")
 
@@ -289,6 +289,27 @@ def iter_file_name_raw(filename):
     return iter_file_raw(os.path.splitext(filename)[1], open(filename))
 
 
+def backup_file(filename):
+    """Moves an existing file out of the way, keeping all previous backups.
+
+    If the file exists, it is renamed to a new file name of the form
+    '#filename#i#', with the smallest i that is not used yet.
+
+    Args:
+        filename: The name of the file to back up.
+    """
+
+    i = 0
+    fn_backup = filename
+    while os.path.isfile(fn_backup):
+        fn_backup = '#' + filename + '#%i#' % i
+        i += 1
+
+    if fn_backup != filename:
+        os.rename(filename, fn_backup)
+        info('Backup performed: {0:s} -> {1:s}'.format(filename, fn_backup), verbosity.low)
+
+
 def open_backup(filename, mode='r', buffering=-1):
     """A wrapper around `open` which saves backup files.
 
@@ -306,18 +327,8 @@ def open_backup(filename, mode='r', buffering=-1):
     """
 
     if mode.startswith('w'):
-
         # If writing, make sure nothing is overwritten.
-
-        i = 0
-        fn_backup = filename
-        while os.path.isfile(fn_backup):
-            fn_backup = '#' + filename + '#%i#' % i
-            i += 1
-
-        if fn_backup != filename:
-            os.rename(filename, fn_backup)
-            info('Backup performed: {0:s} -> {1:s}'.format(filename, fn_backup), verbosity.low)
+        backup_file(filename)
 
     else:
         # There is no need to back up.
@@ -1,5 +1,6 @@
 """Contains different implementations for reading/checkpointing an i-PI
-simulation. For now only xml, but in future possibly also yml/json.
+simulation. For now xml, and binary checkpoints that hold the xml description
+together with raw array data, but in future possibly also yml/json.
 """
 
 # This file is part of i-PI.
@@ -7,4 +8,4 @@ simulation. For now only xml, but in future possibly also yml/json.
 # See the "licenses" directory for full license information.
 
 
-__all__ = ["io_xml"]
+__all__ = ["io_xml", "io_binary"]
@@ -0,0 +1,191 @@
+"""Functions used to read and write checkpoint files in a binary format.
+
+A binary checkpoint holds the same XML description of the simulation as a
+standard checkpoint, but large numerical arrays are not written as text.
+They are instead stored as raw little-endian data in the body of the file,
+and the corresponding XML tags only contain the position of the array in
+an index. The file is laid out as follows:
+
+   magic string (8 bytes)
+   offset and length of the header (two little-endian 64-bit integers)
+   array data, each array aligned to BINARY_ALIGN bytes
+   header: a JSON dictionary holding the XML text and the array index
+
+Arrays can then be memory-mapped when the checkpoint is read back, so that
+restarting does not require parsing millions of numbers from text.
+"""
+
+# This file is part of i-PI.
+# i-PI Copyright (C) 2014-2015 i-PI developers
+# See the "licenses" directory for full license information.
+
+
+import json
+import struct
+import threading
+
+import numpy as np
+
+from ipi.utils.io.inputs.io_xml import xml_parse_string
+
+
+__all__ = ['binary_store', 'binary_file', 'binary_write', 'is_binary',
+           'binary_current_store', 'binary_current_file']
+
+
+BINARY_MAGIC = "IPIBCHK1"
+BINARY_VERSION = 1
+BINARY_ALIGN = 64
+
+# the store (when writing) or the file (when parsing) used by InputArray
+# objects is kept per thread, so checkpoints can be written in the background
+_context = threading.local()
+
+
+class binary_store(object):
+    """Class to collect the arrays that must be written to a binary checkpoint.
+
+    Attributes:
+        arrays: A list of the arrays to be written.
+    """
+
+    def __init__(self):
+        """Initialises binary_store."""
+
+        self.arrays = []
+        self._ids = {}
+
+    def add(self, value):
+        """Adds an array to the store.
+
+        Input objects may be written more than once (e.g. to check whether
+        they differ from their default value), so an array that has been
+        added already is not stored again.
+
+        Args:
+            value: A numpy array.
+
+        Returns:
+            The index of the array in the store.
+        """
+
+        key = id(value)
+        if key not in self._ids:
+            self._ids[key] = len(self.arrays)
+            self.arrays.append(value)
+        return self._ids[key]
+
+    def __enter__(self):
+        _context.store = self
+        return self
+
+    def __exit__(self, etype, evalue, etb):
+        _context.store = None
+
+
+class binary_file(object):
+    """Class to read the content of a binary checkpoint.
+
+    Attributes:
+        filename: The name of the checkpoint file.
+        index: A list of dictionaries describing the stored arrays.
+        xml: A xml_node for the root node of the XML description.
+    """
+
+    def __init__(self, filename):
+        """Initialises binary_file, reading the header of the checkpoint.
+
+        Args:
+            filename: The name of the checkpoint file.
+
+        Raises:
+            ValueError: If the file is not a binary checkpoint of a supported version.
+        """
+
+        self.filename = filename
+        with open(filename, "rb") as stream:
+            if stream.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+                raise ValueError("File " + filename + " is not a binary checkpoint")
+            hoffset, hlength = struct.unpack("<QQ", stream.read(16))
+            stream.seek(hoffset)
+            header = json.loads(stream.read(hlength))
+
+        if header["version"] > BINARY_VERSION:
+            raise ValueError("Unsupported binary checkpoint version " + str(header["version"]))
+        self.index = header["arrays"]
+        self.xml = xml_parse_string(header["xml"].encode("utf-8"))
+
+    def array(self, i):
+        """Returns a read-only memory map of one of the stored arrays.
+
+        Args:
+            i: The index of the array.
+        """
+
+        entry = self.index[i]
+        shape = tuple(entry["shape"])
+        if np.prod(shape) == 0:
+            return np.zeros(shape, np.dtype(str(entry["dtype"])))
+        return np.memmap(self.filename, dtype=np.dtype(str(entry["dtype"])), mode="r",
+                         offset=entry["offset"], shape=shape)
+
+    def __enter__(self):
+        _context.file = self
+        return self
+
+    def __exit__(self, etype, evalue, etb):
+        _context.file = None
+
+
+def binary_current_store():
+    """Returns the binary_store that arrays are being written to, if any."""
+
+    return getattr(_context, "store", None)
+
+
+def binary_current_file():
+    """Returns the binary_file that arrays are being read from, if any."""
+
+    return getattr(_context, "file", None)
+
+
+def is_binary(filename):
+    """Checks whether a file is a binary checkpoint.
+
+    Args:
+        filename: The name of the file.
+    """
+
+    with open(filename, "rb") as stream:
+        return stream.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def binary_write(stream, inp, name=""):
+    """Writes an input object to a binary checkpoint.
+
+    Args:
+        stream: A seekable file object, opened in binary mode.
+        inp: The Input object to be written.
+        name: The name of the root tag.
+    """
+
+    with binary_store() as store:
+        xml = inp.write(name=name)
+
+    stream.write(BINARY_MAGIC)
+    stream.write(struct.pack("<QQ", 0, 0))
+
+    index = []
+    for arr in store.arrays:
+        pad = (-stream.tell()) % BINARY_ALIGN
+        stream.write("\0" * pad)
+        data = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder("<"))
+        index.append({"dtype": data.dtype.str, "shape": list(data.shape), "offset": stream.tell()})
+        stream.write(data.data)
+
+    header = json.dumps({"version": BINARY_VERSION, "xml": xml, "arrays": index})
+    hoffset = stream.tell()
+    stream.write(header)
+    stream.seek(len(BINARY_MAGIC))
+    stream.write(struct.pack("<QQ", hoffset, len(header)))
+    stream.seek(0, 2)
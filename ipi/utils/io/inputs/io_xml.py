@@ -14,10 +14,18 @@ import string
 import numpy as np
 
 
-__all__ = ['xml_node', 'xml_handler', 'xml_parse_string', 'xml_parse_file', 'xml_write',
+__all__ = ['xml_node', 'xml_handler', 'xml_array_buffer', 'xml_parse_string', 'xml_parse_file', 'xml_write',
            'read_type', 'read_float', 'read_int', 'read_bool', 'read_list',
            'read_array', 'read_tuple', 'read_dict', 'write_type', 'write_list',
-           'write_tuple', 'write_float', 'write_bool', 'write_dict']
+           'write_tuple', 'write_float', 'write_bool', 'write_dict', 'write_array']
+
+
+# arrays with at least this many elements are decoded while they are read
+# when parsing in low-memory mode
+XML_STREAM_SIZE = 1000
+
+# integers larger than this are not all represented exactly by a float
+XML_STREAM_MAXINT = 2**53
 
 
 class xml_node(object):
@@ -55,6 +63,146 @@ class xml_node(object):
         self.fields = fields
 
 
+class xml_array_buffer(object):
+    """Class to decode the text of a large array node while it is being read.
+
+    The text of array nodes is normally collected as a list of strings, which
+    are joined and converted to an array only after the whole file has been
+    read. An xml_array_buffer instead converts each chunk of text as soon as
+    it arrives, and stores the values in an array that is allocated once from
+    the shape of the node, so that the text never has to be kept in memory.
+
+    Values are decoded as floats, since the type of the array is not known
+    while the file is being read. If the text cannot be decoded (for instance
+    because the array holds strings), or if it holds values so large that
+    they might be integers that a float does not represent exactly, the
+    values that have been read so far are converted back to text, and the
+    rest of the data is collected as usual, so that the node is parsed
+    exactly as it would be otherwise.
+
+    Attributes:
+        data: The array holding the decoded values.
+        n: The number of values decoded so far.
+        text: None while the data are being decoded, otherwise the list of the
+            strings collected after the decoding has been abandoned.
+    """
+
+    def __init__(self, size):
+        """Initialises xml_array_buffer.
+
+        Args:
+            size: The number of elements of the array.
+        """
+
+        self.data = np.zeros(size, float)
+        self.n = 0
+        self.text = None
+        self._raw = ""
+        self._started = False
+        self._closed = False
+
+    def _fallback(self):
+        """Stops decoding the data and reverts to collecting the text."""
+
+        head = ""
+        if self._started:
+            head = "[ " + "".join(["%.17g, " % v for v in self.data[:self.n].tolist()])
+        self.text = [head, self._raw]
+        self._raw = ""
+        self.data = None
+
+    def _decode(self, body, ntokens):
+        """Decodes a comma-separated list of numbers.
+
+        Args:
+            body: The string to be decoded.
+            ntokens: The number of numbers expected in the string.
+
+        Returns:
+            False if the string could not be decoded.
+        """
+
+        if ntokens == 0:
+            return body.strip() == ""
+        try:
+            values = np.fromstring(str(body).replace(",", " "), dtype=float, sep=" ")
+        except (ValueError, UnicodeError):
+            return False
+        if len(values) != ntokens or self.n + ntokens > len(self.data):
+            return False
+        if np.any(np.abs(values) > XML_STREAM_MAXINT):
+            return False
+        self.data[self.n:self.n + ntokens] = values
+        self.n += ntokens
+        return True
+
+    def feed(self, chunk):
+        """Decodes a chunk of the text of the node.
+
+        Args:
+            chunk: The string to be decoded.
+        """
+
+        if self.text is not None:
+            self.text.append(chunk)
+            return
+
+        self._raw += chunk
+        if self._closed:
+            if self._raw.strip() != "":
+                self._fallback()
+            return
+
+        if not self._started:
+            begin = self._raw.find("[")
+            if begin < 0:
+                if self._raw.strip() != "":
+                    self._fallback()
+                return
+            if self._raw[:begin].strip() != "":
+                self._fallback()
+                return
+            self._started = True
+            self._raw = self._raw[begin + 1:]
+
+        end = self._raw.find("]")
+        if end >= 0:
+            body = self._raw[:end]
+            ntokens = body.count(",") + 1
+            if body.strip() == "":
+                ntokens = 0
+        else:
+            # the last number might continue in the next chunk
+            end = self._raw.rfind(",")
+            if end < 0:
+                return
+            body = self._raw[:end + 1]
+            ntokens = body.count(",")
+
+        if not self._decode(body, ntokens):
+            self._fallback()
+            return
+
+        if self._raw[end] == "]":
+            self._closed = True
+        self._raw = self._raw[end + 1:]
+        if self._closed and self._raw.strip() != "":
+            self._fallback()
+
+    def close(self):
+        """Finishes reading the node.
+
+        Returns:
+            The decoded array, or the text of the node if it could not be decoded.
+        """
+
+        if self.text is None and not self._closed:
+            self._fallback()
+        if self.text is not None:
+            return "".join(self.text)
+        return self.data[:self.n]
+
+
 class xml_handler(ContentHandler):
     """Class giving general xml_reading methods.
 
@@ -70,10 +218,16 @@ class xml_handler(ContentHandler):
         level: The level of nesting that the parser is currently at.
         buffer: A list of the data found between the tags at the different levels
             of nesting.
+        lowmem: If True, the text of large arrays is decoded while it is read.
     """
 
-    def __init__(self):
-        """Initialises xml_handler."""
+    def __init__(self, lowmem=False):
+        """Initialises xml_handler.
+
+        Args:
+            lowmem: An optional boolean giving whether large arrays should be
+                decoded while they are read. Defaults to False.
+        """
 
         # root xml node with all the data
         self.root = xml_node(name="root", fields=[])
@@ -85,6 +239,7 @@ class xml_handler(ContentHandler):
         # root tags, and buffer[1] holds all the data collected between the
         # first child tag.
         self.buffer = [[""]]
+        self.lowmem = lowmem
 
     def startElement(self, name, attrs):
         """Reads an opening tag.
@@ -105,9 +260,28 @@ class xml_handler(ContentHandler):
         # adds it to the list of fields of the parent tag
         self.open[self.level].fields.append((name, newnode))
         # gets ready to read new data
-        self.buffer.append([""])
+        self.buffer.append(self._newbuffer(newnode.attribs))
         self.level += 1
 
+    def _newbuffer(self, attribs):
+        """Returns the buffer to be used to read the data of a new tag.
+
+        In low-memory mode, arrays which are given explicitly and have a shape
+        with at least XML_STREAM_SIZE elements are decoded while they are read.
+
+        Args:
+            attribs: The attribute data of the new tag.
+        """
+
+        if self.lowmem and "shape" in attribs and attribs.get("mode", "manual").strip() == "manual":
+            try:
+                size = int(np.prod(read_tuple(attribs["shape"])))
+            except ValueError:
+                size = 0
+            if size >= XML_STREAM_SIZE:
+                return xml_array_buffer(size)
+        return [""]
+
     def characters(self, data):
         """Reads data.
 
@@ -119,7 +293,10 @@ class xml_handler(ContentHandler):
             data: The data to be read.
         """
 
-        self.buffer[self.level].append(data)
+        if isinstance(self.buffer[self.level], xml_array_buffer):
+            self.buffer[self.level].feed(data)
+        else:
+            self.buffer[self.level].append(data)
 
     def endElement(self, name):
         """Reads a closing tag.
@@ -132,8 +309,11 @@ class xml_handler(ContentHandler):
         """
 
         # all the text found between the tags stored in the appropriate xml_node
-        # object
-        self.buffer[self.level] = ''.join(self.buffer[self.level])
+        # object. Arrays decoded while reading are stored directly.
+        if isinstance(self.buffer[self.level], xml_array_buffer):
+            self.buffer[self.level] = self.buffer[self.level].close()
+        else:
+            self.buffer[self.level] = ''.join(self.buffer[self.level])
         self.open[self.level].fields.append(("_text", self.buffer[self.level]))
         #'closes' the xml_node object, as we are no longer within its tags, so
         # there is no more data to be added to it.
@@ -159,17 +339,20 @@ def xml_parse_string(buf):
     return myhandle.root
 
 
-def xml_parse_file(stream):
+def xml_parse_file(stream, lowmem=False):
     """Parses an entire xml input file.
 
     Args:
         stream: A string describing a xml formatted file.
+        lowmem: An optional boolean giving whether large arrays should be
+            decoded while the file is read, in which case the text field of
+            their nodes holds an array rather than a string. Defaults to False.
 
     Returns:
         A xml_node for the root node of the file.
     """
 
-    myhandle = xml_handler()
+    myhandle = xml_handler(lowmem=lowmem)
     parse(stream, myhandle)
     return myhandle.root
 
@@ -209,6 +392,8 @@ def xml_write(xml, name="", indent="", text=""):
     inline = False
     for a, v in xml.fields:
         if a == "_text":
+            if isinstance(v, np.ndarray):
+                v = "[ " + write_array(v.dtype, v) + " ]"
             rstr += v.strip()
             if v.strip() != "": inline = True
         else:
@@ -349,16 +534,45 @@ def read_array(dtype, data):
     the use of square brackets.
 
     Args:
-        data: The string to be read in.
+        data: The string to be read in, or an array that has already been
+            decoded by the xml parser.
         dtype: The data type of the elements of the target array.
 
     Raises:
         ValueError: Raised if the input data is not of the correct format.
 
+    Numerical arrays are converted in bulk by numpy, which is much faster
+    than converting each element separately for large arrays. If the bulk
+    conversion fails, the elements are converted one by one so that the
+    same errors are raised as for other data types.
+
     Returns:
         An array of data type dtype.
     """
 
+    if isinstance(data, np.ndarray):
+        # array already decoded by the xml parser
+        if np.dtype(dtype).kind in "iu" and np.any(np.mod(data, 1) != 0):
+            raise ValueError("Non-integer values in an array of integers")
+        return np.asarray(data, dtype)
+
+    if np.dtype(dtype).kind in "iuf":
+        try:
+            begin = data.index("[")
+            end = data.index("]")
+        except ValueError:
+            raise ValueError("Error in list syntax: could not locate delimiters")
+
+        body = data[begin + 1:end]
+        if body.strip() == "":
+            return np.zeros(0, dtype)
+        try:
+            values = np.fromstring(body.replace(",", " "), dtype=dtype, sep=" ")
+        except ValueError:
+            values = None
+        if values is not None and len(values) == body.count(",") + 1:
+            return values
+
     rlist = read_list(data)
     for i in range(len(rlist)):
         rlist[i] = read_type(dtype, rlist[i])
@@ -525,6 +739,48 @@ def write_float(data):
     return "%16.8e" % data
 
 
+def write_array(dtype, data, ncol=0, newline="\n"):
+    """Writes a formatted string from the elements of an array.
+
+    The elements are separated by commas, and a new line is started every
+    ncol elements. Numerical arrays are formatted in a single operation, and
+    floats are printed with 17 significant figures so that the array is
+    recovered exactly by read_array. The brackets around the elements are
+    not printed.
+
+    For example [1.0, 2.0] --> '  1.0000000000000000e+00,   2.0000000000000000e+00'
+
+    Args:
+        dtype: The data type of the elements of the array.
+        data: The array to be written.
+        ncol: The number of elements to be printed on each line. If zero,
+            all the elements are printed on the same line.
+        newline: The string used to start a new line.
+
+    Returns:
+        A formatted string.
+    """
+
+    data = np.asarray(data).flatten()
+    n = len(data)
+    if ncol <= 0 or ncol > n:
+        ncol = max(n, 1)
+
+    kind = np.dtype(dtype).kind
+    if kind == "f":
+        fmt = "%24.16e"
+    elif kind in "iu":
+        fmt = "%d"
+    else:
+        rlist = [write_type(dtype, v) for v in data]
+        return (", " + newline).join([", ".join(rlist[i:i + ncol]) for i in range(0, n, ncol)])
+
+    lines = [", ".join([fmt] * ncol)] * (n // ncol)
+    if n % ncol > 0:
+        lines.append(", ".join([fmt] * (n % ncol)))
+    return (", " + newline).join(lines) % tuple(data.tolist())
+
+
 def write_bool(data):
     """Writes a formatted string from a float.
 
@@ -0,0 +1,298 @@
+"""Random access to the frames of a trajectory file, with prefetching.
+
+The trajectory is scanned once to find the byte offset at which each frame
+starts, without parsing the atomic positions. Frames can then be read in
+any order, by seeking to the start of the frame, and frames that are not
+needed are never parsed.
+
+The frames are read in groups, e.g. one frame for each bead of a ring
+polymer. A background thread decodes the groups that will be needed next
+into a ring of preallocated arrays, while the rest of the simulation
+waits for the forces, so that replaying a long trajectory is limited by
+the force evaluations rather than by the parsing of the text.
+"""
+
+# This file is part of i-PI.
+# i-PI Copyright (C) 2014-2015 i-PI developers
+# See the "licenses" directory for full license information.
+
+
+import sys
+import threading
+import traceback
+
+import numpy as np
+
+from ipi.utils.io import _get_io_function
+from ipi.utils.units import unit_to_internal
+from ipi.utils.messages import verbosity, info
+
+
+__all__ = ['TrajectoryReader', 'index_trajectory']
+
+
+WAITTIMEOUT = 0.1
+
+
+def _index_xyz(filedesc):
+    """Finds the offsets of the frames of an XYZ file.
+
+    Args:
+        filedesc: An open readable file object.
+
+    Returns:
+        A list with the byte offset of the start of each frame.
+    """
+
+    offsets = []
+    while True:
+        pos = filedesc.tell()
+        header = filedesc.readline()
+        try:
+            natoms = int(header)
+        except ValueError:
+            break
+        offsets.append(pos)
+        for i in xrange(natoms + 1):
+            if filedesc.readline() == "":
+                # discards a truncated frame
+                offsets.pop()
+                return offsets
+    return offsets
+
+
+def _index_pdb(filedesc):
+    """Finds the offsets of the frames of a PDB file.
+
+    Mirrors the way read_pdb consumes the lines of a frame: an optional
+    TITLE line, the CRYST1 line, and the atom records up to an END or an
+    empty line.
+
+    Args:
+        filedesc: An open readable file object.
+
+    Returns:
+        A list with the byte offset of the start of each frame.
+    """
+
+    offsets = []
+    while True:
+        pos = filedesc.tell()
+        header = filedesc.readline()
+        if "TITLE" in header:
+            header = filedesc.readline()
+        if header == "":
+            break
+        offsets.append(pos)
+        body = filedesc.readline()
+        while body.strip() != "" and body.strip() != "END":
+            body = filedesc.readline()
+    return offsets
+
+
+def index_trajectory(mode, filedesc):
+    """Finds the offsets of the frames of a trajectory file.
+
+    Args:
+        mode: The format of the file, 'xyz' or 'pdb'.
+        filedesc: An open readable file object. Its position is moved.
+
+    Returns:
+        A list with the byte offset of the start of each frame.
+    """
+
+    filedesc.seek(0)
+    if mode == "xyz":
+        return _index_xyz(filedesc)
+    elif mode == "pdb":
+        return _index_pdb(filedesc)
+    else:
+        raise ValueError("Cannot index trajectory files in '" + mode + "' format")
+
+
+class TrajectoryReader(object):
+    """Reads groups of consecutive frames of a trajectory, by index.
+
+    Group i is made of the frames i*stride*group, ..., i*stride*group + group - 1,
+    so that with a stride larger than one the frames in between are skipped.
+    The positions and the cell are converted to atomic units, using the units
+    given in the comment line of each frame, further scaled by the conversion
+    factor of the given units, as Replay has always done.
+
+    Attributes:
+        filename: The name of the trajectory file.
+        mode: The format of the file, 'xyz' or 'pdb'.
+        units: The units of the positions and of the cell.
+        group: The number of consecutive frames in a group.
+        stride: The number of groups advanced from one group to the next.
+        prefetch: The number of groups decoded ahead of time, or 0 to read
+            the frames when they are requested.
+        offsets: The byte offset of the start of each frame.
+        ngroups: The number of groups that can be read.
+    """
+
+    def __init__(self, filename, mode, units="", group=1, stride=1, prefetch=0):
+        """Initialises TrajectoryReader, and indexes the trajectory.
+
+        Args:
+            filename: The name of the trajectory file.
+            mode: The format of the file.
+            units: The units of the positions and of the cell.
+            group: The number of frames in a group.
+            stride: The stride between the groups that are read.
+            prefetch: The number of groups decoded ahead of time.
+        """
+
+        if group < 1 or stride < 1:
+            raise ValueError("The group size and the stride of a trajectory must be positive")
+        if prefetch < 0:
+            raise ValueError("The number of prefetched frames cannot be negative")
+
+        self.filename = filename
+        self.mode = mode
+        self.units = units
+        self.group = group
+        self.stride = stride
+        self.prefetch = prefetch
+        self._conv = unit_to_internal("length", units, 1.0)
+        self._reader = _get_io_function(mode, "read")
+
+        # late import is needed to break an import cycle. It is done here
+        # rather than in the prefetching thread
+        from ipi.utils.io.io_units import auto_units
+        self._auto_units = auto_units
+
+        self._file = open(filename, "r")
+        self.offsets = index_trajectory(mode, self._file)
+        nstarts = (len(self.offsets) - group) // (stride * group) + 1
+        self.ngroups = max(nstarts, 0)
+        info(" # Indexed %d frames in trajectory file '%s'" % (len(self.offsets), filename), verbosity.medium)
+
+        # ring of buffers, allocated when the number of atoms is known
+        self._qring = None
+        self._hring = None
+        self._next = 0      # next group that will be requested
+        self._ready = 0     # groups before this one are in the ring
+        self._gen = 0       # incremented every time the prefetching restarts
+        self._error = None
+        self._cond = threading.Condition()
+        self._doloop = [False]
+        self._thread = None
+        if self.prefetch > 0 and self.ngroups > 0:
+            self._doloop[0] = True
+            self._thread = threading.Thread(target=self._prefetch_loop, name="replay_prefetch")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _decode(self, iframe):
+        """Parses a single frame.
+
+        Returns:
+            The positions and the cell matrix, in atomic units.
+        """
+
+        self._file.seek(self.offsets[iframe])
+        comment, cell, qatoms, names, masses = self._reader(filedesc=self._file)
+        dimension, units, cell_units = self._auto_units(comment, mode=self.mode)
+        qatoms *= unit_to_internal(dimension, units, 1.0) * self._conv
+        cell *= unit_to_internal("length", cell_units, 1.0) * self._conv
+        return qatoms, cell
+
+    def _decode_group(self, igroup, q, h):
+        """Parses all the frames of a group into the given arrays."""
+
+        first = igroup * self.stride * self.group
+        for k in xrange(self.group):
+            qk, hk = self._decode(first + k)
+            if q is None:
+                q = np.zeros((self.group, len(qk)), float)
+            q[k] = qk
+        h[:] = hk
+        return q, h
+
+    def _allocate(self, natoms3):
+        """Creates the ring of buffers."""
+
+        self._qring = np.zeros((self.prefetch, self.group, natoms3), float)
+        self._hring = np.zeros((self.prefetch, 3, 3), float)
+
+    def _prefetch_loop(self):
+        """Decodes the groups ahead of the one that will be requested next."""
+
+        while self._doloop[0]:
+            with self._cond:
+                if self._ready >= self.ngroups or self._ready - self._next >= self.prefetch:
+                    self._cond.wait(WAITTIMEOUT)
+                    continue
+                igroup = self._ready
+                gen = self._gen
+
+            try:
+                if self._qring is None:
+                    q, h = self._decode_group(igroup, None, np.zeros((3, 3), float))
+                    self._allocate(q.shape[1])
+                    self._qring[igroup % self.prefetch] = q
+                    self._hring[igroup % self.prefetch] = h
+                else:
+                    self._decode_group(igroup, self._qring[igroup % self.prefetch], self._hring[igroup % self.prefetch])
+            except Exception:
+                with self._cond:
+                    self._error = "".join(traceback.format_exception(*sys.exc_info()))
+                    self._cond.notify_all()
+                return
+
+            with self._cond:
+                # discards the group if the reader has been moved meanwhile
+                if gen == self._gen:
+                    self._ready = igroup + 1
+                    self._cond.notify_all()
+
+    def read(self, igroup):
+        """Returns the positions and the cell of a group of frames.
+
+        Reading the groups in order takes them from the prefetched ones.
+        Reading any other group restarts the prefetching from there.
+
+        Args:
+            igroup: The index of the group.
+
+        Returns:
+            An array of shape (group, 3*natoms) with the positions in each
+            frame, and the cell matrix of the last frame of the group.
+
+        Raises:
+            EOFError: Raised if the group goes beyond the end of the trajectory.
+        """
+
+        if igroup < 0 or igroup >= self.ngroups:
+            raise EOFError("End of the trajectory file " + self.filename)
+
+        if self._thread is None:
+            return self._decode_group(igroup, None, np.zeros((3, 3), float))
+
+        with self._cond:
+            if igroup < self._next or igroup > self._ready:
+                # moves the prefetching to the new position
+                self._gen += 1
+                self._ready = igroup
+            self._next = igroup
+            self._cond.notify_all()
+            while self._ready <= igroup and self._error is None:
+                self._cond.wait(WAITTIMEOUT)
+            if self._error is not None:
+                raise RuntimeError("Error while reading the trajectory file " + self.filename + ":\n" + self._error)
+            q = self._qring[igroup % self.prefetch].copy()
+            h = self._hring[igroup % self.prefetch].copy()
+            # frees the buffer for the next groups
+            self._next = igroup + 1
+            self._cond.notify_all()
+        return q, h
+
+    def close(self):
+        """Stops the prefetching and closes the file."""
+
+        self._doloop[0] = False
+        if self._thread is not None and self._thread is not threading.currentThread():
+            self._thread.join()
+        self._thread = None
+        self._file.close()
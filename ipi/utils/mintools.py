@@ -21,8 +21,12 @@ Functions:
         bracket: Determines the 3 points that bracket the function minimum
         min_brent:  Does one-D minimization (line search) based on bisection 
             method with derivatives. Uses 'bracket' function.
+        min_parallel: Does one-D minimization (line search) evaluating
+            several trial steps at once, so they can be computed concurrently
         min_approx: Does approximate n-D minimization (line search) based 
             on sufficient function decrease in the search direction
+        min_approx_parallel: Same as 'min_approx', evaluating several
+            step lengths at once
         min_trm: Does approximate n-D minimization inside a trust-region
 
         BFGS: Constructs an approximate inverse Hessian to determine 
@@ -33,6 +37,10 @@ Functions:
             compute new search directions. Minimizes using 'min_approx'
         L-BFGS_nls: L-BFGS algorithm without line search
             *** This function is less stable than L-BFGS and not any more efficient ***
+        FIRE: Damped dynamics with an adaptive time step (fast inertial
+            relaxation engine). Needs one force evaluation per step
+        hessian_exp, hessian_lindh: Build cheap model Hessians from the
+            interatomic distances, used to precondition L-BFGS
         bracket_neb: Modified 'bracket' routine to make 
             compatible with functions with unknown gradient
         min_brent_neb: Modified 'min_brent' routine to make 
@@ -365,6 +373,122 @@ def min_brent(fdf, fdf0, x0, tol, itmax, init_step):
     # return (x, fx,dfx)
     return
 
+# Line minimization evaluating several trial steps at once
+
+
+def _bracket_points(pts):
+    """Finds the interval that brackets the minimum among a set of points.
+
+    Arguments:
+            pts: list of (t, f, dt) tuples sorted by t, where dt is the
+                derivative of f along the direction of increasing t
+
+    Returns the indices of the two points that enclose the minimum, or None
+    if the minimum lies beyond the last point.
+    """
+
+    ib = min(range(len(pts)), key=lambda i: pts[i][1])
+    if pts[ib][2] < 0.0:
+        if ib == len(pts) - 1:
+            return None
+        return (ib, ib + 1)
+    elif ib == 0:
+        return (0, 0)
+    else:
+        return (ib - 1, ib)
+
+
+def min_parallel(fdf, fdf0, x0, tol, itmax, init_step, npoints):
+    """Given a maximum number of iterations and a convergence tolerance,
+     minimizes the specified function, evaluating npoints trial steps at
+     each iteration. The trial points are passed all at once to fdf.batch,
+     so that they can be computed concurrently, e.g. by several clients.
+     The minimum is first bracketed by taking geometrically increasing
+     steps, and the bracket is then narrowed using a secant estimate of
+     the zero of the derivative together with equally spaced points.
+     Arguments:
+            x0: initial x-value
+            fdf: function to minimize, which must also provide a batch
+                method taking a list of points and returning the list of
+                function values and derivatives
+            fdf0: initial function value
+            tol: convergence tolerance
+            itmax: maximum allowed iterations
+            init_step: initial step size
+            npoints: number of points evaluated at each iteration
+    """
+
+    # Initializations and constants
+    gold = 1.618034  # Golden ratio
+    zeps = 1.0e-10  # Safeguard against trying to find fractional precision for min that is exactly zero
+
+    if fdf0 is None: fdf0 = fdf(x0)
+    f0, df0 = fdf0
+
+    # t: distance from x0 in the downhill direction
+    # dt: derivative of the function with respect to t
+    sign = 1.0
+    if df0 > 0.0:
+        sign = -1.0
+    pts = [(0.0, f0, sign * df0)]
+
+    def evaluate(ts):
+        for t, (f, df) in zip(ts, fdf.batch([x0 + sign * t for t in ts])):
+            pts.append((t, f, sign * df))
+        pts.sort()
+
+    # Bracketing: geometrically increasing steps, until the function increases
+    # or its derivative changes sign
+    info(" @MINIMIZE: Started parallel 1D minimization", verbosity.debug)
+    j = 1
+    tlast = 0.0
+    while j <= itmax:
+        if tlast == 0.0:
+            ts = [abs(init_step) * gold ** k for k in range(npoints)]
+        else:
+            ts = [tlast * gold ** (k + 1) for k in range(npoints)]
+        evaluate(ts)
+        tlast = ts[-1]
+        j += 1
+        if _bracket_points(pts) is not None:
+            break
+    info(" @MINIMIZE: Bracketing completed", verbosity.debug)
+
+    # Narrowing of the bracket
+    while j <= itmax:
+        ia, ib = _bracket_points(pts)
+        ta, fa, dta = pts[ia]
+        tb, fb, dtb = pts[ib]
+        if fa <= fb:
+            t = ta
+        else:
+            t = tb
+
+        # Test for satisfactory completion
+        tol1 = tol * abs(t) + zeps
+        if tb - ta <= 2.0 * tol1:
+            break
+
+        # Secant estimate of the zero of the derivative, and points
+        # evenly spaced inside the bracket
+        ts = []
+        if dtb != dta:
+            u = ta - dta * (tb - ta) / (dtb - dta)
+            if (u - ta) > tol1 and (tb - u) > tol1:
+                ts.append(u)
+        nfill = npoints - len(ts)
+        ts += [ta + (tb - ta) * (k + 1) / (nfill + 1.0) for k in range(nfill)]
+        evaluate(ts)
+        j += 1
+
+    if j > itmax:
+        info(" @MINIMIZE: Error -- maximum iterations for minimization (%d) exceeded, exiting minimization" % itmax, verbosity.low)
+
+    t, fx, dtx = min(pts, key=lambda p: p[1])
+    info(" @MINIMIZE: Finished minimization, energy = %f" % fx, verbosity.debug)
+    fdf(x0 + sign * t)  # Evaluate again to update lm.dforces object
+    return
+
 # Approximate line search
 
 
@@ -474,10 +598,100 @@ def min_approx(fdf, x0, fdf0, d0, big_step, tol, itmax):
     info(" @MINIMIZE: Finished minimization, energy = %f" % fx, verbosity.debug)
     return (x, fx, dfx)
 
+# Approximate line search evaluating several step lengths at once
+
+
+def min_approx_parallel(fdf, x0, fdf0, d0, big_step, tol, itmax, npoints):
+    """Given an n-dimensional function and its gradient, and an
+    initial point and a direction, finds a new point where the function
+    is thought to be 'sufficiently' minimized, like min_approx. At each
+    iteration npoints step lengths, each half of the previous one, are
+    passed all at once to fdf.batch, so that they can be computed
+    concurrently, and the longest one giving a sufficient decrease of the
+    function is taken.
+        Arguments:
+            fdf: function and its gradient, which must also provide a batch
+                method taking a list of points and returning the list of
+                function values and gradients
+            fdf0: initial function and gradient value
+            d0: n-dimensional initial direction
+            x0: n-dimensional initial point
+            big_step: maximum step size
+            tol: tolerance for exiting line search
+            itmax: maximum number of iterations for the line search
+            npoints: number of step lengths evaluated at each iteration
+    """
+
+    # Initializations and constants
+    info(" @MINIMIZE: Started parallel approx. line search", verbosity.debug)
+    n = len(x0.flatten())
+    if fdf0 is None: fdf0 = fdf(x0)
+    f0, df0 = fdf0
+    if d0 is None: d0 = -df0 / np.sqrt(np.dot(df0.flatten(), df0.flatten()))
+    alf = 1.0e-4
+
+    # Step size
+    stepsum = np.sqrt(np.dot(d0.flatten(), d0.flatten()))
+
+    # Scale if attempted step is too large
+    if stepsum > big_step:
+        info(" @MINIMIZE: Scaled step size for line search", verbosity.debug)
+        d0 = np.multiply(d0, big_step / stepsum)
+
+    slope = np.dot(df0.flatten(), d0.flatten())
+    if slope >= 0.0:
+        info(" @MINIMIZE: Warning -- gradient is >= 0 (%f)" % slope, verbosity.low)
+
+    test = np.amax(np.divide(np.absolute(d0.flatten()), np.maximum(np.absolute(x0.flatten()), np.ones(n))))
+
+    # Setup to try Newton step first
+    alamin = tol / test
+    alam = 1.0
+
+    # Minimization Loop
+    i = 1
+    while i < itmax:
+        alams = [alam * 0.5 ** k for k in range(npoints)]
+        xs = [np.add(x0, (a * d0)) for a in alams]
+        fdfs = fdf.batch(xs)
+        info(" @MINIMIZE: Calculated energies", verbosity.debug)
+
+        # Sufficient function decrease, for the longest possible step
+        for a, x, (fx, dfx) in zip(alams, xs, fdfs):
+            if a < alamin:
+                break
+            if fx <= (f0 + alf * a * slope):
+                info(" @MINIMIZE: Sufficient function decrease, exited line search", verbosity.debug)
+                fdf(x)  # Evaluate again to update the mapper with this point
+                return (x, fx, dfx)
+        x = xs[-1]
+        fx, dfx = fdfs[-1]
+
+        # Check for convergence on change in x
+        if alams[-1] < alamin:
+            info(" @MINIMIZE: Convergence in position, exited line search", verbosity.debug)
+            return (x0, fx, dfx)
+
+        # No convergence; backtrack from the shortest step, using a quadratic
+        # model, between 0.1 and 0.5 times the shortest step
+        info(" @MINIMIZE: No convergence on step; backtrack to find point", verbosity.debug)
+        a = alams[-1]
+        if fx - f0 - a * slope > 0.0:
+            tmplam = -slope * a * a / (2.0 * (fx - f0 - a * slope))
+        else:
+            tmplam = 0.5 * a
+        alam = max(min(tmplam, 0.5 * a), 0.1 * a)
+
+        i += 1
+
+    info(" @MINIMIZE: Error - maximum iterations for line search (%d) exceeded, exiting search" % itmax, verbosity.low)
+    info(" @MINIMIZE: Finished minimization, energy = %f" % fx, verbosity.debug)
+    return (x, fx, dfx)
+
 # BFGS algorithm with approximate line search
 
 
-def BFGS(x0, d0, fdf, fdf0, invhessian, big_step, tol, itmax):
+def BFGS(x0, d0, fdf, fdf0, invhessian, big_step, tol, itmax, npoints=1):
     """BFGS minimization. Uses approximate line minimizations.
     Does one step.
         Arguments:
@@ -488,6 +702,8 @@ def BFGS(x0, d0, fdf, fdf0, invhessian, big_step, tol, itmax):
             big_step: limit on step length
             tol: convergence tolerance
             itmax: maximum number of allowed iterations
+            npoints: number of step lengths evaluated at once in the line
+                search. If larger than one, uses 'min_approx_parallel'
     """
 
     info(" @MINIMIZE: Started BFGS", verbosity.debug)
@@ -500,7 +716,10 @@ def BFGS(x0, d0, fdf, fdf0, invhessian, big_step, tol, itmax):
     big_step = big_step * max(np.sqrt(linesum), n)
 
     # Perform approximate line minimization in direction d0
-    x, u, g = min_approx(fdf, x0, fdf0, d0, big_step, tol, itmax)
+    if npoints > 1:
+        x, u, g = min_approx_parallel(fdf, x0, fdf0, d0, big_step, tol, itmax, npoints)
+    else:
+        x, u, g = min_approx(fdf, x0, fdf0, d0, big_step, tol, itmax)
     d_x = np.subtract(x, x0)
 
     # Update invhessian.
@@ -704,7 +923,7 @@ def min_trm(f, h, tr):
 # L-BFGS algorithm with approximate line search
 
 
-def L_BFGS(x0, d0, fdf, qlist, glist, fdf0, big_step, tol, itmax, m, scale, k):
+def L_BFGS(x0, d0, fdf, qlist, glist, fdf0, big_step, tol, itmax, m, scale, k, npoints=1, precond=None):
     """L-BFGS minimization. Uses approximate line minimizations.
     Does one step.
         Arguments:
@@ -719,11 +938,18 @@ def L_BFGS(x0, d0, fdf, qlist, glist, fdf0, big_step, tol, itmax, m, scale, k):
             big_step = limit on step length
             tol = convergence tolerance
             itmax = maximum number of allowed iterations
+            npoints = number of step lengths evaluated at once in the line
+                search. If larger than one, uses 'min_approx_parallel'
+            precond = function applying an approximate inverse Hessian to a
+                vector, used instead of the identity as the initial inverse
+                Hessian of the two loop recursion
     """
 
     zeps = 1.0e-10
     n = len(x0.flatten())
     alpha = np.zeros(m)
+    if precond is None:
+        precond = lambda v: v
     beta = np.zeros(m)
     rho = np.zeros(m)
 
@@ -734,7 +960,10 @@ def L_BFGS(x0, d0, fdf, qlist, glist, fdf0, big_step, tol, itmax, m, scale, k):
     big_step = big_step * max(np.sqrt(linesum), n)
 
     # Perform approximate line minimization in direction d0
-    x, u, g = min_approx(fdf, x0, fdf0, d0, big_step, tol, itmax)
+    if npoints > 1:
+        x, u, g = min_approx_parallel(fdf, x0, fdf0, d0, big_step, tol, itmax, npoints)
+    else:
+        x, u, g = min_approx(fdf, x0, fdf0, d0, big_step, tol, itmax)
 
     # Compute difference of positions (gradients)
     # Build list of previous 'd_positions (d_gradients)'
@@ -787,11 +1016,11 @@ def L_BFGS(x0, d0, fdf, qlist, glist, fdf0, big_step, tol, itmax, m, scale, k):
         if scale == 0:
             hk = 1.0
         elif scale == 1:
-            hk = np.dot(glist[0], qlist[0]) / np.dot(glist[0], glist[0])
+            hk = np.dot(glist[0], qlist[0]) / np.dot(glist[0], precond(glist[0]))
         elif scale == 2:
-            hk = np.dot(glist[bound1], qlist[bound1]) / np.dot(glist[bound1], glist[bound1])
+            hk = np.dot(glist[bound1], qlist[bound1]) / np.dot(glist[bound1], precond(glist[bound1]))
 
-        d = hk * q
+        d = hk * precond(q)
 
        # Second loop
         for j in range(0, bound2, 1):
@@ -810,6 +1039,63 @@ def L_BFGS(x0, d0, fdf, qlist, glist, fdf0, big_step, tol, itmax, m, scale, k):
     info(" @MINIMIZE: Updated search direction", verbosity.debug)
 
 
+# FIRE algorithm: damped dynamics with adaptive time step
+
+
+def FIRE(x0, f0, v, m, options):
+    """FIRE (fast inertial relaxation engine) minimization, from
+    Bitzek, E., Koskinen, P., Gaehler, F., Moseler, M., and Gumbsch, P. (2006).
+    Structural Relaxation Made Simple. Physical Review Letters, 97, 170201.
+    Does one step, which requires a single evaluation of the forces.
+        Arguments:
+            x0: current positions
+            f0: forces at x0
+            v: velocities, updated in place
+            m: masses, with the same shape as x0
+            options: dictionary containing the time step 'dt', its maximum
+                value 'dtmax', the mixing parameter 'alpha', the number of
+                steps since the last uphill move 'nsteps' and the largest
+                displacement of an atom in one step 'maxstep'. dt, alpha and
+                nsteps are updated in place.
+    Returns the new positions.
+    """
+
+    # Constants, as recommended in the original paper
+    nmin = 5  # Number of downhill steps before the time step is increased
+    finc = 1.1  # Increase of the time step
+    fdec = 0.5  # Decrease of the time step
+    alpha0 = 0.1  # Initial mixing parameter
+    falpha = 0.99  # Decrease of the mixing parameter
+
+    # Power of the forces. Mixes the velocity with the direction of the forces
+    # while going downhill, stops the motion when going uphill
+    p = np.dot(f0.flatten(), v.flatten())
+    if p > 0.0:
+        vnorm = np.sqrt(np.dot(v.flatten(), v.flatten()))
+        fnorm = np.sqrt(np.dot(f0.flatten(), f0.flatten()))
+        v *= 1.0 - options["alpha"]
+        v += options["alpha"] * vnorm / fnorm * f0
+        if options["nsteps"] > nmin:
+            options["dt"] = min(options["dt"] * finc, options["dtmax"])
+            options["alpha"] *= falpha
+        options["nsteps"] += 1
+    elif p < 0.0:
+        info(" @MINIMIZE: Uphill FIRE step, velocities reset", verbosity.debug)
+        v[:] = 0.0
+        options["dt"] *= fdec
+        options["alpha"] = alpha0
+        options["nsteps"] = 0
+
+    # Euler step, limiting the largest displacement of an atom
+    v += options["dt"] * f0 / m
+    dx = options["dt"] * v
+    dxmax = np.amax(np.sqrt((dx.reshape((-1, 3)) ** 2).sum(axis=1)))
+    if dxmax > options["maxstep"]:
+        info(" @MINIMIZE: Scaled FIRE step size", verbosity.debug)
+        dx *= options["maxstep"] / dxmax
+
+    return x0 + dx
+
 # Bracketing for NEB, TODO: DEBUG THIS IF USING SD OR CG OPTIONS FOR NEB
 def bracket_neb(fdf, fdf0=None, x0=0.0, init_step=1.0e-3):
     """Given an initial point, determines the initial bracket for the minimum
@@ -1188,3 +1474,88 @@ def L_BFGS_nls(x0, d0, fdf, qlist, glist, fdf0=None, big_step=100, tol=1.0e-6, i
     info(" @MINIMIZE: Updated search direction", verbosity.debug)
 
     return (x, fx, xi, qlist, glist)
+
+
+# Model Hessians, used to precondition the L-BFGS minimization
+
+
+def _pair_distances(q, h):
+    """Returns the vectors between all the pairs of atoms, in the minimum
+    image convention, and their lengths.
+        Arguments:
+            q: positions, an array of size 3*natoms
+            h: cell matrix, with the lattice vectors as columns
+    """
+
+    x = q.reshape((-1, 3))
+    ih = np.linalg.inv(h)
+    s = np.dot(x[np.newaxis, :, :] - x[:, np.newaxis, :], ih.T)
+    s -= np.round(s)
+    d = np.dot(s, h.T)
+    r = np.sqrt((d ** 2).sum(axis=2))
+    return d, r
+
+
+def _stabilize(hessian, stab):
+    """Adds a multiple of the identity to a model Hessian, proportional to the
+    average of its diagonal, to remove the zero modes due to translations."""
+
+    return hessian + np.eye(len(hessian)) * stab * max(np.trace(hessian) / len(hessian), 1e-10)
+
+
+def hessian_exp(q, h, mu=0.1, A=3.0, stab=0.1):
+    """Builds the exponential model Hessian, from
+    Packwood, D., Kermode, J., Mones, L., Bernstein, N., Woolley, J., Gould, N.,
+    Ortner, C., and Csanyi, G. (2016). A universal preconditioner for simulating
+    condensed phase materials. The Journal of Chemical Physics, 144, 164109.
+    Pairs of atoms closer than twice the nearest neighbour distance r_nn are
+    coupled with a strength mu * exp(-A (r / r_nn - 1)), isotropically.
+        Arguments:
+            q: positions, an array of size 3*natoms
+            h: cell matrix, with the lattice vectors as columns
+            mu: energy scale of the model, in atomic units
+            A: decay of the coupling with distance
+            stab: stabilization, as a fraction of the average diagonal element
+    """
+
+    d, r = _pair_distances(q, h)
+    np.fill_diagonal(r, np.inf)
+    rnn = r.min()
+    coupling = np.where(r < 2.0 * rnn, -mu * np.exp(-A * (r / rnn - 1.0)), 0.0)
+    np.fill_diagonal(coupling, -coupling.sum(axis=1))
+    return _stabilize(np.kron(coupling, np.eye(3)), stab)
+
+
+def hessian_lindh(q, h, names, stab=0.1):
+    """Builds a model Hessian containing the bond stretching terms of the model from
+    Lindh, R., Bernhardsson, A., Karlstrom, G., and Malmqvist, P.-A. (1995).
+    On the use of a Hessian model function in molecular geometry optimizations.
+    Chemical Physics Letters, 241, 423-428.
+    The force constant of each pair of atoms decays as exp(alpha (r_ref^2 - r^2)),
+    with parameters that depend on the rows of the periodic table of the atoms.
+        Arguments:
+            q: positions, an array of size 3*natoms
+            h: cell matrix, with the lattice vectors as columns
+            names: names of the atoms
+            stab: stabilization, as a fraction of the average diagonal element
+    """
+
+    kr = 0.45
+    alpha = np.array([[1.0000, 0.3949, 0.3949], [0.3949, 0.2800, 0.2800], [0.3949, 0.2800, 0.2800]])
+    rref = np.array([[1.35, 2.10, 2.53], [2.10, 2.87, 3.40], [2.53, 3.40, 3.40]])
+    rows = {"H": 0, "D": 0, "Z": 0, "H2": 0, "He": 0, "X": 0,
+            "Li": 1, "Be": 1, "B": 1, "C": 1, "N": 1, "O": 1, "F": 1, "Ne": 1}
+
+    d, r = _pair_distances(q, h)
+    natoms = len(r)
+    row = np.array([rows.get(name, 2) for name in names])
+    k = kr * np.exp(alpha[row][:, row] * (rref[row][:, row] ** 2 - r ** 2))
+    np.fill_diagonal(k, 0.0)
+    np.fill_diagonal(r, 1.0)
+
+    # stretching term k u u^T, coupling the two atoms of each pair
+    u = d / r[:, :, np.newaxis]
+    blocks = -k[:, :, np.newaxis, np.newaxis] * u[:, :, :, np.newaxis] * u[:, :, np.newaxis, :]
+    for i in xrange(natoms):
+        blocks[i, i] = -blocks[i].sum(axis=0)
+    return _stabilize(blocks.transpose((0, 2, 1, 3)).reshape((3 * natoms, 3 * natoms)), stab)
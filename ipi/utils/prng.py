@@ -5,6 +5,16 @@ These are used in initialising the velocities and in stochastic thermostats.
 The state of the random number generator is kept track of, so that the if the
 simulation is restarted from a checkpoint, we will see the same dynamics as if
 it had not been stopped.
+
+Gaussian random numbers can optionally be generated ahead of time, in blocks
+that are filled by a background thread while the rest of the step is being
+computed. The numbers are drawn from the generator in exactly the same order
+as they would be otherwise, so the sequence and the stored state are the same
+whether this is used or not.
+
+Independent streams of random numbers, e.g. one for each system of a
+simulation, can be derived deterministically from a generator, so that
+objects that are evolved concurrently do not share a generator.
 """
 
 # This file is part of i-PI.
@@ -12,6 +22,9 @@ it had not been stopped.
 # See the "licenses" directory for full license information.
 
 
+import threading
+import zlib
+
 import numpy as np
 
 
@@ -25,9 +38,23 @@ class Random(object):
     at the beginning of the simulation, and keeps track of the state so that
     it can be output to the checkpoint files throughout the simulation.
 
+    If prefetch is larger than zero, Gaussian numbers are taken from blocks of
+    prefetch numbers, and the next block is generated in a background thread as
+    soon as a block starts being used. The blocks are discarded and the
+    generator is brought back to the state corresponding to the numbers that
+    have actually been used whenever a different kind of random number is
+    requested, so the sequence of random numbers is unchanged. The blocks are
+    switched and consumed under a lock, so the generator can be shared by
+    several systems that are stepped in different threads.
+
     Attributes:
         rng: The random number generator to be used.
         seed: The seed number to start the generator.
+        prefetch: The number of Gaussian numbers generated in each block, or
+            zero if the numbers are not generated ahead of time.
+        split: Whether stream() returns independent generators, or this one.
+        streams: A dictionary of the independent generators derived from this
+            one, indexed by name.
         state: A tuple of five objects giving the current state of the random
             number generator. The first is the type of random number generator,
             here 'MT19937', the second is an array of 624 integers, the third
@@ -37,25 +64,164 @@ class Random(object):
             Gaussian random number returned.
     """
 
-    def __init__(self, seed=12345, state=None):
+    def __init__(self, seed=12345, state=None, prefetch=0, split=False):
         """Initialises Random.
 
         Args:
             seed: An optional seed giving an integer to initialise the state with.
             state: An optional state tuple to initialise the state with.
+            prefetch: An optional integer giving the number of Gaussian numbers
+                to generate ahead of time. Defaults to 0.
+            split: An optional boolean giving whether independent streams
+                should be derived from this generator. Defaults to False.
         """
 
-        self.rng = np.random.mtrand.RandomState(seed=seed)
+        self._rng = np.random.mtrand.RandomState(seed=seed)
         self.seed = seed
+        self.prefetch = prefetch
+        self.split = split
+        self.streams = {}
+
+        # the block being used, as a tuple of the state of the generator
+        # before the block was generated and of the block itself, the
+        # position of the next number in the block, the next block and
+        # the thread that is generating it
+        self._block = None
+        self._pos = 0
+        self._next = None
+        self._thread = None
+        self._lock = threading.RLock()
+
         if state is None:
-            self.rng.seed(seed)
+            self._rng.seed(seed)
         else:
             self.state = state
 
+    def _fill(self):
+        """Generates the next block of Gaussian numbers."""
+
+        self._next = (self._rng.get_state(), self._rng.standard_normal(self.prefetch))
+
+    def _advance(self):
+        """Switches to the next block, and starts generating the one after it."""
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._next is None:
+            self._fill()
+        self._block = self._next
+        self._pos = 0
+        self._next = None
+
+        self._thread = threading.Thread(target=self._fill, name="prng_prefetch")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def lazy_state(self):
+        """Returns a cheap representation of the current state.
+
+        No random numbers are generated, so this can be called every step
+        without undoing the work of the prefetching thread. The actual state
+        is obtained by passing the result to expand_state().
+
+        Returns:
+            A tuple of a generator state and of the number of Gaussian numbers
+            that have been drawn since the generator was in that state.
+        """
+
+        with self._lock:
+            if self._block is None:
+                if self._thread is not None:
+                    self._thread.join()
+                    self._thread = None
+                return (self._rng.get_state(), 0)
+            return (self._block[0], self._pos)
+
+    @staticmethod
+    def expand_state(lazy):
+        """Returns the generator state corresponding to a lazy state.
+
+        The state is obtained by generating again the Gaussian numbers that
+        have been used, starting from the stored state.
+
+        Args:
+            lazy: A tuple returned by lazy_state().
+        """
+
+        state, npos = lazy
+        if npos == 0:
+            return state
+        rng = np.random.mtrand.RandomState()
+        rng.set_state(state)
+        rng.standard_normal(npos)
+        return rng.get_state()
+
+    def _current_state(self):
+        """Returns the state of the generator after the numbers used so far."""
+
+        return self.expand_state(self.lazy_state())
+
+    def _sync(self):
+        """Discards the numbers generated ahead of time.
+
+        The generator is left in the state it would have if the numbers that
+        have been used were the only ones that had been generated.
+        """
+
+        with self._lock:
+            if self._block is None and self._thread is None:
+                return
+            state = self._current_state()
+            if self._thread is not None:
+                self._thread.join()
+                self._thread = None
+            self._block = self._next = None
+            self._pos = 0
+            self._rng.set_state(state)
+
+    def stream(self, name):
+        """Returns the independent stream of random numbers with a given name.
+
+        The seed of a new stream is obtained from the seed of this generator
+        and from the name of the stream, so the same streams are obtained every
+        time a simulation is started from the same seed, independent of the
+        order in which they are requested.
+
+        Args:
+            name: A string identifying the stream.
+
+        Returns:
+            A Random object, which is this object if split is False.
+        """
+
+        if not self.split:
+            return self
+        if name not in self.streams:
+            words = [self.seed & 0xffffffff, (self.seed >> 32) & 0xffffffff, zlib.crc32(name) & 0xffffffff]
+            seed = int(np.random.mtrand.RandomState(words).randint(2**31 - 1))
+            self.streams[name] = Random(seed=seed, prefetch=self.prefetch, split=True)
+        return self.streams[name]
+
+    def all_streams(self):
+        """Returns a list of this generator and of all the streams derived from it."""
+
+        rlist = [self]
+        for name in sorted(self.streams):
+            rlist += self.streams[name].all_streams()
+        return rlist
+
+    @property
+    def rng(self):
+        """The underlying numpy random number generator."""
+
+        self._sync()
+        return self._rng
+
     def get_state(self):
         """Interface to the standard get_state() function."""
 
-        return self.rng.get_state()
+        return self._current_state()
 
     def set_state(self, value):
         """Interface to the standard set_state() function.
@@ -64,7 +230,9 @@ class Random(object):
         number generator, such as one from a previous run.
         """
 
-        return self.rng.set_state(value)
+        with self._lock:
+            self._sync()
+            return self._rng.set_state(value)
 
     state = property(get_state, set_state)
 
@@ -76,7 +244,8 @@ class Random(object):
             A pseudo-random number from a uniform distribution from 0-1.
         """
 
-        return self.rng.random_sample()
+        with self._lock:
+            return self.rng.random_sample()
 
     @property
     def g(self):
@@ -86,7 +255,10 @@ class Random(object):
             A pseudo-random number from a normal Gaussian distribution.
         """
 
-        return self.rng.standard_normal()
+        if self.prefetch > 0:
+            return self.gvec(1)[0]
+        with self._lock:
+            return self.rng.standard_normal()
 
     def gamma(self, k, theta=1.0):
         """Interface to the standard gamma() function.
@@ -100,7 +272,8 @@ class Random(object):
             mean value theta.
         """
 
-        return self.rng.gamma(k, theta)
+        with self._lock:
+            return self.rng.gamma(k, theta)
 
     def gvec(self, shape):
         """Interface to the standard_normal array function.
@@ -113,4 +286,20 @@ class Random(object):
             a normal Gaussian distribution.
         """
 
-        return self.rng.standard_normal(shape)
+        if self.prefetch <= 0:
+            with self._lock:
+                return self.rng.standard_normal(shape)
+
+        n = int(np.prod(shape))
+        rvec = np.empty(n)
+        k = 0
+        with self._lock:
+            while k < n:
+                if self._block is None or self._pos == self.prefetch:
+                    self._advance()
+                nb = min(n - k, self.prefetch - self._pos)
+                rvec[k:k + nb] = self._block[1][self._pos:self._pos + nb]
+                self._pos += nb
+                k += nb
+
+        return rvec.reshape(shape)
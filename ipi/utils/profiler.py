@@ -0,0 +1,171 @@
+"""A statistical profiler that can be switched on for a window of steps.
+
+The profiler runs in a background thread, which periodically inspects the
+stack of all the other threads of the process (the main loop, the threads
+polling the force field clients, the output writers...) and counts how
+many times each stack is seen. Since the code being profiled is not
+instrumented, the overhead is small and the timings of the socket
+communication are not distorted, so it can be used on production runs.
+
+The samples can be written either as collapsed stacks, one stack per line
+followed by the number of samples, which is the format expected by
+flame graph tools, or as a pstats file that can be read with the pstats
+module of the standard library.
+"""
+
+# This file is part of i-PI.
+# i-PI Copyright (C) 2014-2015 i-PI developers
+# See the "licenses" directory for full license information.
+
+
+import sys
+import time
+import marshal
+import threading
+
+from ipi.utils.io import open_backup
+from ipi.utils.messages import verbosity, info
+
+
+__all__ = ['Profiler']
+
+
+class Profiler(object):
+    """Samples the stacks of all the threads during a window of steps.
+
+    Attributes:
+       mode: The format of the output, 'collapsed' or 'pstats', or 'off' if
+          the profiler is disabled.
+       filename: The name of the file the samples are written to.
+       start: The step at which sampling starts.
+       steps: The number of steps during which the stacks are sampled.
+       interval: The time between two samples, in seconds.
+       samples: A dictionary giving the number of times each stack has been
+          seen. The keys are tuples holding the name of the thread, followed
+          by the (filename, line, function) of each frame, outermost first.
+       nsamples: The number of times the threads have been sampled.
+       elapsed: The wall clock time during which the threads were sampled.
+    """
+
+    def __init__(self, mode="off", filename="profile", start=0, steps=1, interval=0.005):
+        """Initialises Profiler.
+
+        Args:
+           mode: The output format, or 'off' to disable profiling.
+           filename: The name of the output file.
+           start: The first step that is profiled.
+           steps: The number of steps that are profiled.
+           interval: The sampling interval, in seconds.
+        """
+
+        self.mode = mode
+        self.filename = filename
+        self.start = start
+        self.steps = steps
+        self.interval = interval
+
+        self.samples = {}
+        self.nsamples = 0
+        self.elapsed = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+        self._done = False
+
+    def step(self, istep):
+        """Starts or stops sampling, depending on the current step.
+
+        Should be called at the beginning of each step. When restarting a
+        simulation from within the window of steps, sampling starts right
+        away and covers the remaining steps.
+
+        Args:
+           istep: The step that is about to be done.
+        """
+
+        if self.mode == "off" or self._done:
+            return
+
+        if self._thread is None and self.start <= istep < self.start + self.steps:
+            info(" # Starting the profiler at step %d" % istep, verbosity.low)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, name="profiler")
+            self._thread.daemon = True
+            self._thread.start()
+        elif self._thread is not None and istep >= self.start + self.steps:
+            self.finish()
+
+    def finish(self):
+        """Stops sampling, if it is running, and writes the output file."""
+
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._done = True
+
+        info(" # Writing %d profiler samples to '%s'" % (self.nsamples, self.filename), verbosity.low)
+        if self.mode == "collapsed":
+            self.write_collapsed()
+        elif self.mode == "pstats":
+            self.write_pstats()
+
+    def _sample(self):
+        """Samples the stacks of the other threads until asked to stop."""
+
+        me = threading.current_thread().ident
+        tstart = time.time()
+        while not self._stop.wait(self.interval):
+            names = dict((t.ident, t.name) for t in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread-%d" % ident))
+                stack.reverse()
+                key = tuple(stack)
+                self.samples[key] = self.samples.get(key, 0) + 1
+            self.nsamples += 1
+        self.elapsed += time.time() - tstart
+
+    def write_collapsed(self):
+        """Writes the samples as collapsed stacks, one per line."""
+
+        ofile = open_backup(self.filename, "w")
+        for key, count in sorted(self.samples.iteritems()):
+            frames = [key[0]] + ["%s (%s:%d)" % (f[2], f[0], f[1]) for f in key[1:]]
+            ofile.write(";".join(frames) + " %d\n" % count)
+        ofile.close()
+
+    def write_pstats(self):
+        """Writes the samples in the format read by pstats.Stats.
+
+        The number of calls of a function is the number of samples in which
+        it appears. Its internal time is estimated from the number of samples
+        in which it is the innermost frame, and its cumulative time from the
+        number of samples in which it appears at all.
+        """
+
+        dt = self.elapsed / max(self.nsamples, 1)
+        stats = {}
+        for key, count in self.samples.iteritems():
+            frames = key[1:]
+            if len(frames) == 0:
+                continue
+            for f in set(frames):
+                cc, nc, tt, ct, callers = stats.get(f, (0, 0, 0.0, 0.0, {}))
+                stats[f] = (cc + count, nc + count, tt, ct + count * dt, callers)
+            for caller, callee in set(zip(frames[:-1], frames[1:])):
+                callers = stats[callee][4]
+                callers[caller] = callers.get(caller, 0) + count
+            cc, nc, tt, ct, callers = stats[frames[-1]]
+            stats[frames[-1]] = (cc, nc, tt + count * dt, ct, callers)
+
+        ofile = open_backup(self.filename, "wb")
+        marshal.dump(stats, ofile)
+        ofile.close()
@@ -0,0 +1,222 @@
+"""Functions to find the symmetries of a crystal and to exploit them in
+finite-difference calculations of the force constants.
+
+The symmetry operations are found by first enumerating the integer matrices
+that leave the metric of the cell invariant, i.e. the point operations of
+the lattice, and then looking for the fractional translations that map the
+atoms onto atoms of the same species. For supercells, the pure translations
+by a lattice vector of the primitive cell are found as well.
+"""
+
+# This file is part of i-PI.
+# i-PI Copyright (C) 2014-2015 i-PI developers
+# See the "licenses" directory for full license information.
+
+
+import itertools
+
+import numpy as np
+
+
+__all__ = ['find_symmetry', 'irreducible_displacements', 'rebuild_force_constants']
+
+
+def _lattice_operations(h, tol):
+    """Returns the point operations of the lattice, in fractional coordinates.
+
+    Args:
+       h: The cell matrix, with the lattice vectors as columns.
+       tol: The tolerance on the positions, in atomic units.
+
+    Returns:
+       An array of shape (nops, 3, 3) of integer matrices W such that h W is
+       a basis of the same lattice, with the same metric as h.
+    """
+
+    ws = np.array(list(itertools.product([-1, 0, 1], repeat=9))).reshape((-1, 3, 3))
+    ws = ws[np.abs(np.abs(np.round(np.linalg.det(ws))) - 1) < 0.5]
+
+    g = np.dot(h.T, h)
+    dg = np.einsum("nji,jk,nkl->nil", ws, g, ws) - g
+    lmax = np.sqrt(g.diagonal().max())
+    return ws[np.abs(dg).max(axis=(1, 2)) < 2.0 * tol * lmax]
+
+
+def _match_atoms(sw, ts, s, h, other, tol):
+    """Finds which of a set of translations map the atoms onto each other.
+
+    Args:
+       sw: The fractional coordinates of the atoms after the point operation.
+       ts: An array of shape (n, 3) of trial fractional translations.
+       s: The fractional coordinates of the atoms.
+       h: The cell matrix.
+       other: A boolean matrix, true for pairs of atoms of different species.
+       tol: The tolerance on the positions, in atomic units.
+
+    Returns:
+       The translations that map every atom onto an atom of the same species,
+       and for each of them an array giving the index of the image of each atom.
+    """
+
+    natoms = len(s)
+    perms = np.zeros((len(ts), natoms), int)
+    for i in xrange(natoms):
+        d = sw[i] + ts[:, np.newaxis, :] - s[np.newaxis, :, :]
+        d -= np.round(d)
+        d = np.sqrt((np.dot(d, h.T) ** 2).sum(axis=2))
+        d[:, other[i]] = np.inf
+        j = np.argmin(d, axis=1)
+        keep = d[np.arange(len(ts)), j] < tol
+        ts, perms = ts[keep], perms[keep]
+        perms[:, i] = j[keep]
+        if len(ts) == 0:
+            break
+
+    # discards operations that do not map the atoms one to one
+    keep = np.array([len(np.unique(perm)) == natoms for perm in perms], bool)
+    return ts[keep], perms[keep]
+
+
+def find_symmetry(q, h, names, tol=1e-3):
+    """Finds the space group operations of a periodic system.
+
+    Args:
+       q: An array of shape (3*natoms) giving the atomic positions.
+       h: The cell matrix, with the lattice vectors as columns.
+       names: The names of the atoms. Only atoms with the same name are
+          considered equivalent.
+       tol: The maximum displacement of an atom, in atomic units, for it to
+          be considered to be mapped onto another atom.
+
+    Returns:
+       A list of tuples (R, perm), with R the Cartesian rotation matrix of the
+       operation and perm an array such that atom i is mapped onto atom
+       perm[i]. The identity is always the first operation.
+    """
+
+    natoms = len(q) / 3
+    ih = np.linalg.inv(h)
+    s = np.dot(q.reshape((natoms, 3)), ih.T)
+    s -= np.floor(s)
+    names = np.asarray(names)
+    other = names[:, np.newaxis] != names[np.newaxis, :]
+
+    # the pure translations, e.g. by the lattice vectors of the primitive cell of a supercell
+    same = np.where(~other[0])[0]
+    tts, tperms = _match_atoms(s, s[same] - s[0], s, h, other, tol)
+
+    # the candidate translations map the first atom onto one of the atoms
+    # of the same species, taking one atom for each set of atoms related by
+    # a pure translation
+    targets = []
+    seen = np.zeros(natoms, bool)
+    for j in same:
+        if not seen[j]:
+            targets.append(j)
+            seen[tperms[:, j]] = True
+
+    ops = []
+    for w in _lattice_operations(h, tol):
+        sw = np.dot(s, w.T)
+        ts, perms = _match_atoms(sw, s[targets] - sw[0], s, h, other, tol)
+        if len(ts) == 0:
+            continue
+
+        # all the other operations with the same rotation are obtained by
+        # combining this one with the pure translations
+        r = np.dot(h, np.dot(w, ih))
+        for tperm in tperms:
+            ops.append((r, tperm[perms[0]]))
+
+    # puts the identity first
+    ops.sort(key=lambda op: not (np.allclose(op[0], np.eye(3)) and np.all(op[1] == np.arange(natoms))))
+    return ops
+
+
+def irreducible_displacements(ops, natoms, tol=1e-6):
+    """Finds a minimal set of atomic displacements that determine the force constants.
+
+    Only one atom is displaced in each orbit of symmetry-equivalent atoms,
+    and only along directions that are not related by the operations that
+    leave that atom in place.
+
+    Args:
+       ops: The list of symmetry operations, as returned by find_symmetry.
+       natoms: The number of atoms.
+       tol: The tolerance used to decide whether a direction is linearly
+          independent from the ones chosen already.
+
+    Returns:
+       A list of tuples (atom, u), with u a unit vector giving the direction
+       of the displacement.
+    """
+
+    disps = []
+    done = np.zeros(natoms, bool)
+    for a in xrange(natoms):
+        if done[a]:
+            continue
+        for r, perm in ops:
+            done[perm[a]] = True
+
+        # adds Cartesian directions until they span space, together with
+        # their images through the operations that leave the atom in place
+        site = [r for r, perm in ops if perm[a] == a]
+        images = np.zeros((0, 3), float)
+        rank = 0
+        for u in np.eye(3):
+            trial = np.vstack([images] + [np.dot(r, u) for r in site])
+            trank = np.linalg.matrix_rank(trial, tol)
+            if trank > rank:
+                disps.append((a, u))
+                images = trial
+                rank = trank
+            if rank == 3:
+                break
+    return disps
+
+
+def rebuild_force_constants(ops, natoms, disps, rows):
+    """Builds the full force constant matrix from the irreducible displacements.
+
+    Args:
+       ops: The list of symmetry operations, as returned by find_symmetry.
+       natoms: The number of atoms.
+       disps: The list of displacements, as returned by irreducible_displacements.
+       rows: An array of shape (len(disps), 3*natoms), giving for each
+          displacement the derivative of the (negative) forces along the
+          displacement direction.
+
+    Returns:
+       The force constant matrix, of shape (3*natoms, 3*natoms).
+    """
+
+    fc = np.zeros((natoms, 3, natoms, 3), float)
+    done = np.zeros(natoms, bool)
+    reps = sorted(set(a for a, u in disps))
+    for a in reps:
+        # the rows obtained from the computed ones through the operations leaving a in place
+        us = []
+        rs = []
+        for (b, u), row in zip(disps, rows):
+            if b != a:
+                continue
+            row = row.reshape((natoms, 3))
+            for r, perm in ops:
+                if perm[a] != a:
+                    continue
+                rrow = np.zeros((natoms, 3), float)
+                rrow[perm] = np.dot(row, r.T)
+                us.append(np.dot(r, u))
+                rs.append(rrow.flatten())
+        fca = np.linalg.lstsq(np.asarray(us), np.asarray(rs), rcond=-1)[0].reshape((3, natoms, 3))
+
+        # the blocks of the equivalent atoms
+        for r, perm in ops:
+            c = perm[a]
+            if done[c]:
+                continue
+            fc[c][:, perm, :] = np.einsum("ij,jbk,lk->ibl", r, fca, r)
+            done[c] = True
+
+    return fc.reshape((3 * natoms, 3 * natoms))
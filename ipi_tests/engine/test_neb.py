@@ -0,0 +1,52 @@
+#!/usr/bin/env python2
+
+import numpy as np
+import numpy.testing as npt
+
+from ipi.engine.motion.neb import neb_tangents, spring_constants, neb_forces
+
+
+def straight_band(nimg, spacing):
+    """Images along the x axis of a single atom, with the energy of a
+    barrier that peaks at the middle image."""
+
+    x = np.cumsum(np.concatenate([[0.0], spacing]))
+    bq = np.zeros((nimg, 3))
+    bq[:, 0] = x
+    be = -(x - x[nimg / 2]) ** 2
+    return bq, be
+
+
+def test_neb_tangents():
+    """Tangents are unit vectors along the band, and zero at the ends."""
+
+    bq, be = straight_band(5, [1.0, 1.0, 1.0, 1.0])
+    btau = neb_tangents(bq, be)
+    npt.assert_almost_equal(btau[1:-1], np.tile([1.0, 0.0, 0.0], (3, 1)))
+    npt.assert_equal(btau[[0, -1]], 0.0)
+
+
+def test_neb_forces_springs():
+    """Springs only act along the band, and pull towards equal spacing."""
+
+    bq, be = straight_band(5, [1.0, 2.0, 1.0, 1.0])
+    bf = np.zeros(bq.shape)
+    bf[:, 1] = 0.3
+    kappa = spring_constants(be, {"varsprings": False, "kappa": 0.5, "kappamax": 1.5, "kappamin": 0.5})
+    nebf, imax = neb_forces(bq, bf, be, kappa)
+    assert imax is None
+    npt.assert_almost_equal(nebf[:, 1], 0.3)
+    npt.assert_almost_equal(nebf[1:-1, 0], [0.5, -0.5, 0.0])
+
+
+def test_neb_forces_climb():
+    """The climbing image feels the physical force, with the component
+    along the band inverted, and no spring force."""
+
+    bq, be = straight_band(5, [1.0, 2.0, 1.0, 1.0])
+    bf = np.array([[0.0, 0.0, 0.0]] * 2 + [[-0.2, 0.1, 0.0]] + [[0.0, 0.0, 0.0]] * 2)
+    kappa = spring_constants(be, {"varsprings": True, "kappa": 1.0, "kappamax": 1.5, "kappamin": 0.5})
+    assert kappa.max() <= 1.5 and kappa.min() >= 0.5
+    nebf, imax = neb_forces(bq, bf, be, kappa, climb=True)
+    assert imax == 2
+    npt.assert_almost_equal(nebf[2], [0.2, 0.1, 0.0])
@@ -0,0 +1,45 @@
+#!/usr/bin/env python2
+
+import numpy as np
+import numpy.testing as npt
+
+from ipi.utils.inputvalue import Input, InputArray, InputValue
+from ipi.utils.io.inputs.io_binary import binary_write, binary_file, is_binary
+
+
+class InputTestArrays(Input):
+
+    fields = {"big": (InputArray, {"dtype": float, "default": np.zeros(0, float)}),
+              "small": (InputArray, {"dtype": float, "default": np.zeros(0, float)}),
+              "state": (InputArray, {"dtype": np.uint, "default": np.zeros(0, np.uint)}),
+              "step": (InputValue, {"dtype": int, "default": 0})}
+
+
+def test_binary_roundtrip(tmpdir):
+
+    big = np.random.rand(40, 3)
+    small = np.array([0.5, -2.0])
+    state = np.arange(624, dtype=np.uint)
+
+    winput = InputTestArrays()
+    winput.big.store(big)
+    winput.small.store(small)
+    winput.state.store(state)
+    winput.step.store(12)
+
+    fname = str(tmpdir.join("test.chk"))
+    with open(fname, "wb") as stream:
+        binary_write(stream, winput, name="test")
+
+    assert is_binary(fname)
+
+    bfile = binary_file(fname)
+    assert len(bfile.index) == 2    # the small array is kept in the xml text
+    rinput = InputTestArrays()
+    with bfile:
+        rinput.parse(bfile.xml.fields[0][1])
+
+    npt.assert_array_equal(rinput.big.fetch(), big)
+    npt.assert_array_equal(rinput.small.fetch(), small)
+    npt.assert_array_equal(rinput.state.fetch(), state)
+    assert rinput.step.fetch() == 12
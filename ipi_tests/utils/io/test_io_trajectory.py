@@ -0,0 +1,52 @@
+#!/usr/bin/env python2
+
+import pytest
+
+import numpy.testing as npt
+
+from ipi.utils.io.io_trajectory import TrajectoryReader
+from ipi.utils.units import unit_to_internal
+
+
+def write_trajectory(fname, nframes):
+    """Writes an XYZ trajectory of two atoms, in which the x coordinate of
+    the first atom gives the index of the frame."""
+
+    with open(fname, "w") as f:
+        for i in xrange(nframes):
+            f.write("2\n# CELL(abcABC): %d 10.0 10.0 90.0 90.0 90.0 positions{angstrom} cell{angstrom}\n" % (10 + i))
+            f.write("H %d 0.0 0.0\nO 0.0 1.0 %d\n" % (i, i))
+
+
+@pytest.mark.parametrize("prefetch", [0, 3])
+def test_trajectory_reader(tmpdir, prefetch):
+    """Groups are read in any order, with or without prefetching."""
+
+    fname = str(tmpdir.join("traj.xyz"))
+    write_trajectory(fname, 21)
+    angstrom = unit_to_internal("length", "angstrom", 1.0)
+
+    reader = TrajectoryReader(fname, "xyz", group=2, stride=1, prefetch=prefetch)
+    assert len(reader.offsets) == 21
+    assert reader.ngroups == 10
+    for igroup in [0, 1, 2, 3, 7, 8, 4, 5, 9]:
+        q, h = reader.read(igroup)
+        npt.assert_almost_equal(q[:, 0] / angstrom, [2 * igroup, 2 * igroup + 1])
+        npt.assert_almost_equal(h[0, 0] / angstrom, 11 + 2 * igroup)
+    with pytest.raises(EOFError):
+        reader.read(10)
+    reader.close()
+
+
+def test_trajectory_reader_stride(tmpdir):
+    """With a stride, the groups in between are skipped."""
+
+    fname = str(tmpdir.join("traj.xyz"))
+    write_trajectory(fname, 21)
+    angstrom = unit_to_internal("length", "angstrom", 1.0)
+
+    reader = TrajectoryReader(fname, "xyz", group=2, stride=3, prefetch=2)
+    assert reader.ngroups == 4
+    firsts = [reader.read(i)[0][0, 0] / angstrom for i in xrange(reader.ngroups)]
+    npt.assert_almost_equal(firsts, [0, 6, 12, 18])
+    reader.close()
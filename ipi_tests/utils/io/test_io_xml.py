@@ -0,0 +1,53 @@
+#!/usr/bin/env python2
+
+from StringIO import StringIO
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from ipi.utils.io.inputs.io_xml import read_array, write_array, xml_parse_file
+
+
+def test_array_roundtrip():
+
+    values = np.random.randn(103) * 10.0**np.random.randint(-200, 200, 103)
+    text = "[ " + write_array(float, values, 5, "\n   ") + " ]"
+    npt.assert_array_equal(read_array(float, text), values)
+
+    ivalues = np.arange(-10, 10)
+    npt.assert_array_equal(read_array(int, "[ " + write_array(int, ivalues, 5, "\n") + " ]"), ivalues)
+
+    assert len(read_array(float, "[ ]")) == 0
+
+
+def test_array_bad_element():
+
+    with pytest.raises(ValueError):
+        read_array(float, "[ 1.0, abc, 3.0 ]")
+
+
+def test_parse_lowmem():
+
+    values = np.random.rand(400, 3)
+    names = ["H"] * 1200
+    text = "<system><q shape='(400, 3)'> [ " + write_array(float, values, 5, "\n") + " ] </q>" + \
+        "<names shape='(1200)'> [ " + ", ".join(names) + " ] </names></system>"
+
+    xml = xml_parse_file(StringIO(text), lowmem=True)
+    fields = dict(xml.fields[0][1].fields)
+
+    q = dict(fields["q"].fields)["_text"]
+    assert isinstance(q, np.ndarray)
+    npt.assert_array_equal(read_array(float, q), values.flatten())
+    assert list(read_array(str, dict(fields["names"].fields)["_text"])) == names
+
+
+def test_parse_lowmem_large_integers():
+
+    values = np.arange(1200, dtype=np.int64) + 2**60 + 1
+    text = "<state shape='(1200)'> [ " + ", ".join([str(v) for v in values]) + " ] </state>"
+
+    xml = xml_parse_file(StringIO(text), lowmem=True)
+    state = dict(xml.fields[0][1].fields)["_text"]
+    npt.assert_array_equal(read_array(np.int64, state), values)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python2
+
+import numpy as np
+import numpy.testing as npt
+
+from ipi.utils.mintools import min_brent, min_parallel, min_approx, min_approx_parallel, FIRE
+from ipi.utils.mintools import hessian_exp, hessian_lindh
+
+
+class BatchFunction(object):
+    """A function that can be evaluated at several points at once, and
+    remembers the last point that was evaluated or selected."""
+
+    def __init__(self, fdf):
+        self.fdf = fdf
+        self.x = None
+        self.ncalls = 0
+        self.nrounds = 0
+
+    def __call__(self, x):
+        self.x = x
+        self.ncalls += 1
+        self.nrounds += 1
+        return self.fdf(x)
+
+    def batch(self, xs):
+        self.x = xs[-1]
+        self.ncalls += len(xs)
+        self.nrounds += 1
+        return [self.fdf(x) for x in xs]
+
+
+def quartic(x):
+    """An anharmonic function with its minimum at 0.37."""
+
+    return (x - 0.37) ** 2 + 0.3 * (x - 0.37) ** 4, 2.0 * (x - 0.37) + 1.2 * (x - 0.37) ** 3
+
+
+def test_min_parallel():
+    """Parallel line search finds the same minimum as min_brent, in fewer rounds."""
+
+    serial = BatchFunction(quartic)
+    min_brent(serial, quartic(0.0), 0.0, 1e-7, 100, 1e-3)
+    for npoints in [1, 2, 4, 8]:
+        parallel = BatchFunction(quartic)
+        min_parallel(parallel, quartic(0.0), 0.0, 1e-7, 100, 1e-3, npoints)
+        npt.assert_almost_equal(parallel.x, 0.37, decimal=6)
+        if npoints >= 4:
+            assert parallel.nrounds < serial.nrounds
+
+
+def test_min_parallel_backwards():
+    """Parallel line search goes downhill when the minimum is at negative x."""
+
+    fdf = lambda x: ((x + 2.0) ** 2, 2.0 * (x + 2.0))
+    parallel = BatchFunction(fdf)
+    min_parallel(parallel, fdf(0.0), 0.0, 1e-7, 100, 1e-3, 4)
+    npt.assert_almost_equal(parallel.x, -2.0, decimal=6)
+
+
+def test_min_approx_parallel():
+    """Parallel backtracking gives a sufficient decrease, like min_approx."""
+
+    a = np.diag([1.0, 10.0, 100.0])
+    fdf = lambda x: (0.5 * np.dot(x, np.dot(a, x)), np.dot(a, x))
+    x0 = np.ones(3)
+    f0, g0 = fdf(x0)
+    d0 = -g0 * 0.1
+
+    serial = BatchFunction(fdf)
+    x, fx, dfx = min_approx(serial, x0, (f0, g0), d0, 100.0, 1e-10, 100)
+    parallel = BatchFunction(fdf)
+    px, pfx, pdfx = min_approx_parallel(parallel, x0, (f0, g0), d0, 100.0, 1e-10, 100, 4)
+    assert fx < f0 and pfx < f0
+    assert parallel.nrounds <= serial.nrounds
+    npt.assert_array_equal(parallel.x, px)
+
+
+def test_fire():
+    """FIRE relaxes a stiff harmonic system, with one force evaluation per step."""
+
+    k = np.array([0.01, 0.1, 0.5, 0.05, 0.2, 0.3])
+    m = np.ones(6) * 1837.0
+    x = np.ones(6)
+    v = np.zeros(6)
+    options = {"dt": 10.0, "dtmax": 100.0, "alpha": 0.1, "nsteps": 0, "maxstep": 0.5}
+    for i in range(500):
+        x = FIRE(x, -k * x, v, m, options)
+    npt.assert_almost_equal(x, np.zeros(6), decimal=6)
+    assert options["dt"] <= options["dtmax"]
+
+
+def test_model_hessians():
+    """The model Hessians are symmetric, positive definite, and only
+    stabilized along the translations."""
+
+    x = np.array([[0.0, 0.0, 0.0], [2.1, 0.0, 0.0], [-0.7, 2.0, 0.0], [-0.7, -1.0, 1.7]]).flatten()
+    h = np.eye(3) * 20.0
+    names = ["C", "H", "H", "O"]
+    t = np.tile([1.0, 0.0, 0.0], 4)
+    for hessian in [hessian_exp(x, h, stab=0.0), hessian_lindh(x, h, names, stab=0.0)]:
+        npt.assert_almost_equal(hessian, hessian.T)
+        npt.assert_almost_equal(np.dot(hessian, t), np.zeros(12))
+    for hessian in [hessian_exp(x, h), hessian_lindh(x, h, names)]:
+        assert np.linalg.eigvalsh(hessian).min() > 0.0
+
+
+def test_min_brent_downhill():
+    """A steepest descent line search, started with the derivative of the
+    energy along the direction of the forces, moves downhill even when the
+    initial step overshoots the minimum."""
+
+    qmin = np.array([0.1, -0.2, 0.2])
+    q0 = np.zeros(3)
+    f0 = -(q0 - qmin)
+    d = f0 / np.sqrt(np.dot(f0, f0))
+    xmin = np.dot(qmin - q0, d)
+
+    def line(x):
+        q = q0 + x * d
+        return 0.5 * np.dot(q - qmin, q - qmin), np.dot(q - qmin, d)
+
+    fdf = BatchFunction(line)
+    min_brent(fdf, (line(0.0)[0], -np.dot(f0, d)), 0.0, 1e-8, 5, 1.0)
+    assert abs(fdf.x - xmin) < 0.1 * xmin
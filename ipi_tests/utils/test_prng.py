@@ -0,0 +1,75 @@
+#!/usr/bin/env python2
+
+import threading
+
+import numpy as np
+import numpy.testing as npt
+
+from ipi.utils.prng import Random
+
+
+def draw(prng):
+    values = []
+    for i in range(20):
+        values.append(prng.gvec((5, 3)).flatten())
+        if i % 3 == 0:
+            values.append([prng.u, prng.g])
+    return np.concatenate(values)
+
+
+def test_prefetch_sequence():
+
+    npt.assert_array_equal(draw(Random(seed=42)), draw(Random(seed=42, prefetch=16)))
+
+
+def test_prefetch_state():
+
+    prng = Random(seed=42, prefetch=16)
+    prng.gvec(21)
+    state = prng.state
+
+    npt.assert_array_equal(Random(state=state).gvec(50), prng.gvec(50))
+
+
+def test_streams():
+
+    prng = Random(seed=42, split=True)
+    a = prng.stream("system0").gvec(10)
+    b = prng.stream("system1").gvec(10)
+
+    other = Random(seed=42, split=True)
+    npt.assert_array_equal(other.stream("system1").gvec(10), b)
+    npt.assert_array_equal(other.stream("system0").gvec(10), a)
+    assert not np.all(a == b)
+
+    single = Random(seed=42)
+    assert single.stream("system0") is single
+    assert len(prng.all_streams()) == 3
+
+
+def test_lazy_state():
+
+    prng = Random(seed=42, prefetch=16)
+    prng.gvec(21)
+    lazy = prng.lazy_state()
+    assert lazy[1] == 5
+    npt.assert_array_equal(Random.expand_state(lazy)[1], prng.state[1])
+    npt.assert_array_equal(Random(state=Random.expand_state(lazy)).gvec(50), prng.gvec(50))
+
+
+def test_prefetch_threads():
+
+    prng = Random(seed=1, prefetch=64)
+    values = [None, None]
+
+    def draw_thread(i):
+        values[i] = np.concatenate([prng.gvec(3) for j in range(2000)])
+
+    threads = [threading.Thread(target=draw_thread, args=(i,)) for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # the threads share the sequence, without using any number twice
+    npt.assert_array_equal(np.sort(np.concatenate(values)), np.sort(Random(seed=1).gvec(12000)))
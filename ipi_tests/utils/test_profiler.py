@@ -0,0 +1,34 @@
+#!/usr/bin/env python2
+
+import time
+import pstats
+
+from ipi.utils.profiler import Profiler
+
+
+def busy(duration):
+    tstart = time.time()
+    while time.time() - tstart < duration:
+        sum(range(100))
+
+
+def test_profiler_window(tmpdir):
+
+    fname = str(tmpdir.join("profile"))
+    profiler = Profiler(mode="pstats", filename=fname, start=1, steps=2, interval=0.001)
+    for istep in range(4):
+        profiler.step(istep)
+        busy(0.05)
+    profiler.finish()
+
+    assert profiler.nsamples > 0
+    assert "MainThread" in [key[0] for key in profiler.samples]
+    stats = pstats.Stats(fname).stats
+    assert "busy" in [key[2] for key in stats]
+    nsamples = profiler.nsamples
+
+    # sampling does not restart once the window is over
+    profiler.step(1)
+    busy(0.01)
+    profiler.finish()
+    assert profiler.nsamples == nsamples
@@ -0,0 +1,59 @@
+#!/usr/bin/env python2
+
+import numpy as np
+import numpy.testing as npt
+
+from ipi.utils.symmetry import find_symmetry, irreducible_displacements, rebuild_force_constants
+
+
+def rocksalt(a, n):
+    """Returns the positions, names and cell of a rocksalt supercell."""
+
+    fcc = np.array([[0.0, 0.0, 0.0], [0.0, 0.5, 0.5], [0.5, 0.0, 0.5], [0.5, 0.5, 0.0]])
+    pos = []
+    names = []
+    for cell in np.ndindex(n, n, n):
+        for b in fcc:
+            pos.append((cell + b) * a)
+            names.append("Na")
+            pos.append((cell + b + [0.5, 0.0, 0.0]) * a)
+            names.append("Cl")
+    return np.array(pos).flatten(), names, np.eye(3) * n * a
+
+
+def pair_forces(q, names, box, rcut):
+    """Forces from a short-ranged, species-dependent pair potential."""
+
+    natoms = len(names)
+    x = q.reshape((natoms, 3))
+    k = np.where(np.asarray(names)[:, np.newaxis] == np.asarray(names)[np.newaxis, :], 1.0, 2.3)
+    d = x[:, np.newaxis, :] - x[np.newaxis, :, :]
+    d -= np.round(d / box) * box
+    r = np.sqrt((d**2).sum(axis=2))
+    np.fill_diagonal(r, 1e10)
+    de = k * np.exp(-r / 3.0) * (-1.0 / (3.0 * r) - 1.0 / r**2) * (r < rcut)
+    return -((de / r)[:, :, np.newaxis] * d).sum(axis=1).flatten()
+
+
+def test_rebuild_force_constants():
+
+    a = 7.0
+    q, names, h = rocksalt(a, 2)
+    natoms = len(names)
+    delta = 1e-4
+
+    def row(atom, u):
+        dev = np.zeros(3 * natoms)
+        dev[3 * atom:3 * atom + 3] = u * delta
+        return -(pair_forces(q + dev, names, 2 * a, 0.9 * a) - pair_forces(q - dev, names, 2 * a, 0.9 * a)) / (2 * delta)
+
+    ops = find_symmetry(q, h, names)
+    assert len(ops) == 48 * 32
+    npt.assert_array_equal(ops[0][1], np.arange(natoms))
+
+    disps = irreducible_displacements(ops, natoms)
+    assert len(disps) == 2
+
+    full = np.array([row(k / 3, np.eye(3)[k % 3]) for k in range(3 * natoms)])
+    fc = rebuild_force_constants(ops, natoms, disps, np.array([row(atom, u) for atom, u in disps]))
+    npt.assert_allclose(fc, full, atol=1e-10)